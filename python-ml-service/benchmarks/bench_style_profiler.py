@@ -0,0 +1,258 @@
+"""
+StyleProfiler benchmark
+Times every stage of create_profile and update_profile on synthetic VLT
+portfolios, measures peak Python heap use and writes the results as JSON so
+runs from different commits can be compared. Stage names and times are the
+ones StyleProfiler reports on /metrics (style_profile_stage_seconds).
+
+Usage (from python-ml-service/):
+    python -m benchmarks.bench_style_profiler
+    python -m benchmarks.bench_style_profiler --sizes 100,1000 --repeat 5
+    python -m benchmarks.bench_style_profiler --compare benchmarks/results/<baseline>.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from benchmarks.synthetic_vlt import generate_vlt_records
+from services.metrics import stage_totals
+from services.style_profiler import StyleProfiler
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SIZES = [100, 1000, 10000, 100000]
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+
+def run_once(
+    records: List[Dict[str, Any]],
+    update_records: List[Dict[str, Any]],
+    options: Dict[str, Any],
+    trace_memory: bool = False
+) -> Dict[str, Dict[str, Any]]:
+    """
+    One create_profile followed by one update_profile in a fresh models dir
+
+    Caches are dropped before the update, so it includes loading the
+    profile from the store as a later request would. Stage times are the
+    growth of the profiler's style_profile_stage_seconds sums over the
+    call; time outside any stage is reported as 'other'.
+    """
+    user_id = 'bench-user'
+    results = {}
+
+    with tempfile.TemporaryDirectory(prefix='style-bench-') as models_dir:
+        profiler = StyleProfiler(models_dir=models_dir)
+
+        operations = [
+            ('create', lambda: profiler.create_profile(user_id, records, **options)),
+            ('update', lambda: profiler.update_profile(user_id, update_records)),
+        ]
+
+        for operation, call in operations:
+            if operation == 'update':
+                profiler.invalidate(user_id)
+            before = stage_totals(operation)
+
+            if trace_memory:
+                tracemalloc.start()
+            started = time.perf_counter()
+            call()
+            total = time.perf_counter() - started
+            peak = None
+            if trace_memory:
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+
+            stages = {name: seconds - before.get(name, 0.0) for name, seconds in stage_totals(operation).items()}
+            stages = {name: seconds for name, seconds in stages.items() if seconds > 0}
+            stages['other'] = max(0.0, total - sum(stages.values()))
+            results[operation] = {'total': total, 'stages': stages, 'peak_bytes': peak}
+
+        if profiler._importance_executor is not None:
+            profiler._importance_executor.shutdown(wait=True)
+
+    return results
+
+
+def benchmark_size(
+    n_records: int,
+    repeat: int,
+    options: Dict[str, Any],
+    update_fraction: float,
+    seed: int,
+    embedding_dim: Optional[int],
+    measure_memory: bool
+) -> List[Dict[str, Any]]:
+    """Median timings (and peak memory from a separate traced run) for one portfolio size"""
+    n_update = max(1, int(n_records * update_fraction))
+    portfolio = generate_vlt_records(n_records + n_update, seed=seed, embedding_dim=embedding_dim)
+    records, update_records = portfolio[:n_records], portfolio[n_records:]
+
+    runs = [run_once(records, update_records, options) for _ in range(repeat)]
+    # tracemalloc slows allocation-heavy code, so memory gets its own run
+    traced = run_once(records, update_records, options, trace_memory=True) if measure_memory else None
+
+    summaries = []
+    for operation in ('create', 'update'):
+        operation_runs = [run[operation] for run in runs]
+        stage_names = sorted({name for run in operation_runs for name in run['stages']})
+        totals = [run['total'] for run in operation_runs]
+
+        summaries.append({
+            'operation': operation,
+            'n_records': n_records if operation == 'create' else n_update,
+            'portfolio_size': n_records,
+            'total_seconds': {
+                'median': statistics.median(totals),
+                'min': min(totals),
+                'max': max(totals),
+            },
+            'stages_seconds': {
+                name: statistics.median(run['stages'].get(name, 0.0) for run in operation_runs)
+                for name in stage_names
+            },
+            'peak_memory_mb': None if traced is None else traced[operation]['peak_bytes'] / (1024 * 1024),
+        })
+
+    return summaries
+
+
+def environment() -> Dict[str, Any]:
+    """Commit and library versions the results were measured with"""
+    import scipy
+    import sklearn
+
+    def _git(*args):
+        try:
+            return subprocess.run(
+                ['git', *args], capture_output=True, text=True, check=True,
+                cwd=os.path.dirname(os.path.abspath(__file__))
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    return {
+        'git_commit': _git('rev-parse', 'HEAD'),
+        'git_dirty': bool(_git('status', '--porcelain', '--untracked-files=no')),
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'scipy': scipy.__version__,
+        'sklearn': sklearn.__version__,
+    }
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    """Report lines of median total time against a baseline results file"""
+    baseline_totals = {
+        (entry['operation'], entry['portfolio_size']): entry['total_seconds']['median']
+        for entry in baseline['results']
+    }
+    lines = [f"Compared with {baseline['environment'].get('git_commit') or 'unknown commit'}"]
+    for entry in results['results']:
+        key = (entry['operation'], entry['portfolio_size'])
+        current = entry['total_seconds']['median']
+        if key not in baseline_totals:
+            lines.append(f"  {key[0]:<6} n={key[1]:<7} {current:9.4f}s  (no baseline)")
+            continue
+        ratio = current / baseline_totals[key] if baseline_totals[key] else float('inf')
+        lines.append(f"  {key[0]:<6} n={key[1]:<7} {current:9.4f}s  vs {baseline_totals[key]:9.4f}s  x{ratio:.2f}")
+    return lines
+
+
+def format_entry(entry: Dict[str, Any]) -> str:
+    stages = sorted(entry['stages_seconds'].items(), key=lambda item: item[1], reverse=True)
+    memory = '' if entry['peak_memory_mb'] is None else f"  peak {entry['peak_memory_mb']:.1f} MB"
+    top = ', '.join(f"{name} {seconds:.4f}s" for name, seconds in stages[:4])
+    return (
+        f"{entry['operation']:<6} portfolio={entry['portfolio_size']:<7} records={entry['n_records']:<7} "
+        f"{entry['total_seconds']['median']:.4f}s{memory}  [{top}]"
+    )
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                        help='Comma-separated portfolio sizes')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per size (median is reported)')
+    parser.add_argument('--update-fraction', type=float, default=0.1,
+                        help='update_profile batch size as a fraction of the portfolio')
+    parser.add_argument('--n-clusters', default='5', help="Cluster count, or 'auto'")
+    parser.add_argument('--importance-mode', default='mutual_info',
+                        choices=['mutual_info', 'centroid', 'forest', 'deferred'])
+    parser.add_argument('--feature-mode', default='categorical', choices=['categorical', 'hybrid'])
+    parser.add_argument('--embedding-dim', type=int, default=64, help='Embedding size in hybrid mode')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', action='store_true', help='Skip the tracemalloc run')
+    parser.add_argument('--output', help='Results file (default: benchmarks/results/<commit>-<time>.json)')
+    parser.add_argument('--compare', help='Baseline results file to compare against')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format='%(message)s')
+    logger.setLevel(logging.INFO)
+
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+    options = {
+        'n_clusters': args.n_clusters if args.n_clusters == 'auto' else int(args.n_clusters),
+        'importance_mode': args.importance_mode,
+        'feature_mode': args.feature_mode,
+    }
+    embedding_dim = args.embedding_dim if args.feature_mode == 'hybrid' else None
+
+    # Keep one-off import and first-fit costs out of the first measured size
+    run_once(generate_vlt_records(50, seed=args.seed, embedding_dim=embedding_dim),
+             generate_vlt_records(5, seed=args.seed + 1, embedding_dim=embedding_dim), options)
+
+    entries = []
+    for n_records in sizes:
+        for entry in benchmark_size(
+            n_records, args.repeat, options, args.update_fraction, args.seed, embedding_dim, not args.no_memory
+        ):
+            logger.info(format_entry(entry))
+            entries.append(entry)
+
+    results = {
+        'benchmark': 'style_profiler',
+        'environment': environment(),
+        'config': {**options, 'sizes': sizes, 'repeat': args.repeat, 'update_fraction': args.update_fraction,
+                   'seed': args.seed, 'embedding_dim': embedding_dim},
+        'results': entries,
+    }
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        commit = (results['environment']['git_commit'] or 'nogit')[:10]
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        output = os.path.join(RESULTS_DIR, f"style_profiler-{commit}-{stamp}.json")
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    logger.info(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            for line in compare(results, json.load(f)):
+                logger.info(line)
+
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+"""
+Synthetic VLT portfolio generator
+Produces records shaped like the Stage 1 VLT output, drawn from a few latent
+style archetypes so clustering has real structure to find. Generation is
+seeded and deterministic.
+"""
+import base64
+import numpy as np
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+GARMENT_TYPES = ['dress', 'top', 'blouse', 'shirt', 'pants', 'skirt', 'jacket', 'coat', 'knitwear', 'jumpsuit']
+
+# Garment types VLT reports without neckline and sleeve length
+_NO_NECKLINE_OR_SLEEVES = {'pants', 'skirt'}
+
+ATTRIBUTE_VOCABULARY = {
+    'silhouette': ['tailored', 'structured', 'fitted', 'a-line', 'fluid', 'flowing', 'draped', 'relaxed',
+                   'oversized', 'boxy', 'straight', 'wrap', 'asymmetric', 'deconstructed', 'bodycon'],
+    'neckline': ['crew', 'v-neck', 'scoop', 'boat', 'square', 'halter', 'cowl', 'turtleneck', 'collared',
+                 'off-shoulder', 'sweetheart', 'mock-neck'],
+    'sleeveLength': ['sleeveless', 'cap', 'short', 'elbow', 'three-quarter', 'long'],
+    'length': ['cropped', 'mini', 'knee', 'midi', 'ankle', 'maxi', 'full-length'],
+    'waistline': ['natural', 'high', 'empire', 'dropped', 'low', 'elasticated'],
+    'fabrication': ['wool', 'suiting', 'cotton', 'denim', 'silk', 'charmeuse', 'chiffon', 'satin', 'linen',
+                    'jersey', 'knit', 'cashmere', 'leather', 'lace', 'velvet', 'technical', 'tweed', 'poplin'],
+    'pattern': ['solid', 'stripe', 'check', 'floral', 'abstract', 'animal', 'polka-dot', 'geometric'],
+}
+
+COLOR_VOCABULARY = ['black', 'white', 'ivory', 'navy', 'grey', 'charcoal', 'camel', 'beige', 'brown', 'red',
+                    'burgundy', 'pink', 'blush', 'olive', 'green', 'sage', 'blue', 'sky', 'mustard', 'orange',
+                    'lilac', 'purple', 'teal', 'silver', 'gold']
+FINISH_VOCABULARY = ['matte', 'glossy', 'satin', 'metallic', 'textured', 'sheer']
+
+STYLE_VOCABULARY = {
+    'overall': ['minimalist', 'classic', 'romantic', 'edgy', 'bohemian', 'sporty', 'evening', 'business',
+                'casual', 'avant-garde', 'preppy', 'streetwear'],
+    'formality': ['casual', 'smart-casual', 'business', 'semi-formal', 'formal', 'black-tie'],
+    'aesthetic': ['clean', 'minimalist', 'elegant', 'sophisticated', 'romantic', 'feminine', 'bohemian',
+                  'edgy', 'experimental', 'sporty', 'athletic', 'modern', 'urban', 'refined', 'classic'],
+    'mood': ['calm', 'confident', 'playful', 'bold', 'soft', 'dramatic', 'relaxed', 'polished'],
+}
+
+DETAILS = ['pockets', 'buttons', 'zip', 'pleats', 'belt', 'ruffles', 'slit', 'darts', 'topstitching', 'drawstring']
+
+# Latent portfolio modes: preferred values per field
+ARCHETYPES = [
+    {
+        'silhouette': ['tailored', 'structured', 'straight'], 'fabrication': ['wool', 'suiting', 'poplin'],
+        'color': ['black', 'navy', 'charcoal', 'white'], 'overall': ['minimalist', 'business'],
+        'formality': ['business', 'formal'], 'aesthetic': ['clean', 'minimalist', 'refined'],
+        'mood': ['polished', 'confident'], 'garment_type': ['jacket', 'pants', 'shirt', 'coat'],
+    },
+    {
+        'silhouette': ['fluid', 'flowing', 'draped', 'a-line'], 'fabrication': ['silk', 'charmeuse', 'satin'],
+        'color': ['black', 'burgundy', 'ivory', 'gold'], 'overall': ['evening', 'romantic'],
+        'formality': ['formal', 'black-tie', 'semi-formal'], 'aesthetic': ['elegant', 'sophisticated'],
+        'mood': ['dramatic', 'soft'], 'garment_type': ['dress', 'skirt', 'blouse', 'jumpsuit'],
+    },
+    {
+        'silhouette': ['asymmetric', 'deconstructed', 'oversized'], 'fabrication': ['technical', 'leather', 'denim'],
+        'color': ['black', 'silver', 'grey'], 'overall': ['edgy', 'avant-garde', 'streetwear'],
+        'formality': ['casual', 'smart-casual'], 'aesthetic': ['edgy', 'experimental', 'urban'],
+        'mood': ['bold', 'dramatic'], 'garment_type': ['jacket', 'top', 'pants', 'coat'],
+    },
+    {
+        'silhouette': ['relaxed', 'oversized', 'boxy'], 'fabrication': ['jersey', 'knit', 'cotton'],
+        'color': ['grey', 'white', 'sky', 'sage', 'navy'], 'overall': ['sporty', 'casual', 'streetwear'],
+        'formality': ['casual'], 'aesthetic': ['sporty', 'athletic', 'modern'],
+        'mood': ['relaxed', 'playful'], 'garment_type': ['top', 'knitwear', 'pants'],
+    },
+    {
+        'silhouette': ['wrap', 'a-line', 'flowing'], 'fabrication': ['chiffon', 'lace', 'linen', 'cotton'],
+        'color': ['blush', 'ivory', 'lilac', 'mustard', 'sage'], 'overall': ['bohemian', 'romantic'],
+        'formality': ['casual', 'smart-casual'], 'aesthetic': ['bohemian', 'romantic', 'feminine'],
+        'mood': ['soft', 'playful', 'calm'], 'garment_type': ['dress', 'blouse', 'skirt'],
+    },
+    {
+        'silhouette': ['fitted', 'straight', 'tailored'], 'fabrication': ['cashmere', 'tweed', 'wool', 'cotton'],
+        'color': ['camel', 'navy', 'beige', 'brown', 'ivory'], 'overall': ['classic', 'preppy'],
+        'formality': ['smart-casual', 'business'], 'aesthetic': ['classic', 'refined'],
+        'mood': ['calm', 'polished'], 'garment_type': ['knitwear', 'coat', 'shirt', 'skirt'],
+    },
+]
+
+
+class SyntheticVLTGenerator:
+    """
+    Seeded generator of VLT records
+
+    Each record is drawn from one archetype: with probability `coherence`
+    a field takes one of the archetype's preferred values, otherwise a
+    Zipf-weighted value from the full vocabulary. Optional embeddings are
+    noisy archetype centroids, as lists of floats or base64 float32.
+    Values are drawn column by column, so 100k records take a second or two.
+    """
+
+    def __init__(
+        self,
+        seed: int = 0,
+        coherence: float = 0.7,
+        missing_rate: float = 0.05,
+        embedding_dim: Optional[int] = None,
+        embedding_format: str = 'list'
+    ):
+        self.rng = np.random.default_rng(seed)
+        self.coherence = coherence
+        self.missing_rate = missing_rate
+        self.embedding_dim = embedding_dim
+        self.embedding_format = embedding_format
+        self._archetype_weights = _zipf(len(ARCHETYPES), exponent=0.6)
+        self._centroids = None
+        if embedding_dim:
+            self._centroids = self.rng.normal(size=(len(ARCHETYPES), embedding_dim)).astype(np.float32)
+        self._next_id = 0
+
+    def records(self, n: int) -> List[Dict[str, Any]]:
+        """Generate n records; ids keep counting across calls"""
+        archetypes = self.rng.choice(len(ARCHETYPES), size=n, p=self._archetype_weights)
+
+        garment_types = self._column(archetypes, 'garment_type', GARMENT_TYPES, nullable=False)
+        attributes = {
+            key: self._column(archetypes, key, vocabulary)
+            for key, vocabulary in ATTRIBUTE_VOCABULARY.items()
+        }
+        primary = self._column(archetypes, 'color', COLOR_VOCABULARY, nullable=False)
+        secondary = self._column(archetypes, None, COLOR_VOCABULARY)
+        finish = self._column(archetypes, None, FINISH_VOCABULARY)
+        style = {key: self._column(archetypes, key, vocabulary) for key, vocabulary in STYLE_VOCABULARY.items()}
+        # List-valued attribute, as VLT emits for garment details
+        details = self.rng.random((n, len(DETAILS))) < 0.15
+        embeddings = self._embeddings(archetypes)
+
+        records = []
+        for i in range(n):
+            record_id = f"synthetic-{self._next_id:07d}"
+            self._next_id += 1
+            garment_type = garment_types[i]
+
+            record_attributes = {}
+            for key, column in attributes.items():
+                if key in ('neckline', 'sleeveLength') and garment_type in _NO_NECKLINE_OR_SLEEVES:
+                    continue
+                record_attributes[key] = column[i]
+            record_attributes['details'] = [DETAILS[j] for j in np.flatnonzero(details[i])]
+
+            record = {
+                'id': record_id,
+                'imageId': f"image-{record_id}",
+                'garment_type': garment_type,
+                'attributes': record_attributes,
+                'colors': {'primary': primary[i], 'secondary': secondary[i], 'finish': finish[i]},
+                'style': {key: column[i] for key, column in style.items()},
+            }
+            if embeddings is not None:
+                record['embedding'] = embeddings[i]
+            records.append(record)
+
+        return records
+
+    def _column(self, archetypes: np.ndarray, preferred_key: Optional[str], vocabulary: List[str], nullable: bool = True) -> list:
+        """One field for every record: archetype-preferred or Zipf background values, some missing"""
+        n = len(archetypes)
+        values = np.asarray(vocabulary, dtype=object)[self.rng.choice(len(vocabulary), size=n, p=_zipf(len(vocabulary)))]
+
+        if preferred_key is not None:
+            coherent = self.rng.random(n) < self.coherence
+            for archetype, preferred in enumerate(ARCHETYPES):
+                choices = preferred.get(preferred_key)
+                rows = np.flatnonzero(coherent & (archetypes == archetype))
+                if choices and len(rows):
+                    values[rows] = np.asarray(choices, dtype=object)[self.rng.integers(len(choices), size=len(rows))]
+
+        if nullable:
+            values[self.rng.random(n) < self.missing_rate] = None
+        return values.tolist()
+
+    def _embeddings(self, archetypes: np.ndarray) -> Optional[list]:
+        if self._centroids is None:
+            return None
+        noise = self.rng.normal(scale=0.8, size=(len(archetypes), self.embedding_dim)).astype(np.float32)
+        vectors = self._centroids[archetypes] + noise
+        if self.embedding_format == 'base64':
+            return [base64.b64encode(vector.astype('<f4').tobytes()).decode('ascii') for vector in vectors]
+        return vectors.tolist()
+
+
+@lru_cache(maxsize=None)
+def _zipf(n: int, exponent: float = 1.1) -> np.ndarray:
+    """Zipf weights over n ranked values"""
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    return weights / weights.sum()
+
+
+def generate_vlt_records(n: int, seed: int = 0, **kwargs) -> List[Dict[str, Any]]:
+    """n synthetic VLT records; kwargs go to SyntheticVLTGenerator"""
+    return SyntheticVLTGenerator(seed=seed, **kwargs).records(n)
@@ -2,18 +2,21 @@
 Designer BFF ML Service
 Python-based ML service for style profiling, RLHF, and prompt optimization
 """
+import time
+_import_started = time.perf_counter()
+
 import os
-from fastapi import FastAPI, HTTPException
+import asyncio
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, FileResponse, Response
 from pydantic import BaseModel
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Union, Literal
 import logging
 
-from services.style_profiler import StyleProfiler
-from services.rlhf_optimizer import RLHFOptimizer
-from services.prompt_optimizer import PromptOptimizer
-from services.validation_service import ValidationService
-from services.dpp_selector import DPPSelector
+from services.startup import LazyService, mark_ready, startup_report, warmup_services
+from services.metrics import CONTENT_TYPE, observe_request, render as render_metrics
+from services.profiling_executor import ExecutorSaturated, ProfilingTimeout
 
 # Configure logging
 logging.basicConfig(
@@ -38,12 +41,58 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    """Latency per route template (not raw path, which would include user ids) for /metrics"""
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get('route')
+        observe_request(request.method, getattr(route, 'path', 'unmatched'), status, time.perf_counter() - started)
+
 # Initialize services
-style_profiler = StyleProfiler()
-rlhf_optimizer = RLHFOptimizer()
-prompt_optimizer = PromptOptimizer()
-validation_service = ValidationService()
-dpp_selector = DPPSelector()
+# Each service (and the ML stack it imports) is built on first use, so
+# /health answers before sklearn or torch load. ML_WARMUP=1 builds them in
+# the background right after startup instead.
+style_profiler = LazyService('style_profiler', 'services.style_profiler:StyleProfiler')
+rlhf_optimizer = LazyService('rlhf_optimizer', 'services.rlhf_optimizer:RLHFOptimizer')
+prompt_optimizer = LazyService('prompt_optimizer', 'services.prompt_optimizer:PromptOptimizer')
+validation_service = LazyService('validation_service', 'services.validation_service:ValidationService')
+dpp_selector = LazyService('dpp_selector', 'services.dpp_selector:DPPSelector')
+
+# CPU-bound profiling runs off the event loop
+profiling_executor = LazyService(
+    'profiling_executor', 'services.profiling_executor:ProfilingExecutor.from_env', style_profiler
+)
+
+components = {
+    'style_profiler': style_profiler,
+    'rlhf_optimizer': rlhf_optimizer,
+    'prompt_optimizer': prompt_optimizer,
+    'validation_service': validation_service,
+    'dpp_selector': dpp_selector
+}
+services = {**components, 'profiling_executor': profiling_executor}
+
+
+@app.on_event("startup")
+async def startup_warmup():
+    mark_ready('main', _import_started)
+    if os.getenv('ML_WARMUP', '0') == '1':
+        asyncio.get_running_loop().run_in_executor(None, warmup_services, services)
+
+
+@app.on_event("shutdown")
+async def shutdown_executor():
+    if profiling_executor.loaded:
+        profiling_executor.shutdown()
+    if rlhf_optimizer.loaded:
+        rlhf_optimizer.shutdown()
 
 
 # ==================== Request/Response Models ====================
@@ -55,14 +104,30 @@ class VLTRecord(BaseModel):
     attributes: Dict[str, Any]
     colors: Dict[str, Any]
     style: Dict[str, Any]
-    embedding: Optional[List[float]] = None
+    embedding: Optional[Union[List[float], str]] = None  # floats, or base64 packed little-endian float32
 
 
 class StyleProfileRequest(BaseModel):
     """Request to create/update style profile"""
     user_id: str
     vlt_records: List[VLTRecord]
-    n_clusters: Optional[int] = 5
+    n_clusters: Optional[Union[int, Literal['auto']]] = 5  # 'auto' selects k by BIC
+    importance_mode: Literal['mutual_info', 'centroid', 'forest', 'deferred'] = 'mutual_info'
+    feature_mode: Literal['categorical', 'hybrid'] = 'categorical'  # 'hybrid' adds record embeddings
+    embedding_weight: float = 1.0
+
+
+class StyleAssignRequest(BaseModel):
+    """Request to tag records with an existing profile's style modes"""
+    user_id: str
+    vlt_records: List[VLTRecord]
+    return_probabilities: bool = False
+
+
+class BulkStyleProfileRequest(BaseModel):
+    """Request to create style profiles for many users at once"""
+    profiles: List[StyleProfileRequest]
+    max_concurrency: Optional[int] = None
 
 
 class PromptOptimizationRequest(BaseModel):
@@ -98,6 +163,19 @@ class DPPSelectionRequest(BaseModel):
     target_count: int
     diversity_weight: float = 0.7
     quality_weight: float = 0.3
+    kernel_mode: Optional[str] = None  # 'kernel', 'low_rank' or 'auto'; service default if unset
+
+
+class DPPSessionRequest(BaseModel):
+    """Request to open a streaming diversity selection session"""
+    target_count: int
+    diversity_weight: float = 0.7
+    quality_weight: float = 0.3
+
+
+class DPPCandidatesRequest(BaseModel):
+    """Batch of candidates streamed into a selection session"""
+    images: List[Dict[str, Any]]
 
 
 # ==================== Stage 2: Style Profile Clustering ====================
@@ -111,10 +189,14 @@ async def create_style_profile(request: StyleProfileRequest):
     try:
         logger.info(f"Creating style profile for user {request.user_id}")
         
-        profile = style_profiler.create_profile(
+        profile = await profiling_executor.call(
+            'create_profile',
             user_id=request.user_id,
             vlt_records=[r.dict() for r in request.vlt_records],
-            n_clusters=request.n_clusters
+            n_clusters=request.n_clusters,
+            importance_mode=request.importance_mode,
+            feature_mode=request.feature_mode,
+            embedding_weight=request.embedding_weight
         )
         
         return {
@@ -123,6 +205,15 @@ async def create_style_profile(request: StyleProfileRequest):
             "message": f"Style profile created with {len(profile['clusters'])} style modes"
         }
         
+    except ValueError as e:
+        logger.error(f"Invalid style profile request: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+    except ExecutorSaturated as e:
+        logger.warning(f"Style profile creation rejected: {str(e)}")
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+    except ProfilingTimeout as e:
+        logger.error(f"Style profile creation timed out: {str(e)}")
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         logger.error(f"Style profile creation failed: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -137,7 +228,8 @@ async def update_style_profile(request: StyleProfileRequest):
     try:
         logger.info(f"Updating style profile for user {request.user_id}")
         
-        profile = style_profiler.update_profile(
+        profile = await profiling_executor.call(
+            'update_profile',
             user_id=request.user_id,
             new_vlt_records=[r.dict() for r in request.vlt_records]
         )
@@ -148,16 +240,152 @@ async def update_style_profile(request: StyleProfileRequest):
             "message": "Style profile updated"
         }
         
+    except ExecutorSaturated as e:
+        logger.warning(f"Style profile update rejected: {str(e)}")
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+    except ProfilingTimeout as e:
+        logger.error(f"Style profile update timed out: {str(e)}")
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         logger.error(f"Style profile update failed: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/api/ml/style-profile/assign")
+async def assign_style_clusters(request: StyleAssignRequest):
+    """
+    Assign records to the user's existing style modes
+    Read-only prediction with the cached models; the profile is not changed
+    """
+    try:
+        if not await asyncio.to_thread(style_profiler.get_profile, request.user_id):
+            raise HTTPException(status_code=404, detail=f"No profile found for user {request.user_id}")
+        
+        # Small batches: skip the profiling queue so tagging is never rejected behind long fits
+        result = await asyncio.to_thread(
+            style_profiler.assign_records,
+            request.user_id,
+            [r.dict() for r in request.vlt_records],
+            request.return_probabilities
+        )
+        
+        return {
+            "success": True,
+            **result
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Style assignment failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/api/ml/style-profile/stream")
+async def stream_create_style_profile(
+    request: Request,
+    user_id: str,
+    n_clusters: Union[int, Literal['auto']] = 5,
+    importance_mode: Literal['mutual_info', 'centroid', 'forest', 'deferred'] = 'mutual_info',
+    mini_batch: bool = False,
+    chunk_size: int = 1000,
+    feature_mode: Literal['categorical', 'hybrid'] = 'categorical',
+    embedding_weight: float = 1.0
+):
+    """
+    Create style profile from an NDJSON body (one VLT record per line)
+    Records are encoded chunk by chunk as they arrive, so memory is bounded
+    by chunk_size rather than the portfolio size
+    """
+    try:
+        logger.info(f"Streaming style profile records for user {user_id}")
+        
+        from services.streaming_ingest import encode_ndjson_stream
+        
+        portfolio = await encode_ndjson_stream(request.stream(), chunk_size)
+        
+        profile = await profiling_executor.call(
+            'create_profile_from_portfolio',
+            user_id=user_id,
+            portfolio=portfolio,
+            n_clusters=n_clusters,
+            importance_mode=importance_mode,
+            mini_batch=mini_batch,
+            feature_mode=feature_mode,
+            embedding_weight=embedding_weight
+        )
+        
+        return {
+            "success": True,
+            "profile": profile,
+            "message": f"Style profile created with {len(profile['clusters'])} style modes"
+        }
+        
+    except ValueError as e:
+        logger.error(f"Invalid streamed style profile records: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+    except ExecutorSaturated as e:
+        logger.warning(f"Style profile creation rejected: {str(e)}")
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+    except ProfilingTimeout as e:
+        logger.error(f"Style profile creation timed out: {str(e)}")
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        logger.error(f"Streamed style profile creation failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/api/ml/style-profile/bulk")
+async def bulk_create_style_profiles(request: BulkStyleProfileRequest):
+    """
+    Create style profiles for many users (e.g. a whole brand import)
+    Builds run on the profiling pool; one NDJSON line is streamed per user
+    as it finishes, followed by a throughput summary line
+    """
+    from services.bulk_profiling import stream_bulk_profiles
+    
+    logger.info(f"Bulk creating {len(request.profiles)} style profiles")
+    
+    jobs = [
+        {
+            'user_id': p.user_id,
+            'vlt_records': [r.dict() for r in p.vlt_records],
+            'n_clusters': p.n_clusters,
+            'importance_mode': p.importance_mode,
+            'feature_mode': p.feature_mode,
+            'embedding_weight': p.embedding_weight
+        }
+        for p in request.profiles
+    ]
+    
+    return StreamingResponse(
+        stream_bulk_profiles(profiling_executor, jobs, request.max_concurrency),
+        media_type="application/x-ndjson"
+    )
+
+
+@app.get("/api/ml/style-profiles")
+async def list_style_profiles(limit: int = 100, offset: int = 0):
+    """List stored style profiles, most recently updated first"""
+    try:
+        profiles = await asyncio.to_thread(style_profiler.list_profiles, limit=limit, offset=offset)
+        
+        return {
+            "success": True,
+            "profiles": profiles,
+            "count": len(profiles)
+        }
+        
+    except Exception as e:
+        logger.error(f"Failed to list style profiles: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.get("/api/ml/style-profile/{user_id}")
 async def get_style_profile(user_id: str):
     """Get user's current style profile"""
     try:
-        profile = style_profiler.get_profile(user_id)
+        profile = await asyncio.to_thread(style_profiler.get_profile, user_id)
         
         if not profile:
             raise HTTPException(status_code=404, detail="Style profile not found")
@@ -174,6 +402,28 @@ async def get_style_profile(user_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/api/ml/style-profile/{user_id}/scorer")
+async def get_style_scorer(user_id: str):
+    """
+    Download the user's compact scorer artifact
+    Flat float32 file that services.style_scorer.load_artifact memory-maps
+    and scores with numpy alone, without sklearn
+    """
+    try:
+        if not await asyncio.to_thread(style_profiler.get_profile, user_id):
+            raise HTTPException(status_code=404, detail=f"No profile found for user {user_id}")
+        
+        path = await asyncio.to_thread(style_profiler.export_scorer, user_id)
+        
+        return FileResponse(path, media_type="application/octet-stream", filename=f"{user_id}.scorer")
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Scorer export failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 # ==================== Stage 5: RLHF Prompt Optimization ====================
 
 @app.post("/api/ml/prompt/optimize")
@@ -215,7 +465,9 @@ async def submit_feedback(request: FeedbackRequest):
     try:
         logger.info(f"Processing feedback for user {request.user_id}")
         
-        result = rlhf_optimizer.process_feedback(
+        # A user's first feedback since startup replays their log from disk
+        result = await asyncio.to_thread(
+            rlhf_optimizer.process_feedback,
             user_id=request.user_id,
             generation_id=request.generation_id,
             asset_id=request.asset_id,
@@ -232,29 +484,37 @@ async def submit_feedback(request: FeedbackRequest):
             "new_weights": result.get('weights_summary')
         }
         
+    except ValueError as e:
+        logger.error(f"Invalid feedback: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Feedback processing failed: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post("/api/ml/rlhf/train")
-async def train_rlhf_model(user_id: str):
+async def train_rlhf_model(user_id: str, wait: bool = False):
     """
     Trigger RLHF model retraining with accumulated feedback
-    Should be called periodically (e.g., after N feedbacks)
+    The refit runs in the background; metrics are from the latest completed
+    refit unless wait is set. Also scheduled automatically every
+    RLHF_REFIT_EVERY feedback events.
     """
     try:
         logger.info(f"Training RLHF model for user {user_id}")
         
-        result = rlhf_optimizer.train_model(user_id)
+        result = await asyncio.to_thread(rlhf_optimizer.train_model, user_id, wait)
         
         return {
             "success": True,
-            "training_completed": True,
+            "training_completed": result['status'] == 'completed',
+            "training_status": result['status'],
             "metrics": result['metrics'],
             "iterations": result['iterations']
         }
         
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         logger.error(f"RLHF training failed: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -271,7 +531,8 @@ async def validate_generation(request: ValidationRequest):
     try:
         logger.info(f"Validating generation {request.generation_id}")
         
-        results = validation_service.validate_images(
+        results = await asyncio.to_thread(
+            validation_service.validate_images,
             images=request.images,
             target_vlt=request.target_vlt
         )
@@ -283,6 +544,9 @@ async def validate_generation(request: ValidationRequest):
             "outliers": results['outliers']
         }
         
+    except ValueError as e:
+        logger.error(f"Invalid validation request: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Validation failed: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -299,11 +563,14 @@ async def select_diverse_images(request: DPPSelectionRequest):
     try:
         logger.info(f"Selecting {request.target_count} diverse images from {len(request.images)}")
         
-        selection = dpp_selector.select_diverse(
+        # Greedy MAP is CPU-bound; keep it off the event loop
+        selection = await asyncio.to_thread(
+            dpp_selector.select_diverse,
             images=request.images,
             target_count=request.target_count,
             diversity_weight=request.diversity_weight,
-            quality_weight=request.quality_weight
+            quality_weight=request.quality_weight,
+            kernel_mode=request.kernel_mode
         )
         
         return {
@@ -314,11 +581,108 @@ async def select_diverse_images(request: DPPSelectionRequest):
             "coverage_metrics": selection['coverage']
         }
         
+    except ValueError as e:
+        logger.error(f"Invalid DPP selection request: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"DPP selection failed: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/api/ml/select/diverse/session")
+async def open_diverse_session(request: DPPSessionRequest):
+    """
+    Stage 9 (streaming): Open a running diverse selection
+    Candidates are added in batches while generation is still producing them
+    """
+    try:
+        session_id = dpp_selector.open_session(
+            target_count=request.target_count,
+            diversity_weight=request.diversity_weight,
+            quality_weight=request.quality_weight
+        )
+        
+        return {
+            "success": True,
+            "session_id": session_id
+        }
+        
+    except ValueError as e:
+        logger.error(f"Invalid DPP session request: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Failed to open DPP session: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/api/ml/select/diverse/session/{session_id}/candidates")
+async def add_diverse_candidates(session_id: str, request: DPPCandidatesRequest):
+    """Stream a batch of candidates into a selection session"""
+    try:
+        result = await asyncio.to_thread(dpp_selector.add_candidates, session_id, request.images)
+        
+        return {
+            "success": True,
+            "session_id": session_id,
+            **result
+        }
+        
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+    except ValueError as e:
+        logger.error(f"Invalid DPP session candidates: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"DPP session update failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/ml/select/diverse/session/{session_id}")
+async def get_diverse_selection(session_id: str):
+    """Current selection of a streaming session"""
+    try:
+        selection = dpp_selector.session_selection(session_id)
+        
+        return {
+            "success": True,
+            "session_id": session_id,
+            "selected_images": selection['selected'],
+            "diversity_score": selection['diversity_score'],
+            "coverage_metrics": selection['coverage'],
+            "candidates_seen": selection['n_seen'],
+            "swaps": selection['n_swaps']
+        }
+        
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+    except Exception as e:
+        logger.error(f"Failed to read DPP session: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.delete("/api/ml/select/diverse/session/{session_id}")
+async def close_diverse_session(session_id: str):
+    """Close a streaming session, returning its final selection"""
+    try:
+        selection = dpp_selector.close_session(session_id)
+        
+        return {
+            "success": True,
+            "session_id": session_id,
+            "selected_images": selection['selected'],
+            "diversity_score": selection['diversity_score'],
+            "coverage_metrics": selection['coverage'],
+            "candidates_seen": selection['n_seen'],
+            "swaps": selection['n_swaps']
+        }
+        
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+    except Exception as e:
+        logger.error(f"Failed to close DPP session: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 # ==================== Health & Status ====================
 
 @app.get("/health")
@@ -328,16 +692,28 @@ async def health_check():
         "status": "healthy",
         "service": "Designer BFF ML Service",
         "version": "1.0.0",
+        # Reporting must not trigger loading a lazy service
         "components": {
-            "style_profiler": style_profiler.is_ready(),
-            "rlhf_optimizer": rlhf_optimizer.is_ready(),
-            "prompt_optimizer": prompt_optimizer.is_ready(),
-            "validation_service": validation_service.is_ready(),
-            "dpp_selector": dpp_selector.is_ready()
-        }
+            name: component.is_ready() if component.loaded else "not_loaded"
+            for name, component in components.items()
+        },
+        "caches": style_profiler.cache_stats() if style_profiler.loaded else None,
+        "executor": profiling_executor.stats() if profiling_executor.loaded else None
     }
 
 
+@app.get("/health/startup")
+async def startup_status():
+    """Startup report: time to ready, timed imports and lazy service load times"""
+    return startup_report(services)
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: style profile stage timings and counts, request latency per route"""
+    return Response(content=render_metrics(), media_type=CONTENT_TYPE)
+
+
 @app.get("/")
 async def root():
     """Root endpoint"""
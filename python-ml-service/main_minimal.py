@@ -2,15 +2,22 @@
 Minimal Designer BFF ML Service
 Python-based ML service for style profiling
 """
+import time
+_import_started = time.perf_counter()
+
 import os
+import asyncio
 import uvicorn
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, FileResponse, Response
 from pydantic import BaseModel
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Union, Literal
 import logging
 
-from services.style_profiler import StyleProfiler
+from services.startup import LazyService, mark_ready, startup_report, warmup_services
+from services.metrics import CONTENT_TYPE, observe_request, render as render_metrics
+from services.profiling_executor import ExecutorSaturated, ProfilingTimeout
 
 # Configure logging
 logging.basicConfig(
@@ -35,8 +42,42 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize services
-style_profiler = StyleProfiler()
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    """Latency per route template (not raw path, which would include user ids) for /metrics"""
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get('route')
+        observe_request(request.method, getattr(route, 'path', 'unmatched'), status, time.perf_counter() - started)
+
+# Initialize services on first use (ML_WARMUP=1 loads them right after startup)
+style_profiler = LazyService('style_profiler', 'services.style_profiler:StyleProfiler')
+
+# CPU-bound profiling runs off the event loop
+profiling_executor = LazyService(
+    'profiling_executor', 'services.profiling_executor:ProfilingExecutor.from_env', style_profiler
+)
+
+services = {'style_profiler': style_profiler, 'profiling_executor': profiling_executor}
+
+
+@app.on_event("startup")
+async def startup_warmup():
+    mark_ready('main_minimal', _import_started)
+    if os.getenv('ML_WARMUP', '0') == '1':
+        asyncio.get_running_loop().run_in_executor(None, warmup_services, services)
+
+
+@app.on_event("shutdown")
+async def shutdown_executor():
+    if profiling_executor.loaded:
+        profiling_executor.shutdown()
 
 # Request/Response models
 class VLTRecord(BaseModel):
@@ -46,12 +87,17 @@ class VLTRecord(BaseModel):
     colors: Optional[Dict] = None
     style: Optional[Dict] = None
     attributes: Optional[Dict] = None
+    embedding: Optional[Union[List[float], str]] = None  # floats, or base64 packed float32
 
 class StyleProfileRequest(BaseModel):
     userId: str
     records: List[VLTRecord]
     options: Optional[Dict] = {}
 
+class BulkStyleProfileRequest(BaseModel):
+    profiles: List[StyleProfileRequest]
+    maxConcurrency: Optional[int] = None
+
 # Routes
 @app.get("/health")
 async def health_check():
@@ -63,6 +109,16 @@ async def health_check():
         "timestamp": None
     }
 
+@app.get("/health/startup")
+async def startup_status():
+    """Startup report: time to ready, timed imports and lazy service load times"""
+    return startup_report(services)
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: style profile stage timings and counts, request latency per route"""
+    return Response(content=render_metrics(), media_type=CONTENT_TYPE)
+
 @app.post("/api/style-profile")
 async def generate_style_profile(request: StyleProfileRequest):
     """
@@ -76,18 +132,139 @@ async def generate_style_profile(request: StyleProfileRequest):
         records_data = [record.dict() for record in request.records]
         
         # Generate profile using GMM
-        profile = style_profiler.create_profile(
+        profile = await profiling_executor.call(
+            'create_profile',
             user_id=request.userId,
             vlt_records=records_data,
-            n_clusters=request.options.get('n_clusters', 3)
+            n_clusters=request.options.get('n_clusters', 3),
+            importance_mode=request.options.get('importance_mode', 'mutual_info'),
+            feature_mode=request.options.get('feature_mode', 'categorical'),
+            embedding_weight=request.options.get('embedding_weight', 1.0)
+        )
+        
+        return {
+            "success": True,
+            "userId": request.userId,
+            "profile": profile
+        }
+        
+    except ValueError as e:
+        logger.error(f"Invalid style profile request: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+    except ExecutorSaturated as e:
+        logger.warning(f"Style profile generation rejected: {str(e)}")
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+    except ProfilingTimeout as e:
+        logger.error(f"Style profile generation timed out: {str(e)}")
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        logger.error(f"Style profile generation failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/style-profile/bulk")
+async def generate_style_profiles_bulk(request: BulkStyleProfileRequest):
+    """
+    Generate style profiles for many users at once
+    Streams one NDJSON line per user as it finishes, then a summary line
+    """
+    from services.bulk_profiling import stream_bulk_profiles
+    
+    logger.info(f"Bulk generating {len(request.profiles)} style profiles")
+    
+    jobs = [
+        {
+            'user_id': p.userId,
+            'vlt_records': [record.dict() for record in p.records],
+            'n_clusters': p.options.get('n_clusters', 3),
+            'importance_mode': p.options.get('importance_mode', 'mutual_info'),
+            'feature_mode': p.options.get('feature_mode', 'categorical'),
+            'embedding_weight': p.options.get('embedding_weight', 1.0)
+        }
+        for p in request.profiles
+    ]
+    
+    return StreamingResponse(
+        stream_bulk_profiles(profiling_executor, jobs, request.maxConcurrency),
+        media_type="application/x-ndjson"
+    )
+
+@app.post("/api/style-profile/assign")
+async def assign_style_clusters(request: StyleProfileRequest):
+    """
+    Tag records with the user's existing style modes without changing the profile
+    """
+    try:
+        if not await asyncio.to_thread(style_profiler.get_profile, request.userId):
+            raise HTTPException(status_code=404, detail=f"No profile found for user {request.userId}")
+        
+        result = await asyncio.to_thread(
+            style_profiler.assign_records,
+            request.userId,
+            [record.dict() for record in request.records],
+            request.options.get('return_probabilities', False)
         )
         
         return {
             "success": True,
             "userId": request.userId,
+            "assignments": result['assignments']
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Style assignment failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/style-profile/stream")
+async def generate_style_profile_stream(
+    request: Request,
+    userId: str,
+    nClusters: Union[int, Literal['auto']] = 3,
+    importanceMode: Literal['mutual_info', 'centroid', 'forest', 'deferred'] = 'mutual_info',
+    miniBatch: bool = False,
+    chunkSize: int = 1000,
+    featureMode: Literal['categorical', 'hybrid'] = 'categorical',
+    embeddingWeight: float = 1.0
+):
+    """
+    Generate style profile from an NDJSON body, one record per line
+    Records are encoded chunk by chunk instead of parsed into one request model
+    """
+    try:
+        logger.info(f"Streaming style profile records for user {userId}")
+        
+        from services.streaming_ingest import encode_ndjson_stream
+        
+        portfolio = await encode_ndjson_stream(request.stream(), chunkSize)
+        logger.info(f"Received {portfolio.n_records} records")
+        
+        profile = await profiling_executor.call(
+            'create_profile_from_portfolio',
+            user_id=userId,
+            portfolio=portfolio,
+            n_clusters=nClusters,
+            importance_mode=importanceMode,
+            mini_batch=miniBatch,
+            feature_mode=featureMode,
+            embedding_weight=embeddingWeight
+        )
+        
+        return {
+            "success": True,
+            "userId": userId,
             "profile": profile
         }
         
+    except ValueError as e:
+        logger.error(f"Invalid streamed records: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+    except ExecutorSaturated as e:
+        logger.warning(f"Style profile generation rejected: {str(e)}")
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+    except ProfilingTimeout as e:
+        logger.error(f"Style profile generation timed out: {str(e)}")
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         logger.error(f"Style profile generation failed: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -100,7 +277,7 @@ async def get_style_profile(userId: str):
     try:
         logger.info(f"Fetching style profile for user {userId}")
         
-        profile = style_profiler.get_profile(userId)
+        profile = await asyncio.to_thread(style_profiler.get_profile, userId)
         
         if not profile:
             raise HTTPException(status_code=404, detail=f"No profile found for user {userId}")
@@ -117,6 +294,25 @@ async def get_style_profile(userId: str):
         logger.error(f"Failed to fetch style profile: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/style-profile/{userId}/scorer")
+async def get_style_scorer(userId: str):
+    """
+    Download the compact numpy scorer artifact for a user's profile
+    """
+    try:
+        if not await asyncio.to_thread(style_profiler.get_profile, userId):
+            raise HTTPException(status_code=404, detail=f"No profile found for user {userId}")
+        
+        path = await asyncio.to_thread(style_profiler.export_scorer, userId)
+        
+        return FileResponse(path, media_type="application/octet-stream", filename=f"{userId}.scorer")
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Scorer export failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/")
 async def root():
     return {
@@ -124,8 +320,14 @@ async def root():
         "status": "running",
         "endpoints": [
             "/health",
+            "/health/startup",
+            "/metrics",
             "/api/style-profile (POST)",
-            "/api/style-profile/{userId} (GET)"
+            "/api/style-profile/bulk (POST)",
+            "/api/style-profile/stream (POST)",
+            "/api/style-profile/assign (POST)",
+            "/api/style-profile/{userId} (GET)",
+            "/api/style-profile/{userId}/scorer (GET)"
         ]
     }
 
@@ -0,0 +1,87 @@
+"""
+Bulk style profile builds
+Schedules many users' create_profile calls on the profiling pool and streams
+per-user results as NDJSON lines as each one finishes
+"""
+import asyncio
+import time
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from services.profile_store import dumps_compact
+
+logger = logging.getLogger(__name__)
+
+
+async def stream_bulk_profiles(
+    executor,
+    jobs: List[Dict[str, Any]],
+    max_concurrency: Optional[int] = None
+) -> AsyncIterator[str]:
+    """
+    Build profiles for many users, yielding one NDJSON line per finished user
+
+    Args:
+        executor: ProfilingExecutor running StyleProfiler.create_profile
+        jobs: create_profile keyword arguments per user (user_id, vlt_records, ...)
+        max_concurrency: Jobs in the pool at once; defaults to the pool's
+            worker count so a bulk import cannot fill the request queue
+
+    Yields:
+        {"type": "result", ...} per user in completion order, then one
+        {"type": "summary", ...} line; its records, throughput and
+        latencies only count succeeded builds
+    """
+    limiter = asyncio.Semaphore(max_concurrency or executor.max_workers)
+    started = time.perf_counter()
+
+    async def _run(job: Dict[str, Any]) -> Dict[str, Any]:
+        async with limiter:
+            job_started = time.perf_counter()
+            try:
+                profile = await executor.call('create_profile', wait=True, **job)
+                result = {'success': True, 'profile': profile}
+            except Exception as e:
+                logger.error(f"Bulk profile build failed for {job['user_id']}: {str(e)}")
+                result = {'success': False, 'error': str(e)}
+
+            result.update({
+                'type': 'result',
+                'user_id': job['user_id'],
+                'n_records': len(job['vlt_records']),
+                'elapsed_ms': round((time.perf_counter() - job_started) * 1000, 2)
+            })
+            return result
+
+    tasks = [asyncio.ensure_future(_run(job)) for job in jobs]
+    latencies = []
+    succeeded = 0
+    total_records = 0
+
+    try:
+        for next_result in asyncio.as_completed(tasks):
+            result = await next_result
+            if result['success']:
+                latencies.append(result['elapsed_ms'])
+                total_records += result['n_records']
+                succeeded += 1
+            yield dumps_compact(result) + '\n'
+
+        elapsed = time.perf_counter() - started
+        yield dumps_compact({
+            'type': 'summary',
+            'users': len(jobs),
+            'succeeded': succeeded,
+            'failed': len(jobs) - succeeded,
+            'records': total_records,
+            'elapsed_s': round(elapsed, 3),
+            'users_per_s': round(succeeded / elapsed, 3) if elapsed > 0 else None,
+            'records_per_s': round(total_records / elapsed, 1) if elapsed > 0 else None,
+            'mean_latency_ms': round(sum(latencies) / len(latencies), 2) if latencies else None,
+            'max_latency_ms': max(latencies) if latencies else None
+        }) + '\n'
+
+    finally:
+        # Client went away: stop scheduling the remaining users
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,109 @@
+"""
+Automatic cluster-count selection for style profiles
+Sweeps GaussianMixture candidates over a range of k in parallel rounds,
+stopping once BIC stops improving
+"""
+import numpy as np
+from joblib import Parallel, delayed, effective_n_jobs
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any
+
+logger = logging.getLogger(__name__)
+
+# Per-thread cap on parallel candidate fits, for callers sharing the CPU
+_limits = threading.local()
+
+
+@contextmanager
+def sweep_jobs_limit(n_jobs: int):
+    """Cap the parallel fits of sweeps run in this thread at n_jobs, whatever they request"""
+    previous = getattr(_limits, 'n_jobs', None)
+    _limits.n_jobs = n_jobs
+    try:
+        yield
+    finally:
+        _limits.n_jobs = previous
+
+
+def _fit_candidate(X: np.ndarray, n_components: int, random_state: int, max_iter: int) -> tuple:
+    """Fit one candidate mixture from a cold (k-means) start and score it with BIC"""
+    from sklearn.mixture import GaussianMixture as GaussianMixtureModel
+
+    gmm = GaussianMixtureModel(
+        n_components=n_components,
+        covariance_type='full',
+        random_state=random_state,
+        max_iter=max_iter
+    )
+    gmm.fit(X)
+    return n_components, gmm, float(gmm.bic(X))
+
+
+def select_n_clusters(
+    X: np.ndarray,
+    min_clusters: int = 2,
+    max_clusters: int = 12,
+    n_jobs: int = -1,
+    patience: int = 2,
+    random_state: int = 42,
+    max_iter: int = 100
+) -> Dict[str, Any]:
+    """
+    Choose the number of mixture components by BIC
+
+    Candidates are fitted in rounds of effective_n_jobs consecutive k values,
+    one per core, capped by an enclosing sweep_jobs_limit. Each candidate is fitted cold, independently of the others,
+    and results are scanned in k order: the sweep stops once `patience`
+    consecutive k values fail to improve on the best BIC. Fits past the stop
+    within a round are discarded, so the chosen k does not depend on n_jobs.
+
+    Args:
+        X: (n_samples, n_features) data in the GMM input space
+        min_clusters: Smallest k to try
+        max_clusters: Largest k to try, capped at n_samples
+        n_jobs: Parallel workers (joblib semantics)
+        patience: Non-improving k values tolerated before stopping
+
+    Returns:
+        Dict with the chosen 'n_clusters', the fitted 'gmm' and the 'bic' curve {k: bic}
+    """
+    n_samples = X.shape[0]
+    max_clusters = max(1, min(max_clusters, n_samples))
+    min_clusters = max(1, min(min_clusters, max_clusters))
+    round_size = max(1, effective_n_jobs(n_jobs))
+    limit = getattr(_limits, 'n_jobs', None)
+    if limit is not None:
+        round_size = max(1, min(round_size, limit))
+
+    bic_curve = {}
+    best_k, best_gmm, best_bic = None, None, np.inf
+    since_improvement = 0
+
+    with Parallel(n_jobs=min(round_size, max_clusters - min_clusters + 1)) as parallel:
+        k = min_clusters
+        while k <= max_clusters and since_improvement < patience:
+            round_ks = list(range(k, min(k + round_size, max_clusters + 1)))
+
+            results = parallel(delayed(_fit_candidate)(X, n, random_state, max_iter) for n in round_ks)
+
+            for n, gmm, bic in sorted(results, key=lambda r: r[0]):
+                bic_curve[n] = bic
+                if bic < best_bic:
+                    best_k, best_gmm, best_bic = n, gmm, bic
+                    since_improvement = 0
+                else:
+                    since_improvement += 1
+                    if since_improvement >= patience:
+                        break
+
+            k = round_ks[-1] + 1
+
+    logger.info(f"Selected {best_k} clusters by BIC over k={sorted(bic_curve)}")
+
+    return {
+        'n_clusters': best_k,
+        'gmm': best_gmm,
+        'bic': bic_curve
+    }
@@ -0,0 +1,685 @@
+"""
+Stage 9: Diverse image selection with a determinantal point process
+Greedy MAP inference over a quality-weighted similarity kernel, using
+incremental Cholesky updates (Chen et al., 2018) so selecting k of N
+candidates costs O(N * k * (k + D)) and the N x N kernel is never built.
+A low-rank mode runs the same greedy in the D-dim feature space instead,
+keeping memory at O(N * D) float32 for large batches of embeddings.
+Streaming sessions keep a running selection over candidates that arrive
+in batches, updating it by swaps.
+"""
+import os
+import uuid
+import threading
+import numpy as np
+import logging
+from scipy import sparse
+from typing import List, Dict, Any, Optional, Tuple
+
+from services.feature_encoder import embedding_matrix
+from services.lru_cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# VLT spec fields compared between candidates, with their similarity weight
+FEATURE_WEIGHTS = {
+    'garmentType': 1.0,
+    'silhouette': 0.9,
+    'fabrication': 0.8,
+    'neckline': 0.7,
+    'sleeves': 0.6,
+    'length': 0.5,
+    'color': 0.4,
+    'pattern': 0.3,
+}
+
+# Fields reported in coverage metrics
+COVERAGE_FIELDS = ['garmentType', 'silhouette', 'fabrication', 'neckline', 'sleeves', 'length']
+
+DEFAULT_QUALITY = 0.7
+
+# Shared (field, value) column of candidates with no weighted spec value and no embedding
+UNKNOWN_FEATURE = ('_unknown', '')
+
+KERNEL_MODES = ('auto', 'kernel', 'low_rank')
+# Rows per block when densifying features and projecting in low-rank mode
+LOW_RANK_CHUNK = 4096
+
+
+class DPPSelector:
+    """
+    Selects a diverse, high-quality subset of candidate images
+
+    Similarity S is the cosine similarity of each image's feature vector:
+    weighted one-hot VLT attributes, blended with its embedding when one is
+    given (S_ii = 1). Candidates with neither share one "unknown" feature,
+    so they count as copies of each other rather than as maximally
+    diverse. The DPP kernel is L = diag(q^a) S diag(q^a) with
+    quality q in (0, 1] and a = quality_weight / diversity_weight, so
+    log det L_Y = 2a * sum(log q) + log det S_Y: quality and diversity
+    trade off by the request weights.
+
+    kernel_mode picks the inference path: 'kernel' keeps Cholesky rows over
+    all N candidates (k x N), 'low_rank' keeps an orthonormal basis of the
+    selection in feature space (k x D) over a float32 N x D feature matrix,
+    and 'auto' uses low_rank when D < k.
+    """
+
+    def __init__(
+        self,
+        feature_weights: Optional[Dict[str, float]] = None,
+        embedding_weight: float = 0.5,
+        epsilon: float = 1e-10,
+        kernel_mode: Optional[str] = None
+    ):
+        self.feature_weights = dict(feature_weights or FEATURE_WEIGHTS)
+        # Share of similarity taken from embeddings when a candidate has both
+        self.embedding_weight = embedding_weight
+        # Residual variance below which remaining candidates add no diversity
+        self.epsilon = epsilon
+        self.kernel_mode = self._check_mode(kernel_mode or os.getenv('DPP_KERNEL_MODE', 'auto'))
+        # Streaming sessions; ttl counts from the last batch added
+        self._sessions = LRUCache(
+            max_entries=int(os.getenv('DPP_SESSIONS', 256)),
+            ttl=float(os.getenv('DPP_SESSION_TTL', 3600)),
+            sizeof=lambda session: 0
+        )
+
+        logger.info("DPPSelector initialized")
+
+    def select_diverse(
+        self,
+        images: List[Dict[str, Any]],
+        target_count: int,
+        diversity_weight: float = 0.7,
+        quality_weight: float = 0.3,
+        kernel_mode: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Select target_count images by greedy DPP MAP inference
+
+        Args:
+            images: Candidates with VLT specs ('vltSpecs', 'validation.vltSpecs',
+                'vlt_spec' or 'attributes'), optional 'embedding' (floats or
+                base64 float32) and quality ('quality_score', 'qualityScore'
+                or 'validation.overallScore', 0-1 or 0-100)
+            target_count: Number of images to select
+            diversity_weight: Weight of log det S of the selection
+            quality_weight: Weight of the selection's summed log quality
+            kernel_mode: Overrides the selector's kernel_mode for this call
+
+        Returns:
+            Dict with 'selected' (in selection order, each with
+            'selection_rank' and 'marginal_gain', the log det increase or
+            None if picked by quality once diversity was exhausted), 'rejected',
+            'diversity_score' (1 - mean pairwise similarity of the selection)
+            and 'coverage' (attribute values covered, per field)
+        """
+        if target_count <= 0:
+            raise ValueError("target_count must be positive")
+        if diversity_weight < 0 or quality_weight < 0 or diversity_weight + quality_weight == 0:
+            raise ValueError("diversity_weight and quality_weight must be non-negative and not both zero")
+        if not images:
+            return {'selected': [], 'rejected': [], 'diversity_score': 0.0, 'coverage': {}}
+
+        attributes, embeddings, row_scale, presence, columns = self._feature_blocks(images)
+        quality = np.array([self._quality(image) for image in images])
+
+        k = min(target_count, len(images))
+        if diversity_weight == 0:
+            order = np.argsort(-quality, kind='stable')[:k]
+            selected, gains = order.tolist(), np.log(quality[order]).tolist()
+        else:
+            weights = quality ** (quality_weight / diversity_weight)
+            mode = self._check_mode(kernel_mode or self.kernel_mode)
+            n_features = attributes.shape[1] + (0 if embeddings is None else embeddings.shape[1])
+            if mode == 'low_rank' or (mode == 'auto' and n_features < k):
+                features = self._dense_features(attributes, embeddings, row_scale)
+                selected, gains = self._greedy_map_low_rank(features, weights, k)
+            else:
+                selected, gains = self._greedy_map(attributes, embeddings, row_scale, weights, k)
+
+        selected_set = set(selected)
+        return {
+            'selected': [
+                {**images[i], 'selection_rank': rank, 'marginal_gain': None if gain is None else float(gain)}
+                for rank, (i, gain) in enumerate(zip(selected, gains))
+            ],
+            'rejected': [image for i, image in enumerate(images) if i not in selected_set],
+            'diversity_score': self._diversity_score(attributes, embeddings, row_scale, selected),
+            'coverage': self._coverage(presence, columns, selected)
+        }
+
+    def _greedy_map(
+        self,
+        attributes: sparse.csr_matrix,
+        embeddings: Optional[np.ndarray],
+        row_scale: np.ndarray,
+        weights: np.ndarray,
+        k: int
+    ) -> Tuple[List[int], List[float]]:
+        """
+        Fast greedy MAP for L = diag(w) S diag(w)
+
+        Keeps the Cholesky rows c_i of the selected set and each candidate's
+        residual d_i^2 = L_ii - |c_i|^2, the gain in det L from adding it.
+        Each step needs one kernel row, computed from the feature blocks.
+        Once every residual is below epsilon the rest of the candidates lie
+        in the span of the selection and are taken by quality instead.
+
+        Returns:
+            (selected indices, log marginal gain of each; None for quality fills)
+        """
+        n = len(weights)
+        cholesky_rows = np.zeros((k, n))
+        residual = weights ** 2  # S_ii = 1
+        selected, gains = [], []
+
+        j = int(np.argmax(residual))
+        while len(selected) < k and residual[j] > self.epsilon:
+            selected.append(j)
+            gains.append(np.log(residual[j]))
+            if len(selected) == k:
+                break
+
+            m = len(selected) - 1
+            kernel_row = weights[j] * weights * self._similarity_row(attributes, embeddings, row_scale, j)
+            e = (kernel_row - cholesky_rows[:m, j] @ cholesky_rows[:m]) / np.sqrt(residual[j])
+            cholesky_rows[m] = e
+            residual = residual - e ** 2
+            residual[selected] = -np.inf
+            j = int(np.argmax(residual))
+
+        return self._fill_by_quality(selected, gains, weights, k)
+
+    def _greedy_map_low_rank(self, features: np.ndarray, weights: np.ndarray, k: int) -> Tuple[List[int], List[float]]:
+        """
+        Greedy MAP in feature space for L = B B^T with B = diag(w) F
+
+        det L_Y is the squared volume spanned by the selected rows of B, so
+        the gain of candidate i is its squared distance from that span:
+        d_i^2 = |b_i|^2 - |Q b_i|^2 for an orthonormal basis Q (m x D) of
+        the selection. Each pick adds one Gram-Schmidt vector and one
+        chunked N x D projection; nothing of size N x k or N x N is kept.
+        Zero rows (no attributes when embedding_weight is 1) have S_ii = 1
+        but no direction, so they only ever lose residual to themselves.
+
+        Returns:
+            (selected indices, log marginal gain of each; None for quality fills)
+        """
+        n, dim = features.shape
+        basis = np.zeros((min(k, dim), dim))
+        residual = weights ** 2  # S_ii = 1
+        projection = np.empty(n, dtype=np.float32)
+        selected, gains = [], []
+        rank = 0
+        # Projections are float32, so residuals carry float32 round-off
+        tolerance = max(self.epsilon, 100 * np.finfo(np.float32).eps * float(residual.max()))
+
+        j = int(np.argmax(residual))
+        while len(selected) < k and residual[j] > tolerance:
+            selected.append(j)
+            gains.append(np.log(residual[j]))
+            if len(selected) == k:
+                break
+
+            direction = features[j].astype(np.float64)
+            # Classical Gram-Schmidt twice keeps the basis orthogonal in float32 data
+            for _ in range(2):
+                direction -= basis[:rank].T @ (basis[:rank] @ direction)
+            norm = np.linalg.norm(direction)
+            if rank < len(basis) and norm > 1e-6:
+                basis[rank] = direction / norm
+                for start in range(0, n, LOW_RANK_CHUNK):
+                    stop = start + LOW_RANK_CHUNK
+                    projection[start:stop] = features[start:stop] @ basis[rank].astype(np.float32)
+                rank += 1
+                residual = residual - (weights * projection) ** 2
+
+            residual[selected] = -np.inf
+            j = int(np.argmax(residual))
+
+        return self._fill_by_quality(selected, gains, weights, k)
+
+    @staticmethod
+    def _fill_by_quality(selected: List[int], gains: List[float], weights: np.ndarray, k: int) -> Tuple[List[int], List[float]]:
+        """Top up an exhausted selection with the best remaining quality"""
+        if len(selected) < k:
+            logger.info(f"DPP exhausted after {len(selected)} picks, filling {k - len(selected)} by quality")
+            remaining = np.setdiff1d(np.arange(len(weights)), selected)
+            fill = remaining[np.argsort(-weights[remaining], kind='stable')[:k - len(selected)]]
+            selected.extend(fill.tolist())
+            gains.extend([None] * len(fill))
+
+        return selected, gains
+
+    def _dense_features(
+        self,
+        attributes: sparse.csr_matrix,
+        embeddings: Optional[np.ndarray],
+        row_scale: np.ndarray
+    ) -> np.ndarray:
+        """
+        Unit-norm blended feature rows F (F F^T = S off the diagonal) as
+        float32, densified in row chunks
+        """
+        embedding_share = self._embedding_share(embeddings)
+        n, n_attributes = attributes.shape
+        dim = n_attributes + (0 if embeddings is None else embeddings.shape[1])
+        features = np.empty((n, dim), dtype=np.float32)
+
+        attribute_scale = np.sqrt(1 - embedding_share)
+        embedding_scale = np.sqrt(embedding_share)
+        for start in range(0, n, LOW_RANK_CHUNK):
+            stop = min(start + LOW_RANK_CHUNK, n)
+            scale = row_scale[start:stop, None]
+            features[start:stop, :n_attributes] = attribute_scale * scale * attributes[start:stop].toarray()
+            if embeddings is not None:
+                features[start:stop, n_attributes:] = embedding_scale * scale * embeddings[start:stop]
+
+        return features
+
+    def _similarity_row(
+        self,
+        attributes: sparse.csr_matrix,
+        embeddings: Optional[np.ndarray],
+        row_scale: np.ndarray,
+        j: int
+    ) -> np.ndarray:
+        """Row j of S"""
+        row = (1 - self._embedding_share(embeddings)) * (attributes @ attributes[j].toarray().ravel())
+        if embeddings is not None:
+            row += self.embedding_weight * (embeddings @ embeddings[j])
+        row *= row_scale * row_scale[j]
+        row[j] = 1.0
+        return row
+
+    def _embedding_share(self, embeddings: Optional[np.ndarray]) -> float:
+        return 0.0 if embeddings is None else self.embedding_weight
+
+    def _feature_blocks(self, images: List[Dict[str, Any]], vocabulary: Optional[Dict[Tuple[str, str], int]] = None):
+        """
+        Unit-norm attribute and embedding blocks plus the per-row scale
+        that makes each candidate's blended feature vector unit length
+
+        vocabulary maps (field, value) to a column and is extended in place,
+        so batches encoded with the same dict share columns.
+
+        Returns:
+            (attributes, embeddings or None, row_scale, presence, columns)
+            where presence is the 0/1 value matrix (including coverage-only
+            fields) and columns names the (field, value) of each column
+        """
+        fields = list(self.feature_weights) + [f for f in COVERAGE_FIELDS if f not in self.feature_weights]
+        field_scale = {field: np.sqrt(self.feature_weights.get(field, 0.0)) for field in fields}
+        field_scale[UNKNOWN_FEATURE[0]] = 1.0
+        vocabulary = {} if vocabulary is None else vocabulary
+        rows, cols = [], []
+
+        embeddings = embedding_matrix(images)
+        embedding_share = self._embedding_share(embeddings)
+        has_embedding = np.zeros(len(images), dtype=bool)
+        if embeddings is not None and embedding_share > 0:
+            has_embedding = np.linalg.norm(embeddings, axis=1) > 0
+
+        for i, image in enumerate(images):
+            specs = self._specs(image)
+            described = has_embedding[i]
+            for field in fields:
+                for value in self._values(specs, field):
+                    rows.append(i)
+                    cols.append(vocabulary.setdefault((field, value), len(vocabulary)))
+                    described = described or field_scale[field] > 0
+            if not described:
+                rows.append(i)
+                cols.append(vocabulary.setdefault(UNKNOWN_FEATURE, len(vocabulary)))
+
+        columns = list(vocabulary)
+        presence = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(len(images), len(columns)))
+        presence.sum_duplicates()
+        presence.data[:] = 1.0
+
+        attributes = presence @ sparse.diags(np.array([field_scale[field] for field, _ in columns]))
+        attribute_norms = np.sqrt(np.asarray(attributes.multiply(attributes).sum(axis=1)).ravel())
+        has_attributes = attribute_norms > 0
+        attributes = sparse.diags(np.where(has_attributes, 1 / np.maximum(attribute_norms, 1e-12), 0.0)) @ attributes
+
+        squared_norm = (1 - embedding_share) * has_attributes + embedding_share * has_embedding
+        row_scale = np.where(squared_norm > 0, 1 / np.sqrt(np.maximum(squared_norm, 1e-12)), 0.0)
+        return attributes.tocsr(), embeddings, row_scale, presence, columns
+
+    @staticmethod
+    def _specs(image: Dict[str, Any]) -> Dict[str, Any]:
+        return (
+            image.get('vltSpecs')
+            or (image.get('validation') or {}).get('vltSpecs')
+            or image.get('vlt_spec')
+            or image.get('attributes')
+            or {}
+        )
+
+    @staticmethod
+    def _values(specs: Dict[str, Any], field: str) -> List[str]:
+        """Normalized values of a spec field; lists give one value per item"""
+        value = specs.get(field)
+        if value is None and field == 'color':
+            value = (specs.get('colors') or {}).get('primary')
+        if value is None:
+            return []
+        if isinstance(value, str):
+            value = value.strip().lower()
+            return [value] if value else []
+        items = value if isinstance(value, (list, tuple)) else [value]
+        return [str(item).strip().lower() for item in items if item is not None and str(item).strip()]
+
+    @staticmethod
+    def _quality(image: Dict[str, Any]) -> float:
+        """Quality in (0, 1]; scores above 1 are read as percentages"""
+        score = image.get('quality_score', image.get('qualityScore'))
+        if score is None:
+            score = (image.get('validation') or {}).get('overallScore')
+        if score is None:
+            return DEFAULT_QUALITY
+        score = float(score)
+        if score > 1:
+            score /= 100
+        return min(max(score, 1e-3), 1.0)
+
+    def _diversity_score(
+        self,
+        attributes: sparse.csr_matrix,
+        embeddings: Optional[np.ndarray],
+        row_scale: np.ndarray,
+        selected: List[int]
+    ) -> float:
+        """1 - mean pairwise similarity of the selection"""
+        if len(selected) < 2:
+            return 1.0 if selected else 0.0
+
+        index = np.asarray(selected)
+        block = (1 - self._embedding_share(embeddings)) * (attributes[index] @ attributes[index].T).toarray()
+        if embeddings is not None:
+            block += self.embedding_weight * (embeddings[index] @ embeddings[index].T)
+        block *= np.outer(row_scale[index], row_scale[index])
+
+        m = len(index)
+        mean_similarity = (block.sum() - np.trace(block)) / (m * (m - 1))
+        return float(np.clip(1 - mean_similarity, 0.0, 1.0))
+
+    @staticmethod
+    def _coverage(presence: sparse.csr_matrix, columns: List[Tuple[str, str]], selected: List[int]) -> Dict[str, Any]:
+        """Distinct attribute values among all candidates and how many the selection covers"""
+        covered_columns = set(presence[np.asarray(selected, dtype=int)].indices.tolist())
+        coverage = {}
+
+        for field in COVERAGE_FIELDS:
+            field_columns = [c for c, (name, _) in enumerate(columns) if name == field]
+            covered_values = sorted(columns[c][1] for c in field_columns if c in covered_columns)
+
+            coverage[field] = {
+                'total': len(field_columns),
+                'covered': len(covered_values),
+                'coverage': len(covered_values) / len(field_columns) if field_columns else 0.0,
+                'values': covered_values
+            }
+
+        fields_with_values = [entry['coverage'] for entry in coverage.values() if entry['total']]
+        coverage['overall'] = float(np.mean(fields_with_values)) if fields_with_values else 0.0
+        return coverage
+
+    def open_session(
+        self,
+        target_count: int,
+        diversity_weight: float = 0.7,
+        quality_weight: float = 0.3
+    ) -> str:
+        """Start a streaming selection session and return its id"""
+        session = StreamingDPPSession(self, target_count, diversity_weight, quality_weight)
+        session_id = uuid.uuid4().hex
+        self._sessions.put(session_id, session)
+        logger.info(f"Opened DPP session {session_id} for {target_count} images")
+        return session_id
+
+    def add_candidates(self, session_id: str, images: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Stream a batch of candidates into a session"""
+        session = self._session(session_id)
+        result = session.add(images)
+        self._sessions.put(session_id, session)
+        return result
+
+    def session_selection(self, session_id: str) -> Dict[str, Any]:
+        """Current selection of a session"""
+        return self._session(session_id).selection()
+
+    def close_session(self, session_id: str) -> Dict[str, Any]:
+        """Final selection of a session, which is then discarded"""
+        selection = self._session(session_id).selection()
+        self._sessions.pop(session_id)
+        return selection
+
+    def _session(self, session_id: str) -> 'StreamingDPPSession':
+        session = self._sessions.get(session_id)
+        if session is None:
+            raise KeyError(f"No DPP session {session_id}")
+        return session
+
+    @staticmethod
+    def _check_mode(mode: str) -> str:
+        if mode not in KERNEL_MODES:
+            raise ValueError(f"kernel_mode must be one of {KERNEL_MODES}, got {mode!r}")
+        return mode
+
+    def is_ready(self) -> bool:
+        """Check if service is ready"""
+        return True
+
+
+class StreamingDPPSession:
+    """
+    Running diverse selection over candidates that arrive in batches
+
+    Holds at most target_count images (slots) with the inverse of their
+    kernel L_Y and log det L_Y. A candidate x takes a free slot if it adds
+    volume (d^2 = L_xx - l^T L_Y^-1 l > epsilon). Once full, swapping x in
+    for member i scales det L_Y by d^2 (L_Y^-1)_ii + (L_Y^-1 l)_i^2; the
+    best swap is made if it gains more than swap_threshold. Both updates
+    are O(k^2), and nothing but the selection is kept per candidate.
+    """
+
+    def __init__(
+        self,
+        selector: DPPSelector,
+        target_count: int,
+        diversity_weight: float = 0.7,
+        quality_weight: float = 0.3,
+        swap_threshold: float = 1e-3,
+        refresh_every: int = 256
+    ):
+        if target_count <= 0:
+            raise ValueError("target_count must be positive")
+        if diversity_weight <= 0 or quality_weight < 0:
+            raise ValueError("Streaming selection needs diversity_weight > 0 and quality_weight >= 0")
+
+        self.selector = selector
+        self.target_count = target_count
+        self.exponent = quality_weight / diversity_weight
+        # Minimum relative det L_Y increase for a swap, so near-ties don't churn the set
+        self.swap_threshold = swap_threshold
+        # Rebuild L_Y^-1 from scratch after this many updates to bound round-off drift
+        self.refresh_every = refresh_every
+
+        self.images: List[Dict[str, Any]] = []
+        self.vocabulary: Dict[Tuple[str, str], int] = {}
+        self.log_det = 0.0
+        self.n_seen = 0
+        self.n_swaps = 0
+
+        # Per slot: blended feature rows (attribute and embedding blocks), value presence, kernel weight
+        self._attributes = np.zeros((target_count, 0))
+        self._embeddings = np.zeros((target_count, 0))
+        self._presence = np.zeros((target_count, 0), dtype=bool)
+        self._weights = np.zeros(target_count)
+        self._inverse = np.zeros((0, 0))
+        self._updates = 0
+        self._lock = threading.Lock()
+
+    @property
+    def n_selected(self) -> int:
+        return len(self.images)
+
+    def add(self, images: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Stream candidates through the selection in order
+
+        Returns:
+            Dict with 'added' (filled free slots), 'swapped', 'rejected'
+            and the session counters
+        """
+        with self._lock:
+            added = swapped = 0
+            if images:
+                attributes, embeddings, row_scale, presence, _ = self.selector._feature_blocks(images, self.vocabulary)
+                features = self.selector._dense_features(attributes, embeddings, row_scale).astype(np.float64)
+                batch_attributes, batch_embeddings = features[:, :attributes.shape[1]], features[:, attributes.shape[1]:]
+                batch_embeddings = self._grow(attributes.shape[1], batch_embeddings)
+                presence = presence.toarray().astype(bool)
+                weights = np.array([self.selector._quality(image) for image in images]) ** self.exponent
+
+                # Similarity of every slot to every batch candidate; a slot's row is redone when it changes
+                similarity = np.zeros((self.target_count, len(images)))
+                n = self.n_selected
+                similarity[:n] = self._attributes[:n] @ batch_attributes.T + self._embeddings[:n] @ batch_embeddings.T
+
+                for t, image in enumerate(images):
+                    slot = self._offer(similarity[:self.n_selected, t], weights[t])
+                    if slot is None:
+                        continue
+                    if slot == self.n_selected:
+                        self.images.append(image)
+                        added += 1
+                    else:
+                        self.images[slot] = image
+                        swapped += 1
+                    self._attributes[slot] = batch_attributes[t]
+                    self._embeddings[slot] = batch_embeddings[t]
+                    self._presence[slot] = presence[t]
+                    self._weights[slot] = weights[t]
+                    similarity[slot] = batch_attributes @ batch_attributes[t] + batch_embeddings @ batch_embeddings[t]
+                    self._count_update()
+
+            self.n_seen += len(images)
+            self.n_swaps += swapped
+            return {
+                'added': added,
+                'swapped': swapped,
+                'rejected': len(images) - added - swapped,
+                'n_seen': self.n_seen,
+                'n_selected': self.n_selected,
+                'log_det': self.log_det
+            }
+
+    def _offer(self, similarity: np.ndarray, weight: float) -> Optional[int]:
+        """Slot the candidate goes into (len(images) to append), or None; updates L_Y^-1 and log det"""
+        n = self.n_selected
+        kernel_row = self._weights[:n] * similarity * weight
+        diagonal = weight ** 2  # S_xx = 1
+        projected = self._inverse @ kernel_row
+        residual = diagonal - kernel_row @ projected
+
+        if n < self.target_count:
+            if residual <= self.selector.epsilon:
+                return None
+            self._inverse = self._extend(self._inverse, kernel_row, diagonal)
+            self.log_det += float(np.log(residual))
+            return n
+
+        ratios = max(residual, 0.0) * np.diag(self._inverse) + projected ** 2
+        slot = int(np.argmax(ratios))
+        if ratios[slot] <= 1 + self.swap_threshold:
+            return None
+
+        # Drop the slot's member (Schur complement), add the candidate last, then move it into the slot
+        rest = np.r_[0:slot, slot + 1:n]
+        pivot = self._inverse[slot, rest]
+        reduced = self._inverse[np.ix_(rest, rest)] - np.outer(pivot, pivot) / self._inverse[slot, slot]
+        extended = self._extend(reduced, kernel_row[rest], diagonal)
+        order = np.r_[0:slot, n - 1, slot:n - 1]
+        self._inverse = extended[np.ix_(order, order)]
+        self.log_det += float(np.log(ratios[slot]))
+        return slot
+
+    @staticmethod
+    def _extend(inverse: np.ndarray, kernel_row: np.ndarray, diagonal: float) -> np.ndarray:
+        """Inverse of [[L, l], [l^T, c]] from L^-1 (block inversion)"""
+        projected = inverse @ kernel_row
+        residual = diagonal - kernel_row @ projected
+        n = len(kernel_row)
+        extended = np.empty((n + 1, n + 1))
+        extended[:n, :n] = inverse + np.outer(projected, projected) / residual
+        extended[:n, n] = extended[n, :n] = -projected / residual
+        extended[n, n] = 1 / residual
+        return extended
+
+    def _count_update(self):
+        """Called once the changed slot is stored, so a refresh sees the new set"""
+        self._updates += 1
+        if self._updates % self.refresh_every == 0:
+            kernel = self._kernel()
+            self._inverse = np.linalg.inv(kernel)
+            self.log_det = float(np.linalg.slogdet(kernel)[1])
+
+    def _similarity(self) -> np.ndarray:
+        n = self.n_selected
+        similarity = self._attributes[:n] @ self._attributes[:n].T + self._embeddings[:n] @ self._embeddings[:n].T
+        np.fill_diagonal(similarity, 1.0)
+        return similarity
+
+    def _kernel(self) -> np.ndarray:
+        weights = self._weights[:self.n_selected]
+        return np.outer(weights, weights) * self._similarity()
+
+    def _grow(self, n_attributes: int, batch_embeddings: np.ndarray) -> np.ndarray:
+        """Widen slot storage to the vocabulary and embedding size; returns batch embeddings in session width"""
+        if n_attributes > self._attributes.shape[1]:
+            extra = n_attributes - self._attributes.shape[1]
+            self._attributes = np.pad(self._attributes, ((0, 0), (0, extra)))
+            self._presence = np.pad(self._presence, ((0, 0), (0, extra)))
+
+        dim, batch_dim = self._embeddings.shape[1], batch_embeddings.shape[1]
+        if batch_dim and not dim:
+            self._embeddings = np.zeros((self.target_count, batch_dim))
+        elif batch_dim and batch_dim != dim:
+            raise ValueError(f"Batch has {batch_dim}-dim embeddings, session uses {dim}")
+        elif not batch_dim and dim:
+            batch_embeddings = np.zeros((len(batch_embeddings), dim))
+        return batch_embeddings
+
+    def selection(self) -> Dict[str, Any]:
+        """
+        Current selection, largest leave-one-out gain first
+
+        Each image's marginal_gain is log det L_Y - log det L_{Y - i},
+        i.e. -log (L_Y^-1)_ii.
+        """
+        with self._lock:
+            n = self.n_selected
+            gains = -np.log(np.diag(self._inverse)) if n else np.zeros(0)
+            order = np.argsort(-gains, kind='stable')
+
+            similarity = self._similarity()
+            diversity_score = 1.0 - (similarity.sum() - n) / (n * (n - 1)) if n > 1 else float(n == 1)
+            presence = sparse.csr_matrix(self._presence[:n])
+            coverage = self.selector._coverage(presence, list(self.vocabulary), list(range(n)))
+
+            return {
+                'selected': [
+                    {**self.images[i], 'selection_rank': rank, 'marginal_gain': float(gains[i])}
+                    for rank, i in enumerate(order)
+                ],
+                'diversity_score': float(np.clip(diversity_score, 0.0, 1.0)),
+                'coverage': coverage,
+                'log_det': self.log_det,
+                'n_seen': self.n_seen,
+                'n_selected': n,
+                'n_swaps': self.n_swaps
+            }
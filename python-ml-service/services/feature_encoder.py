@@ -0,0 +1,337 @@
+"""
+Columnar one-hot encoding of VLT records
+Turns categorical VLT fields into a sparse CSR feature matrix in a single pass
+"""
+import numpy as np
+from scipy import sparse
+import base64
+import logging
+from typing import List, Dict, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+# (feature key, VLT record section, key within section)
+CATEGORICAL_FIELDS = [
+    ('silhouette', 'attributes', 'silhouette'),
+    ('neckline', 'attributes', 'neckline'),
+    ('sleeveLength', 'attributes', 'sleeveLength'),
+    ('length', 'attributes', 'length'),
+    ('waistline', 'attributes', 'waistline'),
+    ('fabrication', 'attributes', 'fabrication'),
+    ('primary_color', 'colors', 'primary'),
+    ('finish', 'colors', 'finish'),
+    ('overall', 'style', 'overall'),
+    ('formality', 'style', 'formality'),
+    ('aesthetic', 'style', 'aesthetic'),
+    ('mood', 'style', 'mood'),
+]
+
+
+class CategoricalEncoder:
+    """
+    Sparse one-hot encoder for VLT categorical fields
+
+    Records are read once into per-field value columns, each column is
+    factorized into int32 codes and the codes are assembled directly into
+    a CSR matrix. Columns are grouped by field in CATEGORICAL_FIELDS order,
+    with values sorted within each field. Values added later through
+    transform(extend=True) are appended after the fitted columns.
+    """
+
+    # Batches up to this size skip factorization and look values up directly
+    LOOKUP_BATCH_SIZE = 16
+
+    def __init__(self, fields: List[Tuple[str, str, str]] = None):
+        self.fields = list(fields or CATEGORICAL_FIELDS)
+
+        # key -> {value: column index}
+        self.vocabulary: Dict[str, Dict[str, int]] = {}
+        self.n_features = 0
+
+    @property
+    def feature_names(self) -> List[str]:
+        """Feature names ordered by column index"""
+        names = [None] * self.n_features
+        for key, values in self.vocabulary.items():
+            for value, column in values.items():
+                names[column] = f"{key}_{value}"
+        return names
+
+    def fit(self, vlt_records: List[Dict[str, Any]]) -> 'CategoricalEncoder':
+        """Build the vocabulary from records"""
+        self.fit_transform(vlt_records)
+        return self
+
+    def fit_transform(self, vlt_records: List[Dict[str, Any]]) -> sparse.csr_matrix:
+        """Build the vocabulary and encode records in one pass"""
+        columns = self._read_columns(vlt_records)
+
+        self.vocabulary = {}
+        offset = 0
+        row_blocks, col_blocks = [], []
+
+        for key, (rows, values) in columns.items():
+            if len(values) == 0:
+                continue
+
+            uniques, codes = np.unique(values, return_inverse=True)
+            self.vocabulary[key] = {str(v): offset + i for i, v in enumerate(uniques)}
+
+            row_blocks.append(rows)
+            col_blocks.append(codes.astype(np.int32) + offset)
+            offset += len(uniques)
+
+        self.n_features = offset
+        return self._build_matrix(len(vlt_records), row_blocks, col_blocks)
+
+    def transform(self, vlt_records: List[Dict[str, Any]], extend: bool = False) -> sparse.csr_matrix:
+        """
+        Encode records against the fitted vocabulary
+
+        Unseen values are dropped, or appended as new columns when extend is
+        set. Existing column indices never move, so a model fitted on the
+        first n_features columns can keep consuming the leading block.
+        """
+        if not extend and len(vlt_records) <= self.LOOKUP_BATCH_SIZE:
+            return self._lookup_transform(vlt_records)
+
+        columns = self._read_columns(vlt_records)
+        row_blocks, col_blocks = [], []
+
+        for key, (rows, values) in columns.items():
+            if len(values) == 0:
+                continue
+
+            uniques, inverse = np.unique(values, return_inverse=True)
+            lookup = self.vocabulary.setdefault(key, {}) if extend else self.vocabulary.get(key, {})
+
+            unique_codes = np.empty(len(uniques), dtype=np.int32)
+            for i, value in enumerate(uniques):
+                value = str(value)
+                if value not in lookup and extend:
+                    lookup[value] = self.n_features
+                    self.n_features += 1
+                unique_codes[i] = lookup.get(value, -1)
+
+            codes = unique_codes[inverse]
+            known = codes >= 0
+            row_blocks.append(rows[known])
+            col_blocks.append(codes[known])
+
+        return self._build_matrix(len(vlt_records), row_blocks, col_blocks)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serializable vocabulary state"""
+        return {
+            'fields': [list(field) for field in self.fields],
+            'vocabulary': {key: dict(values) for key, values in self.vocabulary.items()},
+            'n_features': self.n_features
+        }
+
+    @classmethod
+    def from_dict(cls, state: Dict[str, Any]) -> 'CategoricalEncoder':
+        """Restore an encoder saved with to_dict"""
+        encoder = cls([tuple(field) for field in state['fields']])
+        encoder.vocabulary = {key: dict(values) for key, values in state['vocabulary'].items()}
+        encoder.n_features = int(state['n_features'])
+        return encoder
+
+    def _lookup_transform(self, vlt_records: List[Dict[str, Any]]) -> sparse.csr_matrix:
+        """Encode a few records row by row; per-field np.unique costs more than it saves here"""
+        indices, indptr = [], [0]
+
+        for record in vlt_records:
+            for key, section, source_key in self.fields:
+                value = (record.get(section) or {}).get(source_key)
+                if value is None:
+                    continue
+                column = self.vocabulary.get(key, {}).get(str(value))
+                if column is not None:
+                    indices.append(column)
+            indptr.append(len(indices))
+
+        return sparse.csr_matrix(
+            (np.ones(len(indices)), np.asarray(indices, dtype=np.int32), np.asarray(indptr, dtype=np.int32)),
+            shape=(len(vlt_records), self.n_features)
+        )
+
+    def _read_columns(self, vlt_records: List[Dict[str, Any]]) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+        """
+        Read records into per-field (row index, value) columns
+        Missing and null values are skipped
+        """
+        rows = {key: [] for key, _, _ in self.fields}
+        values = {key: [] for key, _, _ in self.fields}
+
+        for i, record in enumerate(vlt_records):
+            for key, section, source_key in self.fields:
+                value = (record.get(section) or {}).get(source_key)
+                if value is None:
+                    continue
+                rows[key].append(i)
+                values[key].append(str(value))
+
+        return {
+            key: (np.asarray(rows[key], dtype=np.int32), np.asarray(values[key], dtype=str))
+            for key, _, _ in self.fields
+        }
+
+    def _build_matrix(
+        self,
+        n_records: int,
+        row_blocks: List[np.ndarray],
+        col_blocks: List[np.ndarray]
+    ) -> sparse.csr_matrix:
+        """Assemble row/column code blocks into a CSR one-hot matrix"""
+        if row_blocks:
+            rows = np.concatenate(row_blocks)
+            cols = np.concatenate(col_blocks)
+        else:
+            rows = np.empty(0, dtype=np.int32)
+            cols = np.empty(0, dtype=np.int32)
+
+        data = np.ones(len(rows), dtype=np.float64)
+        return sparse.csr_matrix((data, (rows, cols)), shape=(n_records, self.n_features))
+
+
+class AttributeEncoder:
+    """
+    Open-vocabulary sparse encoding of every descriptive VLT value
+
+    Columns are (attribute, value) pairs named the way cluster summaries
+    report them: attribute keys as-is, 'color' for the primary color and
+    'style_{key}' for style keys. Values keep their original type. Used to
+    count attribute values per cluster with a single sparse product.
+    """
+
+    def __init__(self):
+        # (attribute, value) -> column index, in first-seen order
+        self.columns: Dict[Tuple[str, Any], int] = {}
+        self.attributes: List[str] = []
+        self.values: List[Any] = []
+        self._attribute_codes: Dict[str, int] = {}
+        self._column_attribute: List[int] = []
+
+    @property
+    def n_features(self) -> int:
+        return len(self.values)
+
+    def transform(self, vlt_records: List[Dict[str, Any]], extend: bool = True) -> sparse.csr_matrix:
+        """Encode records, adding unseen (attribute, value) pairs as new columns when extend is set"""
+        rows, cols = [], []
+
+        for i, record in enumerate(vlt_records):
+            for pair in self._iter_pairs(record):
+                column = self.columns.get(pair)
+                if column is None:
+                    if not extend:
+                        continue
+                    column = self._add_column(pair)
+                rows.append(i)
+                cols.append(column)
+
+        data = np.ones(len(rows), dtype=np.float64)
+        return sparse.csr_matrix(
+            (data, (np.asarray(rows, dtype=np.int32), np.asarray(cols, dtype=np.int32))),
+            shape=(len(vlt_records), self.n_features)
+        )
+
+    def counts_by_attribute(self, counts: np.ndarray) -> Dict[str, Dict[Any, int]]:
+        """Nested {attribute: {value: count}} for the non-zero entries of a count row"""
+        nested = {}
+        for column in np.flatnonzero(counts):
+            nested.setdefault(self.attributes[column], {})[self.values[column]] = int(counts[column])
+        return nested
+
+    def dominant(self, counts: np.ndarray) -> Dict[str, tuple]:
+        """
+        Most common value per attribute from a count row
+        Ties go to the value seen first
+        """
+        columns = np.flatnonzero(counts)
+        if len(columns) == 0:
+            return {}
+
+        attribute_codes = np.asarray(self._column_attribute, dtype=np.int32)[columns]
+        order = np.lexsort((columns, -counts[columns], attribute_codes))
+        first_of_group = np.ones(len(order), dtype=bool)
+        first_of_group[1:] = attribute_codes[order][1:] != attribute_codes[order][:-1]
+
+        return {
+            self.attributes[column]: (self.values[column], int(counts[column]))
+            for column in columns[order[first_of_group]]
+        }
+
+    def _add_column(self, pair: Tuple[str, Any]) -> int:
+        column = len(self.values)
+        self.columns[pair] = column
+        attribute, value = pair
+        self.attributes.append(attribute)
+        self.values.append(value)
+        self._column_attribute.append(self._attribute_codes.setdefault(attribute, len(self._attribute_codes)))
+        return column
+
+    @staticmethod
+    def _iter_pairs(record: Dict[str, Any]):
+        """(attribute, value) pairs of a record, as cluster summaries name them"""
+        for key, value in (record.get('attributes') or {}).items():
+            yield key, _hashable(value)
+
+        colors = record.get('colors') or {}
+        if 'primary' in colors:
+            yield 'color', _hashable(colors['primary'])
+
+        for key, value in (record.get('style') or {}).items():
+            yield f'style_{key}', _hashable(value)
+
+
+def _hashable(value: Any) -> Any:
+    """Lists and dicts cannot key a vocabulary; fall back to their string form"""
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        return str(value)
+
+
+def decode_embedding(value: Any) -> np.ndarray:
+    """float32 vector from a list of floats or a base64 packed little-endian float32 buffer"""
+    if isinstance(value, (str, bytes)):
+        return np.frombuffer(base64.b64decode(value), dtype='<f4').astype(np.float32)
+    return np.asarray(value, dtype=np.float32)
+
+
+def embedding_matrix(vlt_records: List[Dict[str, Any]], dim: Optional[int] = None) -> Optional[np.ndarray]:
+    """
+    L2-normalized (n_records, dim) float32 matrix of record embeddings
+
+    Records without an embedding get a zero row. dim defaults to the first
+    embedding found; without dim and without any embedding, returns None.
+
+    Raises:
+        ValueError: An embedding does not have dim values
+    """
+    vectors = {}
+    for i, record in enumerate(vlt_records):
+        value = record.get('embedding')
+        if value is None:
+            continue
+        vector = decode_embedding(value)
+        if dim is None:
+            dim = len(vector)
+        if len(vector) != dim:
+            raise ValueError(f"Record {i} has a {len(vector)}-dim embedding, expected {dim}")
+        vectors[i] = vector
+
+    if dim is None:
+        return None
+
+    matrix = np.zeros((len(vlt_records), dim), dtype=np.float32)
+    if vectors:
+        rows = np.fromiter(vectors.keys(), dtype=np.intp, count=len(vectors))
+        matrix[rows] = np.stack(list(vectors.values()))
+        norms = np.linalg.norm(matrix[rows], axis=1, keepdims=True)
+        matrix[rows] /= np.maximum(norms, np.finfo(np.float32).tiny)
+
+    return matrix
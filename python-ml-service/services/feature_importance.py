@@ -0,0 +1,82 @@
+"""
+Closed-form feature importance for style clusters
+Scores one-hot features from the cluster x feature frequency matrix instead of
+training a classifier on the cluster labels
+"""
+import numpy as np
+from scipy import sparse
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def cluster_value_counts(labels: np.ndarray, features, n_clusters: int) -> np.ndarray:
+    """
+    Count feature occurrences per cluster with one sparse product
+
+    Args:
+        labels: (n_samples,) cluster label per record
+        features: (n_samples, n_features) one-hot matrix, sparse or dense
+        n_clusters: Number of clusters
+
+    Returns:
+        (n_clusters, n_features) dense count matrix
+    """
+    n_samples = len(labels)
+    indicator = sparse.csr_matrix(
+        (np.ones(n_samples), (np.arange(n_samples), labels)),
+        shape=(n_samples, n_clusters)
+    )
+    counts = indicator.T @ features
+    return counts.toarray() if sparse.issparse(counts) else np.asarray(counts)
+
+
+def mutual_information(counts: np.ndarray, cluster_sizes: np.ndarray) -> np.ndarray:
+    """
+    Mutual information between each binary feature and the cluster label
+
+    Args:
+        counts: (n_clusters, n_features) records per cluster with the feature set
+        cluster_sizes: (n_clusters,) records per cluster
+
+    Returns:
+        (n_features,) mutual information in nats
+    """
+    n = cluster_sizes.sum()
+    p_cluster = (cluster_sizes / n)[:, np.newaxis]
+
+    # Joint distribution over (feature on/off, cluster)
+    joint_on = counts / n
+    joint_off = (cluster_sizes[:, np.newaxis] - counts) / n
+    p_on = joint_on.sum(axis=0)
+    p_off = 1.0 - p_on
+
+    def _term(joint, marginal):
+        expected = p_cluster * marginal
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = np.where(joint > 0, joint / expected, 1.0)
+        return (joint * np.log(ratio)).sum(axis=0)
+
+    return _term(joint_on, p_on) + _term(joint_off, p_off)
+
+
+def centroid_contrast(counts: np.ndarray, cluster_sizes: np.ndarray) -> np.ndarray:
+    """
+    Size-weighted spread of per-cluster feature frequencies around the global frequency
+
+    Normalized by the feature's Bernoulli variance, which makes it the
+    correlation ratio (eta squared) between feature and cluster label.
+
+    Returns:
+        (n_features,) contrast in [0, 1]
+    """
+    n = cluster_sizes.sum()
+    weights = (cluster_sizes / n)[:, np.newaxis]
+    frequencies = counts / np.maximum(cluster_sizes, 1)[:, np.newaxis]
+    overall = counts.sum(axis=0) / n
+
+    between = (weights * (frequencies - overall) ** 2).sum(axis=0)
+    variance = overall * (1.0 - overall)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(variance > 0, between / variance, 0.0)
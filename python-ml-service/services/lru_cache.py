@@ -0,0 +1,151 @@
+"""
+Size-bounded LRU cache with TTL and approximate memory accounting
+"""
+import numpy as np
+import sys
+import time
+import threading
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+def estimate_size(obj: Any, _seen: Optional[set] = None) -> int:
+    """
+    Approximate deep size of an object in bytes
+
+    Follows dicts, sequences and object __dict__s; numpy arrays count their
+    buffer. Shared objects are counted once.
+    """
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+
+    if isinstance(obj, np.ndarray):
+        return sys.getsizeof(obj) + (obj.nbytes if obj.base is None else 0)
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(estimate_size(k, _seen) + estimate_size(v, _seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(estimate_size(item, _seen) for item in obj)
+    elif hasattr(obj, '__dict__') and not isinstance(obj, type):
+        size += estimate_size(vars(obj), _seen)
+    return size
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache bounded by entry count and estimated bytes
+
+    Entries older than ttl seconds are treated as missing. Hits, misses,
+    evictions and expirations are counted for monitoring.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        max_bytes: Optional[int] = None,
+        ttl: Optional[float] = None,
+        sizeof: Callable[[Any], int] = estimate_size
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof
+
+        # key -> (value, size, stored_at)
+        self._entries: 'OrderedDict[Hashable, tuple]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.RLock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+
+            value, _, stored_at = entry
+            if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        size = self.sizeof(value) if self.max_bytes is not None else 0
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            if self.max_bytes is not None and size > self.max_bytes:
+                logger.debug(f"Not caching {key}: {size} bytes exceeds cache limit")
+                return
+
+            self._entries[key] = (value, size, time.monotonic())
+            self._bytes += size
+            self._evict()
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            if key not in self._entries:
+                return default
+            value = self._entries[key][0]
+            self._remove(key)
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _remove(self, key: Hashable):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def _evict(self):
+        """Drop least recently used entries until both limits hold"""
+        while self._entries and (
+            len(self._entries) > self.max_entries
+            or (self.max_bytes is not None and self._bytes > self.max_bytes)
+        ):
+            key = next(iter(self._entries))
+            self._remove(key)
+            self.evictions += 1
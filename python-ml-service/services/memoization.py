@@ -0,0 +1,99 @@
+"""
+Content fingerprints and request coalescing for profile builds
+A fingerprint identifies the record multiset plus build parameters, so a
+repeated create can return the stored profile; SingleFlight makes
+concurrent identical builds share one fit
+"""
+import hashlib
+import json
+import threading
+import logging
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Tuple
+
+from services.feature_encoder import decode_embedding
+
+logger = logging.getLogger(__name__)
+
+# Bump when normalization or the build changes in a way that should
+# invalidate stored fingerprints
+FINGERPRINT_VERSION = 1
+
+_encoder = json.JSONEncoder(sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+
+
+def record_digest(record: Dict[str, Any]) -> bytes:
+    """
+    Digest of one normalized VLT record
+
+    Null values are dropped (the encoder ignores them) and embeddings are
+    compared as float32 bytes, so a list and its base64 form match.
+    """
+    normalized = {}
+    for key, value in record.items():
+        if value is None:
+            continue
+        if key == 'embedding':
+            value = decode_embedding(value).astype('<f4').tobytes().hex()
+        elif isinstance(value, dict):
+            value = {k: v for k, v in value.items() if v is not None}
+        normalized[key] = value
+    return hashlib.blake2b(_encoder.encode(normalized).encode('utf-8'), digest_size=16).digest()
+
+
+def content_fingerprint(digests: Iterable[bytes], params: Dict[str, Any]) -> str:
+    """Hex fingerprint of record digests (order-insensitive) and build parameters"""
+    hasher = hashlib.sha256()
+    hasher.update(_encoder.encode({'version': FINGERPRINT_VERSION, 'params': params}).encode('utf-8'))
+    for digest in sorted(digests):
+        hasher.update(digest)
+    return hasher.hexdigest()
+
+
+def profile_fingerprint(vlt_records: List[Dict[str, Any]], params: Dict[str, Any]) -> str:
+    """Fingerprint of a record set and the parameters it is profiled with"""
+    return content_fingerprint((record_digest(record) for record in vlt_records), params)
+
+
+class SingleFlight:
+    """
+    At most one in-flight call per key
+
+    Callers arriving while a call with the same key runs wait for it and
+    get its result (or exception) instead of running their own.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+
+    def do(self, key: Hashable, func: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Returns:
+            (result, shared) where shared is True if another caller's
+            run produced the result
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+
+        if not leader:
+            return future.result(), True
+
+        try:
+            result = func()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
@@ -0,0 +1,330 @@
+"""
+In-process metrics with Prometheus text exposition
+Counters and histograms for profile builds and HTTP requests, plus a
+per-operation stage timer StyleProfiler uses to break builds down by stage.
+Worker processes drain() what they recorded and the serving process
+merge()s it, so /metrics covers builds run in a process pool too
+"""
+import math
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Seconds; covers sub-millisecond assignments up to multi-minute builds
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+SIZE_BUCKETS = (10, 50, 100, 500, 1000, 5000, 10000, 50000, 100000, 500000)
+CLUSTER_BUCKETS = (1, 2, 3, 4, 5, 6, 8, 10, 12, 16)
+
+
+class _Metric:
+    """Labelled series sharing one name, help text and type"""
+
+    type_name = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _label_text(self, key: Tuple[str, ...], extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = list(zip(self.labelnames, key))
+        if extra is not None:
+            pairs.append(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        with self._lock:
+            series = sorted(self._series.items())
+        for key, value in series:
+            lines.extend(self._render_series(key, value))
+        return lines
+
+    def drain(self) -> Dict[Tuple[str, ...], Any]:
+        """Series recorded so far, leaving this metric empty"""
+        with self._lock:
+            series, self._series = self._series, {}
+        return series
+
+    def merge(self, series: Dict[Tuple[str, ...], Any]):
+        """Add series drained from another process"""
+        with self._lock:
+            for key, value in series.items():
+                self._series[key] = self._combine(self._series.get(key), value)
+
+    @staticmethod
+    def _combine(current: Any, value: Any) -> Any:
+        raise NotImplementedError
+
+    def _render_series(self, key: Tuple[str, ...], value: Any) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonic total per label set"""
+
+    type_name = 'counter'
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._series.get(self._key(labels), 0.0)
+
+    @staticmethod
+    def _combine(current, value):
+        return (current or 0.0) + value
+
+    def _render_series(self, key, value):
+        return [f"{self.name}{self._label_text(key)} {_format(value)}"]
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram per label set"""
+
+    type_name = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets=DURATION_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket (non-cumulative) counts, +Inf last, then sum
+                series = self._series[key] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0}
+            index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+            series['counts'][index] += 1
+            series['sum'] += value
+
+    @staticmethod
+    def _combine(current, value):
+        if current is None:
+            return {'counts': list(value['counts']), 'sum': value['sum']}
+        return {
+            'counts': [a + b for a, b in zip(current['counts'], value['counts'])],
+            'sum': current['sum'] + value['sum']
+        }
+
+    def sums(self) -> Dict[Tuple[str, ...], float]:
+        """Sum of observed values per label set"""
+        with self._lock:
+            return {key: series['sum'] for key, series in self._series.items()}
+
+    def _render_series(self, key, value):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), value['counts']):
+            cumulative += count
+            le = '+Inf' if bound == math.inf else _format(bound)
+            lines.append(f"{self.name}_bucket{self._label_text(key, ('le', le))} {cumulative}")
+        lines.append(f"{self.name}_sum{self._label_text(key)} {_format(value['sum'])}")
+        lines.append(f"{self.name}_count{self._label_text(key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Named metrics rendered together"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets=DURATION_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def drain(self) -> Dict[str, Dict[Tuple[str, ...], Any]]:
+        """Every metric's series recorded so far, by name, resetting them (picklable)"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        drained = {metric.name: metric.drain() for metric in metrics}
+        return {name: series for name, series in drained.items() if series}
+
+    def merge(self, drained: Dict[str, Dict[Tuple[str, ...], Any]]):
+        """Add series drained from another process's registry; unknown metrics are skipped"""
+        for name, series in drained.items():
+            metric = self._metrics.get(name)
+            if metric is not None:
+                metric.merge(series)
+
+    def render(self) -> str:
+        """Prometheus text exposition format 0.0.4"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+PROFILE_OPERATION_SECONDS = REGISTRY.histogram(
+    'style_profile_operation_seconds', 'Wall time of style profile operations', ('operation', 'status')
+)
+PROFILE_STAGE_SECONDS = REGISTRY.histogram(
+    'style_profile_stage_seconds', 'Wall time of style profile build stages', ('operation', 'stage')
+)
+PROFILE_RECORDS = REGISTRY.counter(
+    'style_profile_records_total', 'VLT records processed by style profile operations', ('operation',)
+)
+PROFILE_FEATURES = REGISTRY.histogram(
+    'style_profile_features', 'One-hot feature columns per style profile operation', ('operation',), SIZE_BUCKETS
+)
+PROFILE_CLUSTERS = REGISTRY.histogram(
+    'style_profile_clusters', 'Clusters per style profile operation', ('operation',), CLUSTER_BUCKETS
+)
+PROFILE_MEMO = REGISTRY.counter(
+    'style_profile_memo_total', 'Profile creates by fingerprint outcome (hit, miss, coalesced)', ('result',)
+)
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    'http_request_duration_seconds', 'HTTP request latency by route template', ('method', 'route', 'status')
+)
+
+# Histogram per counted quantity; others are only kept in the summary
+_COUNT_HISTOGRAMS = {'features': PROFILE_FEATURES, 'clusters': PROFILE_CLUSTERS}
+
+_local = threading.local()
+
+
+class StageTimer:
+    """
+    Times one profile operation stage by stage
+
+    Use as a context manager around the operation; stage() blocks inside it,
+    on the same thread and at any call depth, add to it. On exit the stage,
+    total and count values are published to the registry. summary() gives
+    the same numbers as a dict for the profile metadata.
+    """
+
+    def __init__(self, operation: str):
+        self.operation = operation
+        self.stages: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+        self._started = None
+        self._parent = None
+
+    def __enter__(self) -> 'StageTimer':
+        self._parent = getattr(_local, 'timer', None)
+        _local.timer = self
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _local.timer = self._parent
+        total = time.perf_counter() - self._started
+        status = 'error' if exc_type is not None else 'ok'
+
+        PROFILE_OPERATION_SECONDS.observe(total, operation=self.operation, status=status)
+        for stage, seconds in self.stages.items():
+            PROFILE_STAGE_SECONDS.observe(seconds, operation=self.operation, stage=stage)
+        if status == 'ok':
+            if 'records' in self.counts:
+                PROFILE_RECORDS.inc(self.counts['records'], operation=self.operation)
+            for name, histogram in _COUNT_HISTOGRAMS.items():
+                if name in self.counts:
+                    histogram.observe(self.counts[name], operation=self.operation)
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - started
+
+    def count(self, **values: int):
+        self.counts.update({name: int(value) for name, value in values.items()})
+
+    def summary(self) -> Dict[str, Any]:
+        """Stages finished so far, in seconds, and counts"""
+        return {
+            'operation': self.operation,
+            'elapsed_seconds': round(time.perf_counter() - self._started, 6),
+            'stages': {name: round(seconds, 6) for name, seconds in self.stages.items()},
+            'counts': dict(self.counts)
+        }
+
+
+@contextmanager
+def stage(name: str):
+    """Time a block into the active StageTimer of this thread, if any"""
+    timer = getattr(_local, 'timer', None)
+    if timer is None:
+        yield
+        return
+    with timer.stage(name):
+        yield
+
+
+def record_counts(**values: int):
+    """Record counts on the active StageTimer of this thread, if any"""
+    timer = getattr(_local, 'timer', None)
+    if timer is not None:
+        timer.count(**values)
+
+
+def current_timer() -> Optional[StageTimer]:
+    return getattr(_local, 'timer', None)
+
+
+def stage_totals(operation: str) -> Dict[str, float]:
+    """Seconds per stage summed over every finished run of an operation, as exported on /metrics"""
+    return {stage: total for (name, stage), total in PROFILE_STAGE_SECONDS.sums().items() if name == operation}
+
+
+def observe_request(method: str, route: str, status: int, seconds: float):
+    """Record one HTTP request under its route template"""
+    HTTP_REQUEST_SECONDS.observe(seconds, method=method, route=route, status=status)
+
+
+def render() -> str:
+    return REGISTRY.render()
+
+
+def drain() -> Dict[str, Dict[Tuple[str, ...], Any]]:
+    return REGISTRY.drain()
+
+
+def merge(drained: Dict[str, Dict[Tuple[str, ...], Any]]):
+    REGISTRY.merge(drained)
+
+
+def _format(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
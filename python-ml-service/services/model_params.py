@@ -0,0 +1,199 @@
+"""
+Flat parameter encoding for fitted style profile models
+Splits a models artifact into JSON metadata plus named float arrays and
+packs the arrays into one contiguous buffer, so profiles can be stored
+without pickling sklearn objects
+"""
+import numpy as np
+import logging
+from typing import Dict, Any, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Byte alignment of each array inside a packed buffer
+ALIGNMENT = 64
+
+# Dtype of arrays in layouts written before dtypes were recorded
+DEFAULT_DTYPE = '<f4'
+
+
+def models_to_arrays(models: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, np.ndarray]]:
+    """
+    Split a models artifact into metadata and parameter arrays
+
+    Model parameters are stored as float32. The GMM sufficient statistics
+    stay float64: they are running sums that apply_statistics turns back
+    into covariances, and float32 rounding of the sums would shift those
+    covariances after a reload.
+
+    Args:
+        models: Artifact with 'gmm', 'scaler', 'pca', 'vocabulary' and
+            optional 'gmm_stats' / 'attribute_counts' / 'feature_space'
+
+    Returns:
+        (JSON-serializable metadata, {name: float32 or float64 array})
+    """
+    gmm, scaler, pca = models['gmm'], models['scaler'], models['pca']
+
+    arrays = {
+        'gmm.weights': gmm.weights_,
+        'gmm.means': gmm.means_,
+        'gmm.covariances': gmm.covariances_,
+        'gmm.precisions_cholesky': gmm.precisions_cholesky_,
+        'scaler.scale': scaler.scale_,
+        'scaler.var': scaler.var_,
+        'pca.components': pca.components_,
+        'pca.mean': pca.mean_,
+        'pca.explained_variance': pca.explained_variance_,
+        'pca.explained_variance_ratio': pca.explained_variance_ratio_,
+        'pca.singular_values': pca.singular_values_,
+    }
+    if scaler.mean_ is not None:
+        arrays['scaler.mean'] = scaler.mean_
+
+    arrays = {name: np.ascontiguousarray(value, dtype=np.float32) for name, value in arrays.items()}
+    if models.get('gmm_stats') is not None:
+        for key, value in models['gmm_stats'].items():
+            arrays[f'gmm_stats.{key}'] = np.ascontiguousarray(value, dtype=np.float64)
+
+    attribute_counts = models.get('attribute_counts')
+
+    meta = {
+        'gmm': {
+            'n_components': int(gmm.n_components),
+            'covariance_type': gmm.covariance_type,
+            'reg_covar': float(gmm.reg_covar),
+            'max_iter': int(gmm.max_iter),
+            'random_state': gmm.random_state,
+            'n_iter': int(getattr(gmm, 'n_iter_', 0)),
+            'lower_bound': float(getattr(gmm, 'lower_bound_', 0.0)),
+        },
+        'scaler': {
+            'with_mean': bool(scaler.with_mean),
+            'with_std': bool(scaler.with_std),
+            'n_samples_seen': int(np.max(scaler.n_samples_seen_)),
+        },
+        'pca': {
+            'n_components': int(pca.n_components_),
+            'svd_solver': pca.svd_solver,
+            'whiten': bool(pca.whiten),
+            'n_samples': int(pca.n_samples_),
+            'noise_variance': float(pca.noise_variance_),
+        },
+        'vocabulary': models.get('vocabulary'),
+        'feature_space': models.get('feature_space'),
+        # (cluster id, attribute, value, count) rows keep non-string values intact
+        'attribute_counts': None if attribute_counts is None else [
+            [int(cluster_id), attr, value, int(count)]
+            for cluster_id, attrs in attribute_counts.items()
+            for attr, values in attrs.items()
+            for value, count in values.items()
+        ],
+    }
+
+    return meta, arrays
+
+
+def models_from_arrays(meta: Dict[str, Any], arrays: Dict[str, np.ndarray]) -> Dict[str, Any]:
+    """Rebuild a models artifact with fitted sklearn objects from metadata and arrays"""
+    from sklearn.mixture import GaussianMixture
+    from sklearn.preprocessing import StandardScaler
+    from sklearn.decomposition import PCA
+
+    def _array(name):
+        return np.asarray(arrays[name], dtype=np.float64)
+
+    gmm_meta = meta['gmm']
+    gmm = GaussianMixture(
+        n_components=gmm_meta['n_components'],
+        covariance_type=gmm_meta['covariance_type'],
+        reg_covar=gmm_meta['reg_covar'],
+        max_iter=gmm_meta['max_iter'],
+        random_state=gmm_meta['random_state']
+    )
+    gmm.weights_ = _array('gmm.weights')
+    gmm.means_ = _array('gmm.means')
+    gmm.covariances_ = _array('gmm.covariances')
+    gmm.precisions_cholesky_ = _array('gmm.precisions_cholesky')
+    gmm.precisions_ = np.einsum('kij,klj->kil', gmm.precisions_cholesky_, gmm.precisions_cholesky_)
+    gmm.converged_ = True
+    gmm.n_iter_ = gmm_meta['n_iter']
+    gmm.lower_bound_ = gmm_meta['lower_bound']
+    gmm.n_features_in_ = gmm.means_.shape[1]
+
+    scaler_meta = meta['scaler']
+    scaler = StandardScaler(with_mean=scaler_meta['with_mean'], with_std=scaler_meta['with_std'])
+    scaler.scale_ = _array('scaler.scale')
+    scaler.var_ = _array('scaler.var')
+    scaler.mean_ = _array('scaler.mean') if 'scaler.mean' in arrays else None
+    scaler.n_samples_seen_ = scaler_meta['n_samples_seen']
+    scaler.n_features_in_ = scaler.scale_.shape[0]
+
+    pca_meta = meta['pca']
+    pca = PCA(n_components=pca_meta['n_components'], svd_solver=pca_meta['svd_solver'], whiten=pca_meta['whiten'])
+    pca.components_ = _array('pca.components')
+    pca.mean_ = _array('pca.mean')
+    pca.explained_variance_ = _array('pca.explained_variance')
+    pca.explained_variance_ratio_ = _array('pca.explained_variance_ratio')
+    pca.singular_values_ = _array('pca.singular_values')
+    pca.noise_variance_ = pca_meta['noise_variance']
+    pca.n_components_ = pca_meta['n_components']
+    pca.n_samples_ = pca_meta['n_samples']
+    pca.n_features_in_ = pca.components_.shape[1]
+
+    gmm_stats = None
+    if 'gmm_stats.resp_sum' in arrays:
+        gmm_stats = {key: _array(f'gmm_stats.{key}') for key in ('resp_sum', 'x_sum', 'xx_sum')}
+
+    attribute_counts = None
+    if meta.get('attribute_counts') is not None:
+        attribute_counts = {}
+        for cluster_id, attr, value, count in meta['attribute_counts']:
+            attribute_counts.setdefault(cluster_id, {}).setdefault(attr, {})[value] = count
+
+    return {
+        'gmm': gmm,
+        'scaler': scaler,
+        'pca': pca,
+        'vocabulary': meta.get('vocabulary'),
+        'gmm_stats': gmm_stats,
+        'attribute_counts': attribute_counts,
+        'feature_space': meta.get('feature_space')
+    }
+
+
+def pack_arrays(arrays: Dict[str, np.ndarray]) -> Tuple[Dict[str, Any], bytes]:
+    """
+    Pack float32 / float64 arrays into one buffer; other dtypes become float32
+
+    Returns:
+        (layout {name: {'shape', 'offset', 'dtype'}}, buffer)
+    """
+    layout = {}
+    chunks = []
+    offset = 0
+
+    for name, array in arrays.items():
+        padding = -offset % ALIGNMENT
+        if padding:
+            chunks.append(b'\0' * padding)
+            offset += padding
+
+        dtype = '<f8' if array.dtype == np.float64 else '<f4'
+        data = np.ascontiguousarray(array, dtype=dtype).tobytes()
+        layout[name] = {'shape': list(array.shape), 'offset': offset, 'dtype': dtype}
+        chunks.append(data)
+        offset += len(data)
+
+    return layout, b''.join(chunks)
+
+
+def unpack_arrays(layout: Dict[str, Any], buffer) -> Dict[str, np.ndarray]:
+    """Zero-copy views into a buffer produced by pack_arrays"""
+    arrays = {}
+    for name, spec in layout.items():
+        shape = tuple(spec['shape'])
+        count = int(np.prod(shape)) if shape else 1
+        dtype = np.dtype(spec.get('dtype', DEFAULT_DTYPE))
+        arrays[name] = np.frombuffer(buffer, dtype=dtype, count=count, offset=spec['offset']).reshape(shape)
+    return arrays
@@ -0,0 +1,103 @@
+"""
+Incremental EM for full-covariance Gaussian mixtures
+Keeps per-component sufficient statistics so new batches can be folded into
+a fitted GaussianMixture without refitting on the full history
+"""
+import numpy as np
+from scipy import linalg
+import logging
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+
+def sufficient_statistics(X: np.ndarray, resp: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Compute zeroth, first and second order statistics of X under responsibilities
+
+    Args:
+        X: (n_samples, n_features) data in the GMM input space
+        resp: (n_samples, n_components) posterior responsibilities
+
+    Returns:
+        Dict with resp_sum (k,), x_sum (k, d) and xx_sum (k, d, d)
+    """
+    X = np.asarray(X, dtype=np.float64)
+    resp = np.asarray(resp, dtype=np.float64)
+
+    return {
+        'resp_sum': resp.sum(axis=0),
+        'x_sum': resp.T @ X,
+        'xx_sum': np.einsum('nk,ni,nj->kij', resp, X, X, optimize=True)
+    }
+
+
+def statistics_from_model(gmm, n_samples: int) -> Dict[str, np.ndarray]:
+    """
+    Reconstruct accumulated statistics from fitted parameters
+    Used for models saved without accumulators, treating them as fitted on n_samples
+    """
+    resp_sum = gmm.weights_ * n_samples
+    covariances = gmm.covariances_ - gmm.reg_covar * np.eye(gmm.means_.shape[1])
+    second_moments = covariances + np.einsum('ki,kj->kij', gmm.means_, gmm.means_)
+
+    return {
+        'resp_sum': resp_sum,
+        'x_sum': resp_sum[:, np.newaxis] * gmm.means_,
+        'xx_sum': resp_sum[:, np.newaxis, np.newaxis] * second_moments
+    }
+
+
+def merge_statistics(stats: Dict[str, np.ndarray], batch: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """Add batch statistics onto accumulated statistics"""
+    return {key: stats[key] + batch[key] for key in ('resp_sum', 'x_sum', 'xx_sum')}
+
+
+def apply_statistics(gmm, stats: Dict[str, np.ndarray]):
+    """
+    M-step from accumulated statistics
+
+    Overwrites weights, means, covariances and precision factors of a fitted
+    full-covariance GaussianMixture in place.
+    """
+    if gmm.covariance_type != 'full':
+        raise ValueError(f"Online updates only support full covariances, got {gmm.covariance_type}")
+
+    resp_sum = stats['resp_sum'] + 10 * np.finfo(np.float64).eps
+    means = stats['x_sum'] / resp_sum[:, np.newaxis]
+
+    n_features = means.shape[1]
+    covariances = stats['xx_sum'] / resp_sum[:, np.newaxis, np.newaxis]
+    covariances -= np.einsum('ki,kj->kij', means, means)
+    covariances += gmm.reg_covar * np.eye(n_features)
+
+    precisions_cholesky = np.empty_like(covariances)
+    for k, covariance in enumerate(covariances):
+        cov_chol = linalg.cholesky(covariance, lower=True)
+        precisions_cholesky[k] = linalg.solve_triangular(cov_chol, np.eye(n_features), lower=True).T
+
+    gmm.weights_ = resp_sum / resp_sum.sum()
+    gmm.means_ = means
+    gmm.covariances_ = covariances
+    gmm.precisions_cholesky_ = precisions_cholesky
+    gmm.precisions_ = np.einsum('kij,klj->kil', precisions_cholesky, precisions_cholesky)
+
+    return gmm
+
+
+def partial_fit(gmm, X: np.ndarray, stats: Dict[str, np.ndarray]) -> tuple:
+    """
+    One incremental EM step over a new batch
+
+    Args:
+        gmm: Fitted full-covariance GaussianMixture, updated in place
+        X: (n_samples, n_features) new batch in the GMM input space
+        stats: Accumulated statistics from previous batches
+
+    Returns:
+        (responsibilities of the batch under the previous parameters, merged statistics)
+    """
+    resp = gmm.predict_proba(X)
+    stats = merge_statistics(stats, sufficient_statistics(X, resp))
+    apply_statistics(gmm, stats)
+    return resp, stats
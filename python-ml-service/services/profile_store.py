@@ -0,0 +1,359 @@
+"""
+Persistence backends for style profiles and their fitted models
+"""
+import numpy as np
+import joblib
+import json
+import os
+import sqlite3
+import threading
+import time
+import logging
+from typing import List, Dict, Any, Optional
+
+from services.model_params import models_to_arrays, models_from_arrays, pack_arrays, unpack_arrays
+
+logger = logging.getLogger(__name__)
+
+
+def _json_default(value):
+    """Convert numpy scalars and arrays for JSON encoding"""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps_compact(value: Any) -> str:
+    """Compact JSON encoding used for stored rows"""
+    return json.dumps(value, separators=(',', ':'), default=_json_default)
+
+
+class ProfileStore:
+    """
+    Backend interface for style profile persistence
+
+    A models artifact is a dict with 'gmm', 'scaler', 'pca', 'vocabulary',
+    'gmm_stats', 'attribute_counts' and 'feature_space'.
+
+    Versions let processes sharing a store detect each other's writes:
+    save() returns the profile's new version, loaded profiles carry it as
+    profile['version'], and generation() is a cheap store-wide value that
+    changes whenever another process writes. Backends that cannot track
+    this return None.
+    """
+
+    def load_profile(self, user_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def load_models(self, user_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def save(self, user_id: str, profile: Dict[str, Any], models: Optional[Dict[str, Any]] = None) -> Optional[int]:
+        """Save a profile, and its models artifact when given; returns the new version"""
+        raise NotImplementedError
+
+    def version(self, user_id: str) -> Optional[int]:
+        """Stored version of a user's profile, None if missing or untracked"""
+        return None
+
+    def generation(self) -> Optional[Any]:
+        """Changes whenever another process saves to the store"""
+        return None
+
+    def list_profiles(self, limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
+        """Summaries (user_id, n_records, n_clusters, updated_at), most recently updated first"""
+        raise NotImplementedError
+
+    def delete(self, user_id: str) -> bool:
+        raise NotImplementedError
+
+
+class JoblibProfileStore(ProfileStore):
+    """
+    Two joblib pickles per user: {user_id}_profile.joblib and {user_id}_models.joblib
+
+    Versions are profile file mtimes in nanoseconds, set explicitly on save;
+    the generation is the mtime of a marker file touched by every save.
+    """
+
+    GENERATION_FILE = '.generation'
+
+    def __init__(self, models_dir: str):
+        self.models_dir = models_dir
+        os.makedirs(models_dir, exist_ok=True)
+        self._generation_path = os.path.join(models_dir, self.GENERATION_FILE)
+
+    def _path(self, user_id: str, kind: str) -> str:
+        return os.path.join(self.models_dir, f"{user_id}_{kind}.joblib")
+
+    def load_profile(self, user_id: str) -> Optional[Dict[str, Any]]:
+        path = self._path(user_id, 'profile')
+        if not os.path.exists(path):
+            return None
+        profile = joblib.load(path)
+        profile['version'] = self.version(user_id)
+        return profile
+
+    def user_ids(self) -> List[str]:
+        """Users with a profile file, without loading them"""
+        suffix = '_profile.joblib'
+        return [filename[:-len(suffix)] for filename in os.listdir(self.models_dir) if filename.endswith(suffix)]
+
+    def load_models(self, user_id: str) -> Optional[Dict[str, Any]]:
+        path = self._path(user_id, 'models')
+        return joblib.load(path) if os.path.exists(path) else None
+
+    def save(self, user_id: str, profile: Dict[str, Any], models: Optional[Dict[str, Any]] = None) -> Optional[int]:
+        if models is not None:
+            joblib.dump(models, self._path(user_id, 'models'))
+        path = self._path(user_id, 'profile')
+        joblib.dump(profile, path)
+
+        # Coarse filesystem timestamps could give two quick saves the same mtime
+        version = time.time_ns()
+        os.utime(path, ns=(version, version))
+        self._touch_generation(version)
+        return version
+
+    def version(self, user_id: str) -> Optional[int]:
+        try:
+            return os.stat(self._path(user_id, 'profile')).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def generation(self) -> Optional[Any]:
+        try:
+            return os.stat(self._generation_path).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def _touch_generation(self, ns: int):
+        with open(self._generation_path, 'a'):
+            pass
+        os.utime(self._generation_path, ns=(ns, ns))
+
+    def list_profiles(self, limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
+        summaries = []
+        for filename in os.listdir(self.models_dir):
+            if filename.endswith('_profile.joblib'):
+                profile = joblib.load(os.path.join(self.models_dir, filename))
+                summaries.append({
+                    'user_id': profile.get('user_id', filename[:-len('_profile.joblib')]),
+                    'n_records': profile.get('n_records'),
+                    'n_clusters': profile.get('n_clusters'),
+                    'updated_at': profile.get('updated_at')
+                })
+        summaries.sort(key=lambda s: s['updated_at'] or '', reverse=True)
+        return summaries[offset:offset + limit]
+
+    def delete(self, user_id: str) -> bool:
+        deleted = False
+        for kind in ('profile', 'models'):
+            path = self._path(user_id, kind)
+            if os.path.exists(path):
+                os.remove(path)
+                deleted = True
+        if deleted:
+            self._touch_generation(time.time_ns())
+        return deleted
+
+
+class SQLiteProfileStore(ProfileStore):
+    """
+    Single-file SQLite store
+
+    Profiles are compact JSON rows; model parameters are one packed array
+    blob per user with a JSON layout, so loading never unpickles sklearn
+    objects. When a legacy directory is given, joblib users missing from
+    the database are imported when the store opens (so they are listed),
+    and files added later on first access. Deleting a user removes their
+    legacy files too, so they are not imported again.
+
+    Each save bumps the profile row's version column; generation() is
+    SQLite's data_version, which changes when any other connection commits.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS profiles (
+            user_id TEXT PRIMARY KEY,
+            profile TEXT NOT NULL,
+            n_records INTEGER,
+            n_clusters INTEGER,
+            created_at TEXT,
+            updated_at TEXT NOT NULL,
+            version INTEGER NOT NULL DEFAULT 1
+        );
+        CREATE INDEX IF NOT EXISTS idx_profiles_updated_at ON profiles(updated_at);
+        CREATE TABLE IF NOT EXISTS models (
+            user_id TEXT PRIMARY KEY,
+            meta TEXT NOT NULL,
+            layout TEXT NOT NULL,
+            params BLOB NOT NULL
+        );
+    """
+
+    def __init__(self, db_path: str, legacy_dir: Optional[str] = None):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(self.SCHEMA)
+        self._migrate()
+
+        self.legacy = JoblibProfileStore(legacy_dir) if legacy_dir else None
+        if self.legacy is not None:
+            self._import_pending_legacy()
+
+    def _migrate(self):
+        """Add columns introduced after a database was created"""
+        columns = {row[1] for row in self._conn.execute('PRAGMA table_info(profiles)')}
+        if 'version' not in columns:
+            with self._conn:
+                self._conn.execute('ALTER TABLE profiles ADD COLUMN version INTEGER NOT NULL DEFAULT 1')
+
+    def load_profile(self, user_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT profile, version FROM profiles WHERE user_id = ?', (user_id,)
+            ).fetchone()
+
+        if row is not None:
+            profile = json.loads(row[0])
+            profile['version'] = row[1]
+            return profile
+
+        return self._import_legacy(user_id)
+
+    def load_models(self, user_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT meta, layout, params FROM models WHERE user_id = ?', (user_id,)
+            ).fetchone()
+
+        if row is None:
+            return self.legacy.load_models(user_id) if self.legacy else None
+
+        meta, layout, params = row
+        return models_from_arrays(json.loads(meta), unpack_arrays(json.loads(layout), params))
+
+    def save(self, user_id: str, profile: Dict[str, Any], models: Optional[Dict[str, Any]] = None) -> Optional[int]:
+        profile_row = (
+            user_id,
+            dumps_compact(profile),
+            profile.get('n_records'),
+            profile.get('n_clusters'),
+            profile.get('created_at'),
+            profile.get('updated_at') or np.datetime64('now').astype(str)
+        )
+
+        models_row = None
+        if models is not None:
+            meta, arrays = models_to_arrays(models)
+            layout, params = pack_arrays(arrays)
+            models_row = (user_id, dumps_compact(meta), dumps_compact(layout), sqlite3.Binary(params))
+
+        with self._lock, self._conn:
+            version = self._conn.execute(
+                'INSERT INTO profiles '
+                '(user_id, profile, n_records, n_clusters, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT(user_id) DO UPDATE SET '
+                'profile = excluded.profile, n_records = excluded.n_records, n_clusters = excluded.n_clusters, '
+                'created_at = excluded.created_at, updated_at = excluded.updated_at, version = version + 1 '
+                'RETURNING version',
+                profile_row
+            ).fetchone()[0]
+            if models_row is not None:
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO models (user_id, meta, layout, params) VALUES (?, ?, ?, ?)',
+                    models_row
+                )
+
+        return version
+
+    def version(self, user_id: str) -> Optional[int]:
+        with self._lock:
+            row = self._conn.execute('SELECT version FROM profiles WHERE user_id = ?', (user_id,)).fetchone()
+        return None if row is None else row[0]
+
+    def generation(self) -> Optional[Any]:
+        with self._lock:
+            return self._conn.execute('PRAGMA data_version').fetchone()[0]
+
+    def list_profiles(self, limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT user_id, n_records, n_clusters, updated_at FROM profiles '
+                'ORDER BY updated_at DESC LIMIT ? OFFSET ?',
+                (limit, offset)
+            ).fetchall()
+
+        return [
+            {'user_id': user_id, 'n_records': n_records, 'n_clusters': n_clusters, 'updated_at': updated_at}
+            for user_id, n_records, n_clusters, updated_at in rows
+        ]
+
+    def delete(self, user_id: str) -> bool:
+        with self._lock, self._conn:
+            cursor = self._conn.execute('DELETE FROM profiles WHERE user_id = ?', (user_id,))
+            self._conn.execute('DELETE FROM models WHERE user_id = ?', (user_id,))
+        legacy_deleted = self.legacy.delete(user_id) if self.legacy else False
+        return cursor.rowcount > 0 or legacy_deleted
+
+    def _import_pending_legacy(self):
+        """Import every legacy joblib user not yet in the database"""
+        with self._lock:
+            imported = {row[0] for row in self._conn.execute('SELECT user_id FROM profiles')}
+
+        pending = [user_id for user_id in self.legacy.user_ids() if user_id not in imported]
+        for user_id in pending:
+            self._import_legacy(user_id)
+        if pending:
+            logger.info(f"Imported {len(pending)} legacy joblib profiles into {self.db_path}")
+
+    def _import_legacy(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Read a user from legacy joblib files and copy it into the database"""
+        if self.legacy is None:
+            return None
+
+        profile = self.legacy.load_profile(user_id)
+        if profile is None:
+            return None
+
+        models = self.legacy.load_models(user_id)
+        # Pre-vocabulary artifacts cannot be updated anyway, keep only their profile
+        if models is not None and models.get('vocabulary') is None:
+            models = None
+
+        version = None
+        try:
+            version = self.save(user_id, profile, models)
+            logger.info(f"Imported legacy joblib profile for {user_id}")
+        except Exception as e:
+            logger.warning(f"Could not import legacy profile for {user_id}: {str(e)}")
+
+        profile = json.loads(dumps_compact(profile))
+        profile['version'] = version
+        return profile
+
+
+def create_profile_store(models_dir: str, backend: Optional[str] = None) -> ProfileStore:
+    """
+    Build the configured store
+
+    Args:
+        models_dir: Directory holding the database or joblib files
+        backend: 'sqlite' (default) or 'joblib'; defaults to STYLE_PROFILE_STORE
+    """
+    backend = backend or os.getenv('STYLE_PROFILE_STORE', 'sqlite')
+
+    if backend == 'joblib':
+        return JoblibProfileStore(models_dir)
+    if backend == 'sqlite':
+        return SQLiteProfileStore(os.path.join(models_dir, 'profiles.sqlite3'), legacy_dir=models_dir)
+
+    raise ValueError(f"Unknown profile store backend: {backend}")
@@ -0,0 +1,225 @@
+"""
+Off-event-loop execution of CPU-bound StyleProfiler work
+Dispatches profile builds to a bounded thread or process pool so the
+uvicorn event loop keeps serving health checks and profile reads
+"""
+import asyncio
+import multiprocessing
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Any, Dict, Optional
+
+from threadpoolctl import threadpool_limits
+
+from services import metrics
+from services.cluster_selection import sweep_jobs_limit
+
+logger = logging.getLogger(__name__)
+
+
+class ExecutorSaturated(Exception):
+    """Raised when the pool and its queue are full"""
+
+
+class ProfilingTimeout(Exception):
+    """Raised when a request waited longer than its timeout"""
+
+
+# StyleProfiler owned by each worker process in process mode
+_worker_profiler = None
+
+
+def _init_worker(models_dir: str, blas_threads: int):
+    """Process pool initializer: cap BLAS threads and build the worker's profiler"""
+    global _worker_profiler
+    from services.style_profiler import StyleProfiler
+
+    threadpool_limits(limits=blas_threads)
+    _worker_profiler = StyleProfiler(models_dir=models_dir, n_jobs=1)
+
+
+def _call_worker_profiler(method: str, kwargs: Dict[str, Any]) -> tuple:
+    """Run a profiler method; returns (result, metrics drained from this worker)"""
+    try:
+        result = getattr(_worker_profiler, method)(**kwargs)
+    except Exception as e:
+        # Exception attributes survive pickling back to the parent
+        e.worker_metrics = metrics.drain()
+        raise
+    return result, metrics.drain()
+
+
+def _merge_worker_metrics(future):
+    """Done callback: publish what a worker process recorded in this process's registry"""
+    if future.cancelled():
+        return
+    error = future.exception()
+    drained = getattr(error, 'worker_metrics', None) if error is not None else future.result()[1]
+    if drained:
+        metrics.merge(drained)
+
+
+def _call_with_sweep_limit(function, sweep_jobs: int, kwargs: Dict[str, Any]) -> Any:
+    with sweep_jobs_limit(sweep_jobs):
+        return function(**kwargs)
+
+
+class ProfilingExecutor:
+    """
+    Bounded pool for StyleProfiler calls
+
+    At most max_workers calls run and max_queue wait; further submissions
+    fail fast with ExecutorSaturated so callers can answer 429. In thread mode
+    BLAS/OpenMP pools are capped at blas_threads per worker, and each call's
+    cluster-count sweep at its share of the cores (cpu_count // max_workers),
+    to avoid oversubscription. In process mode every worker owns a StyleProfiler on
+    the same store, and the parent's cached entries for the user are dropped
+    after each call, whether it succeeded, failed or timed out, and again
+    when the worker actually finishes. Metrics the worker recorded are
+    merged into the parent's registry when its call finishes.
+    """
+
+    def __init__(
+        self,
+        profiler,
+        kind: str = 'thread',
+        max_workers: Optional[int] = None,
+        max_queue: Optional[int] = None,
+        timeout: Optional[float] = 120.0,
+        blas_threads: int = 1
+    ):
+        self.profiler = profiler
+        self.kind = kind
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_queue = self.max_workers * 2 if max_queue is None else max_queue
+        self.timeout = timeout
+
+        # Created on first use so it binds to the serving event loop
+        self._slots = None
+        self._in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+        # Process workers' profilers sweep with n_jobs=1
+        self.sweep_jobs = max(1, (os.cpu_count() or 1) // self.max_workers) if kind == 'thread' else 1
+
+        if kind == 'thread':
+            # Limits are process wide, so this caps every worker thread
+            self._blas_limits = threadpool_limits(limits=blas_threads)
+            self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='profiling')
+        elif kind == 'process':
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(profiler.models_dir, blas_threads)
+            )
+        else:
+            raise ValueError(f"Unknown executor kind: {kind}")
+
+        logger.info(
+            f"ProfilingExecutor started: {kind} pool, {self.max_workers} workers, "
+            f"queue {self.max_queue}, BLAS threads {blas_threads}, sweep jobs {self.sweep_jobs}"
+        )
+
+    @classmethod
+    def from_env(cls, profiler) -> 'ProfilingExecutor':
+        """Configure from ML_EXECUTOR, ML_EXECUTOR_WORKERS, ML_EXECUTOR_QUEUE, ML_REQUEST_TIMEOUT and ML_BLAS_THREADS"""
+        workers = os.getenv('ML_EXECUTOR_WORKERS')
+        queue = os.getenv('ML_EXECUTOR_QUEUE')
+        timeout = float(os.getenv('ML_REQUEST_TIMEOUT', 120))
+
+        return cls(
+            profiler,
+            kind=os.getenv('ML_EXECUTOR', 'thread'),
+            max_workers=int(workers) if workers else None,
+            max_queue=int(queue) if queue else None,
+            timeout=timeout if timeout > 0 else None,
+            blas_threads=int(os.getenv('ML_BLAS_THREADS', 1))
+        )
+
+    async def call(
+        self,
+        method: str,
+        user_id: str,
+        timeout: Optional[float] = None,
+        wait: bool = False,
+        **kwargs
+    ) -> Any:
+        """
+        Run a StyleProfiler method in the pool
+
+        Args:
+            wait: Wait for a free slot instead of failing fast (bulk jobs)
+
+        Raises:
+            ExecutorSaturated: No worker or queue slot is free and wait is False
+            ProfilingTimeout: The call did not finish within the timeout; it
+                keeps running in the pool and its slot is released when it ends
+        """
+        loop = asyncio.get_running_loop()
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers + self.max_queue)
+
+        if self._slots.locked() and not wait:
+            self.rejected += 1
+            raise ExecutorSaturated(
+                f"Profiling pool saturated ({self.max_workers} running, {self.max_queue} queued)"
+            )
+        await self._slots.acquire()
+
+        kwargs['user_id'] = user_id
+        try:
+            if self.kind == 'thread':
+                future = self._pool.submit(_call_with_sweep_limit, getattr(self.profiler, method), self.sweep_jobs, kwargs)
+            else:
+                future = self._pool.submit(_call_worker_profiler, method, kwargs)
+                future.add_done_callback(_merge_worker_metrics)
+        except Exception:
+            self._slots.release()
+            raise
+
+        self._in_flight += 1
+        # Done callbacks run on the worker thread; hand the release back to the loop
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self._release, user_id))
+
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            outcome = await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+            return outcome if self.kind == 'thread' else outcome[0]
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            future.cancel()
+            raise ProfilingTimeout(f"{method} for user {user_id} exceeded {timeout}s")
+        finally:
+            # The worker may have written to the store before failing or timing out
+            self._invalidate(user_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'kind': self.kind,
+            'max_workers': self.max_workers,
+            'max_queue': self.max_queue,
+            'sweep_jobs': self.sweep_jobs,
+            'in_flight': self._in_flight,
+            'completed': self.completed,
+            'rejected': self.rejected,
+            'timed_out': self.timed_out
+        }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _release(self, user_id: str):
+        self._in_flight -= 1
+        self.completed += 1
+        self._slots.release()
+        # A call that timed out can still save when it finishes
+        self._invalidate(user_id)
+
+    def _invalidate(self, user_id: str):
+        """Drop the parent's cached entries for a user written by a worker process"""
+        if self.kind == 'process':
+            self.profiler.invalidate(user_id)
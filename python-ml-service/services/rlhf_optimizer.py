@@ -0,0 +1,590 @@
+"""
+Stage 10: Online reward model for RLHF prompt optimization
+Each feedback event is appended to a per-user binary log and applied as a
+Bayesian linear update to hashed prompt-token and VLT-attribute weights,
+so feedback costs O(features of the event). Full refits from the log run
+in a background worker, warm-started from the online weights.
+"""
+import os
+import re
+import json
+import zlib
+import fcntl
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
+import numpy as np
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from scipy import sparse
+from typing import List, Dict, Any, Optional, Tuple
+
+from services.lru_cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# Reward per feedback type, on the Node RLHF service's scale
+REWARDS = {
+    'like': 0.8,
+    'dislike': -0.5,
+    'outlier': -0.8,
+    'save': 1.0,
+    'share': 1.2,
+    'generate_similar': 1.5,
+    'remix': 0.7,
+    'delete': -1.0,
+    'irrelevant': -0.8,
+}
+# Stored as a code in the log; only ever append to this list
+FEEDBACK_TYPES = list(REWARDS)
+
+# One fixed-size record per event; its feature ids live in the companion file
+EVENT_DTYPE = np.dtype([
+    ('timestamp', '<f8'),
+    ('asset', '<u8'),
+    ('feature_offset', '<u8'),
+    ('n_features', '<u2'),
+    ('feedback', 'u1'),
+    ('reward', '<f4'),
+    ('quality', '<f4'),
+])
+FEATURE_DTYPE = np.dtype('<u4')
+
+MAX_FEATURES = 256
+BIAS_FEATURE = 'bias'
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:[-'][a-z0-9]+)*")
+STOPWORDS = frozenset({
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in', 'is', 'it', 'of', 'on', 'or',
+    'the', 'to', 'with', 'wearing', 'photo', 'image',
+})
+
+
+def feature_names(prompt: str, vlt_spec: Dict[str, Any]) -> List[str]:
+    """
+    Bias, prompt tokens and VLT attribute values of one generation
+
+    Accepts VLT records in the ML service shape or a Node VLT result with
+    'records'. Duplicates are dropped, order is kept, and at most
+    MAX_FEATURES names are returned.
+    """
+    names = [BIAS_FEATURE]
+    names.extend(
+        f"token:{token}" for token in _TOKEN.findall((prompt or '').lower())
+        if len(token) > 1 and token not in STOPWORDS
+    )
+
+    record = vlt_spec or {}
+    if isinstance(record.get('records'), list) and record['records']:
+        record = record['records'][0]
+
+    garment = record.get('garment_type') or record.get('garmentType')
+    if garment is not None:
+        names.append(f"attr:garment_type={str(garment).lower()}")
+    for key, value in (record.get('attributes') or {}).items():
+        if value is not None and not isinstance(value, (list, dict)):
+            names.append(f"attr:{key}={str(value).lower()}")
+    primary = (record.get('colors') or {}).get('primary')
+    if primary is not None:
+        names.append(f"attr:color={str(primary).lower()}")
+    for key, value in (record.get('style') or {}).items():
+        if value is not None and not isinstance(value, (list, dict)):
+            names.append(f"attr:style_{key}={str(value).lower()}")
+
+    return list(dict.fromkeys(names))[:MAX_FEATURES]
+
+
+def feature_id(name: str) -> int:
+    """Stable 32-bit hash of a feature name"""
+    return zlib.crc32(name.encode('utf-8'))
+
+
+class FeedbackLog:
+    """
+    Append-only binary feedback log of one user
+
+    {user_id}_feedback.bin holds EVENT_DTYPE records and
+    {user_id}_features.bin the uint32 feature ids they point into; both
+    read back as columns with np.fromfile. Ids are written before the
+    record that references them, so a torn append leaves only a partial
+    tail, which is truncated on open.
+
+    Worker processes may share the log: appends and repairs hold an
+    exclusive flock on the events file and take offsets from the file
+    sizes, and the length is read from disk rather than cached.
+    """
+
+    def __init__(self, data_dir: str, user_id: str):
+        self.events_path = os.path.join(data_dir, f"{user_id}_feedback.bin")
+        self.features_path = os.path.join(data_dir, f"{user_id}_features.bin")
+        with self.locked():
+            self._repair()
+
+    def __len__(self) -> int:
+        """Complete event records on disk, including other processes' appends"""
+        try:
+            return os.path.getsize(self.events_path) // EVENT_DTYPE.itemsize
+        except FileNotFoundError:
+            return 0
+
+    @contextmanager
+    def locked(self):
+        """Exclusive lock on the log across processes; yields the events file opened for append"""
+        with open(self.events_path, 'ab') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield f
+            finally:
+                f.flush()
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def append(self, asset: int, feedback: int, reward: float, quality: Optional[float], ids: np.ndarray) -> int:
+        """Append one event; returns its index in the log"""
+        record = np.zeros(1, dtype=EVENT_DTYPE)
+        record['timestamp'] = time.time()
+        record['asset'] = asset
+        record['n_features'] = len(ids)
+        record['feedback'] = feedback
+        record['reward'] = reward
+        record['quality'] = np.nan if quality is None else quality
+
+        with self.locked() as events, open(self.features_path, 'ab') as features:
+            index = os.fstat(events.fileno()).st_size // EVENT_DTYPE.itemsize
+            record['feature_offset'] = os.fstat(features.fileno()).st_size // FEATURE_DTYPE.itemsize
+            features.write(ids.astype(FEATURE_DTYPE).tobytes())
+            # The ids are closed (flushed) before the record is flushed on unlock
+            events.write(record.tobytes())
+
+        return index
+
+    def read(self, start: int = 0, stop: Optional[int] = None) -> Tuple[np.ndarray, List[np.ndarray]]:
+        """Event records [start, stop) and the feature ids of each"""
+        stop = len(self) if stop is None else stop
+        if stop <= start:
+            return np.zeros(0, dtype=EVENT_DTYPE), []
+
+        events = np.fromfile(self.events_path, dtype=EVENT_DTYPE, count=stop - start, offset=start * EVENT_DTYPE.itemsize)
+        first = int(events['feature_offset'][0])
+        last = int(events['feature_offset'][-1] + events['n_features'][-1])
+        ids = np.fromfile(self.features_path, dtype=FEATURE_DTYPE, count=last - first, offset=first * FEATURE_DTYPE.itemsize)
+
+        starts = (events['feature_offset'] - first).astype(np.int64)
+        ends = starts + events['n_features']
+        return events, [ids[starts[i]:ends[i]] for i in range(len(events))]
+
+    def _repair(self) -> Tuple[int, int]:
+        """Drop a torn tail left by an interrupted append; returns (events, feature ids). Call under locked()"""
+        if os.path.getsize(self.events_path) == 0:
+            if os.path.exists(self.features_path):
+                os.truncate(self.features_path, 0)
+            return 0, 0
+
+        n_events = os.path.getsize(self.events_path) // EVENT_DTYPE.itemsize
+        n_ids = os.path.getsize(self.features_path) // FEATURE_DTYPE.itemsize if os.path.exists(self.features_path) else 0
+
+        if n_events:
+            last = np.fromfile(self.events_path, dtype=EVENT_DTYPE, count=1, offset=(n_events - 1) * EVENT_DTYPE.itemsize)[0]
+            if last['feature_offset'] + last['n_features'] > n_ids:
+                n_events -= 1
+        referenced = 0
+        if n_events:
+            last = np.fromfile(self.events_path, dtype=EVENT_DTYPE, count=1, offset=(n_events - 1) * EVENT_DTYPE.itemsize)[0]
+            referenced = int(last['feature_offset'] + last['n_features'])
+
+        if os.path.getsize(self.events_path) != n_events * EVENT_DTYPE.itemsize:
+            logger.warning(f"Truncating torn feedback log tail in {self.events_path}")
+            os.truncate(self.events_path, n_events * EVENT_DTYPE.itemsize)
+        if os.path.exists(self.features_path) and os.path.getsize(self.features_path) != referenced * FEATURE_DTYPE.itemsize:
+            os.truncate(self.features_path, referenced * FEATURE_DTYPE.itemsize)
+
+        return n_events, referenced
+
+
+class RewardModel:
+    """
+    Linear reward model with a diagonal Gaussian posterior over weights
+
+    Features are binary, so an event's predicted reward is the sum of its
+    feature weights. update() is the Kalman step for one observation under
+    a diagonal posterior: every touched weight moves by its variance over
+    the predictive variance, times the residual.
+    """
+
+    def __init__(self, prior_variance: float, noise_variance: float):
+        self.prior_variance = prior_variance
+        self.noise_variance = noise_variance
+        self.weights: Dict[int, float] = {}
+        self.variances: Dict[int, float] = {}
+        # Log events reflected in the weights
+        self.n_events = 0
+
+    def predict(self, ids: np.ndarray) -> float:
+        return float(sum(self.weights.get(i, 0.0) for i in ids.tolist()))
+
+    def update(self, ids: np.ndarray, reward: float) -> float:
+        """Apply one observation; returns the prediction before the update"""
+        ids = ids.tolist()
+        variances = [self.variances.get(i, self.prior_variance) for i in ids]
+        prediction = sum(self.weights.get(i, 0.0) for i in ids)
+        predictive_variance = self.noise_variance + sum(variances)
+        residual = reward - prediction
+
+        for i, variance in zip(ids, variances):
+            gain = variance / predictive_variance
+            self.weights[i] = self.weights.get(i, 0.0) + gain * residual
+            self.variances[i] = variance * (1 - gain)
+
+        self.n_events += 1
+        return prediction
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        ids = np.fromiter(self.weights.keys(), dtype=np.uint32, count=len(self.weights))
+        return {
+            'ids': ids,
+            'weights': np.array([self.weights[i] for i in ids.tolist()]),
+            'variances': np.array([self.variances.get(i, self.prior_variance) for i in ids.tolist()]),
+            'n_events': np.array(self.n_events)
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], prior_variance: float, noise_variance: float) -> 'RewardModel':
+        model = cls(prior_variance, noise_variance)
+        ids = arrays['ids'].tolist()
+        model.weights = dict(zip(ids, arrays['weights'].tolist()))
+        model.variances = dict(zip(ids, arrays['variances'].tolist()))
+        model.n_events = int(arrays['n_events'])
+        return model
+
+
+class _UserState:
+    """Log, model and feature names of one user; lock guards all of them"""
+
+    def __init__(self, log: FeedbackLog, model: RewardModel, names: Dict[int, str], vocab_path: str):
+        self.log = log
+        self.model = model
+        self.names = names
+        self.vocab_path = vocab_path
+        self.metrics: Optional[Dict[str, Any]] = None
+        self.iterations = 0
+        self.lock = threading.Lock()
+
+
+class RLHFOptimizer:
+    """
+    Per-user reward model learned from image feedback
+
+    process_feedback appends the event to the user's log and updates the
+    model online. train_model schedules a full refit: ridge regression
+    (the exact posterior mean of the same Bayesian model) over the last
+    feedback per asset, solved by conjugate gradients from the online
+    weights. Refits run on one background thread; events that arrive
+    during a refit are replayed onto its result. Every refit_every events
+    a refit is scheduled automatically.
+    """
+
+    def __init__(
+        self,
+        data_dir: Optional[str] = None,
+        prior_variance: float = 1.0,
+        noise_variance: float = 0.25,
+        refit_every: Optional[int] = None
+    ):
+        self.data_dir = data_dir or os.getenv('RLHF_DATA_DIR', './models/rlhf')
+        os.makedirs(self.data_dir, exist_ok=True)
+
+        self.prior_variance = prior_variance
+        self.noise_variance = noise_variance
+        # 0 disables automatic refits
+        self.refit_every = int(os.getenv('RLHF_REFIT_EVERY', 1000)) if refit_every is None else refit_every
+
+        # Evicted users are rebuilt from their snapshot and log
+        self._users = LRUCache(max_entries=int(os.getenv('RLHF_CACHED_USERS', 1024)), sizeof=lambda state: 0)
+        self._users_lock = threading.Lock()
+
+        self._train_executor = None
+        self._training: Dict[str, Future] = {}
+        self._training_lock = threading.Lock()
+
+        logger.info(f"RLHFOptimizer initialized with data dir {self.data_dir}")
+
+    def process_feedback(
+        self,
+        user_id: str,
+        generation_id: str,
+        asset_id: str,
+        feedback_type: str,
+        prompt_used: str,
+        vlt_spec: Dict[str, Any],
+        quality_score: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        Log one feedback event and update the user's reward model
+
+        Returns:
+            Dict with 'model_updated', 'reward', 'predicted_reward' (before
+            the update) and 'weights_summary' (the event's largest weights)
+        """
+        if feedback_type not in REWARDS:
+            raise ValueError(f"Unknown feedback type {feedback_type!r}; expected one of {FEEDBACK_TYPES}")
+        reward = REWARDS[feedback_type]
+
+        names = feature_names(prompt_used, vlt_spec)
+        ids = np.array([feature_id(name) for name in names], dtype=np.uint32)
+        asset = int.from_bytes(hashlib.blake2b(f"{generation_id}:{asset_id}".encode('utf-8'), digest_size=8).digest(), 'little')
+
+        state = self._state(user_id)
+        with state.lock:
+            index = state.log.append(asset, FEEDBACK_TYPES.index(feedback_type), reward, quality_score, ids)
+            self._remember_names(state, ids, names)
+            self._catch_up(state, index)
+            prediction = state.model.update(ids, reward)
+            weights = sorted(
+                ((name, state.model.weights[i]) for name, i in zip(names, ids.tolist())),
+                key=lambda item: abs(item[1]),
+                reverse=True
+            )[:10]
+            events_since_refit = len(state.log) - (state.metrics or {}).get('events', 0)
+            n_events = len(state.log)
+
+        if self.refit_every and events_since_refit >= self.refit_every:
+            self._schedule_training(user_id, state)
+
+        return {
+            'model_updated': True,
+            'reward': reward,
+            'predicted_reward': round(prediction, 4),
+            'weights_summary': {
+                'weights': {name: round(weight, 4) for name, weight in weights},
+                'n_features': len(names),
+                'n_events': n_events
+            }
+        }
+
+    def train_model(self, user_id: str, wait: bool = False) -> Dict[str, Any]:
+        """
+        Schedule a full refit of the user's reward model from the log
+
+        Returns at once unless wait is set. A refit already queued or
+        running for the user is joined rather than repeated.
+
+        Returns:
+            Dict with 'status' ('scheduled', 'running' or 'completed') and
+            the latest completed refit's 'metrics' and 'iterations'
+        """
+        state = self._state(user_id)
+        if len(state.log) == 0:
+            raise ValueError(f"No feedback logged for user {user_id}")
+
+        future = self._schedule_training(user_id, state)
+        if wait:
+            future.result()
+
+        status = 'completed' if future.done() else ('running' if future.running() else 'scheduled')
+        with state.lock:
+            return {'status': status, 'metrics': state.metrics, 'iterations': state.iterations}
+
+    def get_weights(self, user_id: str, top: int = 20) -> Dict[str, Any]:
+        """Largest positive and negative weights of the user's model"""
+        state = self._state(user_id)
+        with state.lock:
+            self._catch_up(state, len(state.log))
+            items = [(state.names.get(i, str(i)), w) for i, w in state.model.weights.items()]
+            n_events = state.model.n_events
+
+        items.sort(key=lambda item: item[1])
+        return {
+            'top_positive': [(name, round(w, 4)) for name, w in reversed(items[-top:]) if w > 0],
+            'top_negative': [(name, round(w, 4)) for name, w in items[:top] if w < 0],
+            'n_features': len(items),
+            'n_events': n_events
+        }
+
+    def shutdown(self):
+        """Finish running refits; queued ones are dropped"""
+        if self._train_executor is not None:
+            self._train_executor.shutdown(wait=True, cancel_futures=True)
+
+    def _state(self, user_id: str) -> _UserState:
+        state = self._users.get(user_id)
+        if state is not None:
+            return state
+
+        with self._users_lock:
+            state = self._users.get(user_id)
+            if state is None:
+                state = self._load_state(user_id)
+                self._users.put(user_id, state)
+        return state
+
+    def _load_state(self, user_id: str) -> _UserState:
+        """Snapshot of the last refit (if any) plus the log events after it"""
+        log = FeedbackLog(self.data_dir, user_id)
+        model = RewardModel(self.prior_variance, self.noise_variance)
+        metrics, iterations = None, 0
+
+        snapshot_path = self._snapshot_path(user_id)
+        if os.path.exists(snapshot_path):
+            with np.load(snapshot_path) as snapshot:
+                model = RewardModel.from_arrays(snapshot, self.prior_variance, self.noise_variance)
+                metrics = json.loads(str(snapshot['metrics']))
+                iterations = int(snapshot['iterations'])
+            if model.n_events > len(log):
+                logger.warning(f"Reward snapshot for {user_id} is ahead of its log, refitting from scratch")
+                model, metrics, iterations = RewardModel(self.prior_variance, self.noise_variance), None, 0
+
+        events, ids = log.read(model.n_events)
+        for record, event_ids in zip(events, ids):
+            model.update(event_ids, float(record['reward']))
+
+        vocab_path = os.path.join(self.data_dir, f"{user_id}_vocab.tsv")
+        names = {}
+        if os.path.exists(vocab_path):
+            with open(vocab_path, encoding='utf-8') as f:
+                for line in f:
+                    key, _, name = line.rstrip('\n').partition('\t')
+                    if name:
+                        names[int(key)] = name
+
+        state = _UserState(log, model, names, vocab_path)
+        state.metrics, state.iterations = metrics, iterations
+        if len(events):
+            logger.info(f"Replayed {len(events)} feedback events for {user_id}")
+        return state
+
+    @staticmethod
+    def _catch_up(state: _UserState, stop: int):
+        """Apply log events [model.n_events, stop), appended by other worker processes, to the model"""
+        events, ids = state.log.read(state.model.n_events, stop)
+        for record, event_ids in zip(events, ids):
+            state.model.update(event_ids, float(record['reward']))
+
+    @staticmethod
+    def _remember_names(state: _UserState, ids: np.ndarray, names: List[str]):
+        new = [(i, name) for i, name in zip(ids.tolist(), names) if i not in state.names]
+        if not new:
+            return
+        with open(state.vocab_path, 'a', encoding='utf-8') as f:
+            f.writelines(f"{i}\t{name}\n" for i, name in new)
+        state.names.update(new)
+
+    def _schedule_training(self, user_id: str, state: _UserState) -> Future:
+        with self._training_lock:
+            future = self._training.get(user_id)
+            if future is not None and not future.done():
+                return future
+
+            if self._train_executor is None:
+                self._train_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='rlhf-train')
+            future = self._train_executor.submit(self._refit, user_id, state)
+            self._training[user_id] = future
+        future.add_done_callback(lambda done: self._forget_training(user_id, done))
+        return future
+
+    def _forget_training(self, user_id: str, future: Future):
+        with self._training_lock:
+            if self._training.get(user_id) is future:
+                del self._training[user_id]
+
+    def _refit(self, user_id: str, state: _UserState):
+        """Background job: ridge refit over the log, warm-started from the online weights"""
+        from scipy.sparse.linalg import cg
+
+        started = time.perf_counter()
+        try:
+            with state.lock:
+                stop = len(state.log)
+                warm_weights = dict(state.model.weights)
+            events, ids = state.log.read(0, stop)
+
+            # A later feedback on the same asset replaces the earlier one
+            last = len(events) - 1 - np.unique(events['asset'][::-1], return_index=True)[1]
+            keep = np.sort(last)
+            kept_ids = [ids[i] for i in keep]
+            rewards = events['reward'][keep].astype(np.float64)
+
+            columns, inverse = np.unique(np.concatenate(kept_ids), return_inverse=True)
+            indptr = np.concatenate([[0], np.cumsum([len(event_ids) for event_ids in kept_ids])])
+            features = sparse.csr_matrix((np.ones(len(inverse)), inverse, indptr), shape=(len(keep), len(columns)))
+
+            gram = (features.T @ features) / self.noise_variance
+            system = gram + sparse.identity(len(columns)) / self.prior_variance
+            target = features.T @ rewards / self.noise_variance
+            initial = np.array([warm_weights.get(i, 0.0) for i in columns.tolist()])
+
+            iterations = 0
+
+            def count(_):
+                nonlocal iterations
+                iterations += 1
+
+            weights, info = cg(system, target, x0=initial, rtol=1e-6, maxiter=max(100, len(columns)), callback=count)
+            variances = 1 / (gram.diagonal() + 1 / self.prior_variance)
+
+            refit = RewardModel.from_arrays(
+                {'ids': columns, 'weights': weights, 'variances': variances, 'n_events': np.array(stop)},
+                self.prior_variance, self.noise_variance
+            )
+            residuals = features @ weights - rewards
+            metrics = {
+                'events': stop,
+                'assets': int(len(keep)),
+                'features': int(len(columns)),
+                'rmse': round(float(np.sqrt(np.mean(residuals ** 2))), 4),
+                'baseline_rmse': round(float(rewards.std()), 4),
+                'converged': info == 0,
+                'warm_start': bool(warm_weights),
+                'seconds': round(time.perf_counter() - started, 4),
+                'trained_at': datetime.now().isoformat()
+            }
+
+            with state.lock:
+                tail, tail_ids = state.log.read(stop)
+                for record, event_ids in zip(tail, tail_ids):
+                    refit.update(event_ids, float(record['reward']))
+                state.model = refit
+                state.metrics = metrics
+                state.iterations = iterations
+                self._save_snapshot(user_id, state.log, refit, metrics, iterations)
+
+            logger.info(
+                f"Refit reward model for {user_id}: {stop} events, {len(columns)} features, "
+                f"{iterations} CG iterations in {metrics['seconds']:.3f}s"
+            )
+
+        except Exception as e:
+            logger.error(f"Reward model refit failed for {user_id}: {str(e)}")
+            raise
+
+    def _save_snapshot(
+        self,
+        user_id: str,
+        log: FeedbackLog,
+        model: RewardModel,
+        metrics: Dict[str, Any],
+        iterations: int
+    ):
+        """
+        Replace the user's snapshot unless another process saved one
+        covering more of the log meanwhile
+        """
+        path = self._snapshot_path(user_id)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as f:
+            np.savez(f, **model.to_arrays(), metrics=np.array(json.dumps(metrics)), iterations=np.array(iterations))
+
+        with log.locked():
+            if os.path.exists(path):
+                with np.load(path) as snapshot:
+                    if int(snapshot['n_events']) > model.n_events:
+                        os.remove(temp_path)
+                        return
+            os.replace(temp_path, path)
+
+    def _snapshot_path(self, user_id: str) -> str:
+        return os.path.join(self.data_dir, f"{user_id}_reward.npz")
+
+    def is_ready(self) -> bool:
+        """Check if service is ready"""
+        return True
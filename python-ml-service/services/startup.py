@@ -0,0 +1,116 @@
+"""
+Lazy service construction and startup cost tracking
+Heavy ML stacks are imported on first use; every import and service build
+done through here is timed for the startup report
+"""
+import importlib
+import logging
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_imports: List[Dict[str, Any]] = []
+_ready: Dict[str, float] = {}
+
+
+def timed_import(module_name: str, reason: str = 'startup'):
+    """Import a module, recording its cost if this is the first import"""
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+
+    started = time.perf_counter()
+    module = importlib.import_module(module_name)
+    elapsed = time.perf_counter() - started
+
+    with _lock:
+        _imports.append({'module': module_name, 'seconds': round(elapsed, 4), 'reason': reason})
+    logger.info(f"Imported {module_name} in {elapsed:.3f}s ({reason})")
+    return module
+
+
+def mark_ready(app_name: str, started: float):
+    """Record how long the app took from its first import line to serving"""
+    _ready[app_name] = round(time.perf_counter() - started, 4)
+    logger.info(f"{app_name} ready in {_ready[app_name]:.3f}s")
+
+
+class LazyService:
+    """
+    Proxy that builds a service on first attribute access
+
+    target is 'module:attribute' (attribute may be dotted, e.g.
+    'Class.from_env'); it is called with args and kwargs. Construction is
+    thread-safe and timed.
+    """
+
+    def __init__(self, name: str, target: str, *args, **kwargs):
+        self._name = name
+        self._target = target
+        self._args = args
+        self._kwargs = kwargs
+        self._instance = None
+        self._load_seconds = None
+        self._build_lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._instance is not None
+
+    def get(self) -> Any:
+        if self._instance is None:
+            with self._build_lock:
+                if self._instance is None:
+                    self._instance = self._build()
+        return self._instance
+
+    def warmup(self):
+        """Build the service and run its own warmup() if it has one"""
+        instance = self.get()
+        if hasattr(instance, 'warmup'):
+            instance.warmup()
+
+    def stats(self) -> Dict[str, Any]:
+        return {'loaded': self.loaded, 'load_seconds': self._load_seconds}
+
+    def _build(self) -> Any:
+        started = time.perf_counter()
+        module_name, attribute = self._target.split(':')
+        factory: Callable = timed_import(module_name, reason=f"first use of {self._name}")
+        for part in attribute.split('.'):
+            factory = getattr(factory, part)
+
+        instance = factory(*self._args, **self._kwargs)
+        self._load_seconds = round(time.perf_counter() - started, 4)
+        logger.info(f"Loaded {self._name} in {self._load_seconds:.3f}s")
+        return instance
+
+    def __getattr__(self, attribute: str) -> Any:
+        # Only reached for names the proxy itself lacks; never build for private lookups
+        if attribute.startswith('_'):
+            raise AttributeError(attribute)
+        return getattr(self.get(), attribute)
+
+
+def warmup_services(services: Dict[str, LazyService]):
+    """Build and warm every service, logging instead of raising on failures"""
+    for name, service in services.items():
+        try:
+            service.warmup()
+        except Exception as e:
+            logger.error(f"Warmup of {name} failed: {str(e)}")
+
+
+def startup_report(services: Optional[Dict[str, LazyService]] = None) -> Dict[str, Any]:
+    """Ready times, timed imports (most expensive first) and lazy service load state"""
+    with _lock:
+        imports = sorted(_imports, key=lambda entry: entry['seconds'], reverse=True)
+
+    return {
+        'ready_seconds': dict(_ready),
+        'imports': imports,
+        'services': {name: service.stats() for name, service in (services or {}).items()}
+    }
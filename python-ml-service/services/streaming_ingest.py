@@ -0,0 +1,216 @@
+"""
+Chunked ingestion of large VLT portfolios
+Encodes records into sparse matrices chunk by chunk, so only the current
+chunk of raw records is ever held in memory
+"""
+import asyncio
+import json
+import logging
+import numpy as np
+from collections import defaultdict
+from typing import Any, AsyncIterator, Dict, List, Optional, Union
+
+from scipy import sparse
+
+from services.feature_encoder import CategoricalEncoder, AttributeEncoder, embedding_matrix
+from services.memoization import record_digest
+
+logger = logging.getLogger(__name__)
+
+# Value counters kept in profile statistics and merged batch by batch
+DISTRIBUTION_NAMES = ('garment_distribution', 'color_distribution', 'style_distribution')
+
+
+def count_distributions(vlt_records: List[Dict[str, Any]]) -> Dict[str, Dict[Any, int]]:
+    """Garment, primary color and overall style value counts of records"""
+    garment_types = defaultdict(int)
+    all_colors = defaultdict(int)
+    all_styles = defaultdict(int)
+
+    for record in vlt_records:
+        garment_types[record.get('garment_type', 'unknown')] += 1
+
+        if 'colors' in record and 'primary' in record['colors']:
+            all_colors[record['colors']['primary']] += 1
+
+        if 'style' in record and 'overall' in record['style']:
+            all_styles[record['style']['overall']] += 1
+
+    return {
+        'garment_distribution': dict(garment_types),
+        'color_distribution': dict(all_colors),
+        'style_distribution': dict(all_styles)
+    }
+
+
+def record_ids(vlt_records: List[Dict[str, Any]], offset: int = 0) -> List[Any]:
+    """Image id, else record id, else the record's position in the portfolio"""
+    return [
+        record.get('imageId', record.get('id', f'record_{offset + i}'))
+        for i, record in enumerate(vlt_records)
+    ]
+
+
+def merge_distributions(
+    totals: Dict[str, Dict[Any, int]],
+    batch: Dict[str, Dict[Any, int]]
+) -> Dict[str, Dict[Any, int]]:
+    """Add batch distribution counts onto running totals in place"""
+    for name, counts in batch.items():
+        merged = totals.setdefault(name, {})
+        for value, count in counts.items():
+            merged[value] = merged.get(value, 0) + count
+    return totals
+
+
+class EncodedPortfolio:
+    """Everything StyleProfiler needs from a portfolio, without the raw records"""
+
+    def __init__(
+        self,
+        features: sparse.csr_matrix,
+        encoder: CategoricalEncoder,
+        attributes: sparse.csr_matrix,
+        attribute_encoder: AttributeEncoder,
+        record_ids: List[Any],
+        distributions: Dict[str, Dict[Any, int]],
+        embeddings: Optional[np.ndarray] = None,
+        record_digests: Optional[List[bytes]] = None
+    ):
+        self.features = features
+        self.encoder = encoder
+        self.attributes = attributes
+        self.attribute_encoder = attribute_encoder
+        self.record_ids = record_ids
+        self.distributions = distributions
+        # L2-normalized float32 rows, None when no record carried an embedding
+        self.embeddings = embeddings
+        # Per-record content digests for the profile fingerprint
+        self.record_digests = record_digests
+
+    @property
+    def n_records(self) -> int:
+        return self.features.shape[0]
+
+
+class StreamingPortfolioEncoder:
+    """
+    Accumulates a portfolio chunk by chunk
+
+    Each chunk is one-hot encoded (vocabularies grow as new values arrive),
+    counted into the distribution totals and then released. Encoded chunks
+    are stacked into one CSR matrix at finish().
+    """
+
+    def __init__(self):
+        self.encoder = CategoricalEncoder()
+        self.attribute_encoder = AttributeEncoder()
+        self._feature_chunks = []
+        self._attribute_chunks = []
+        self.record_ids: List[Any] = []
+        self.distributions = {}
+        # Per chunk: embedding matrix, or the row count while no embedding was seen
+        self._embedding_chunks: List[Union[np.ndarray, int]] = []
+        self.embedding_dim = None
+        self.record_digests: List[bytes] = []
+
+    @property
+    def n_records(self) -> int:
+        return len(self.record_ids)
+
+    def add_records(self, vlt_records: List[Dict[str, Any]]):
+        """Encode one chunk of records"""
+        offset = self.n_records
+
+        self._feature_chunks.append(self.encoder.transform(vlt_records, extend=True))
+        self._attribute_chunks.append(self.attribute_encoder.transform(vlt_records, extend=True))
+        self.record_ids.extend(record_ids(vlt_records, offset))
+        merge_distributions(self.distributions, count_distributions(vlt_records))
+        self.record_digests.extend(record_digest(record) for record in vlt_records)
+
+        embeddings = embedding_matrix(vlt_records, self.embedding_dim)
+        if embeddings is None:
+            self._embedding_chunks.append(len(vlt_records))
+        else:
+            self.embedding_dim = embeddings.shape[1]
+            self._embedding_chunks.append(embeddings)
+
+    def finish(self) -> EncodedPortfolio:
+        """Stack encoded chunks, widening earlier ones to the final vocabularies"""
+        return EncodedPortfolio(
+            features=self._stack(self._feature_chunks, self.encoder.n_features),
+            encoder=self.encoder,
+            attributes=self._stack(self._attribute_chunks, self.attribute_encoder.n_features),
+            attribute_encoder=self.attribute_encoder,
+            record_ids=self.record_ids,
+            distributions=self.distributions,
+            embeddings=self._stack_embeddings(),
+            record_digests=self.record_digests
+        )
+
+    def _stack_embeddings(self) -> Optional[np.ndarray]:
+        if self.embedding_dim is None:
+            return None
+        return np.vstack([
+            np.zeros((chunk, self.embedding_dim), dtype=np.float32) if isinstance(chunk, int) else chunk
+            for chunk in self._embedding_chunks
+        ])
+
+    @staticmethod
+    def _stack(chunks: List[sparse.csr_matrix], n_features: int) -> sparse.csr_matrix:
+        if not chunks:
+            return sparse.csr_matrix((0, n_features))
+        # Columns only ever get appended, so earlier chunks just need widening
+        widened = [sparse.csr_matrix((c.data, c.indices, c.indptr), shape=(c.shape[0], n_features)) for c in chunks]
+        return sparse.vstack(widened, format='csr')
+
+
+async def iter_ndjson_chunks(byte_stream: AsyncIterator[bytes], chunk_size: int) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    Parse an NDJSON byte stream into lists of up to chunk_size records
+
+    Raises:
+        ValueError: A line is not a JSON object
+    """
+    buffer = b''
+    chunk = []
+    line_number = 0
+
+    def _parse(line: bytes):
+        nonlocal line_number
+        line_number += 1
+        if not line.strip():
+            return
+        record = json.loads(line)
+        if not isinstance(record, dict):
+            raise ValueError(f"Line {line_number} is not a JSON object")
+        chunk.append(record)
+
+    async for data in byte_stream:
+        buffer += data
+        *lines, buffer = buffer.split(b'\n')
+        for line in lines:
+            _parse(line)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+
+    _parse(buffer)
+    if chunk:
+        yield chunk
+
+
+async def encode_ndjson_stream(byte_stream: AsyncIterator[bytes], chunk_size: int = 1000) -> EncodedPortfolio:
+    """
+    Encode an NDJSON request body into an EncodedPortfolio
+
+    Each chunk is encoded on a worker thread so the event loop stays
+    responsive; only one chunk of parsed records is alive at a time.
+    """
+    encoder = StreamingPortfolioEncoder()
+
+    async for chunk in iter_ndjson_chunks(byte_stream, chunk_size):
+        await asyncio.to_thread(encoder.add_records, chunk)
+
+    logger.info(f"Encoded {encoder.n_records} streamed records")
+    return encoder.finish()
@@ -3,14 +3,25 @@ Stage 2: Style Profile Clustering using GMM
 Aggregates VLT data into style clusters to identify user's fashion preferences
 """
 import numpy as np
-from sklearn.mixture import GaussianMixture as GaussianMixtureModel
-from sklearn.preprocessing import StandardScaler
-from sklearn.decomposition import PCA
-import joblib
 import os
 import logging
-from typing import List, Dict, Any, Optional
-from collections import defaultdict
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Union
+
+from services.feature_encoder import CategoricalEncoder, AttributeEncoder, embedding_matrix
+from services.streaming_ingest import (
+    DISTRIBUTION_NAMES, EncodedPortfolio, count_distributions, merge_distributions, record_ids
+)
+from services.online_gmm import sufficient_statistics, statistics_from_model, partial_fit
+from services.cluster_selection import select_n_clusters
+from services.feature_importance import cluster_value_counts, mutual_information, centroid_contrast
+from services.profile_store import ProfileStore, create_profile_store
+from services.lru_cache import LRUCache
+from services.metrics import PROFILE_MEMO, StageTimer, current_timer, record_counts, stage
+from services.memoization import SingleFlight, content_fingerprint, profile_fingerprint
+from services.startup import timed_import
+from services.style_scorer import StyleScorer, save_artifact, load_artifact
 
 logger = logging.getLogger(__name__)
 
@@ -21,12 +32,49 @@ class StyleProfiler:
     Implements Stage 2 of Designer BFF pipeline
     """
     
-    def __init__(self, models_dir: str = "./models"):
+    def __init__(
+        self,
+        models_dir: str = "./models",
+        n_jobs: int = -1,
+        store: Optional[ProfileStore] = None
+    ):
         self.models_dir = models_dir
         os.makedirs(models_dir, exist_ok=True)
         
-        # Cache for user profiles
-        self.profiles = {}
+        # Profile persistence backend (SQLite by default, see STYLE_PROFILE_STORE)
+        self.store = store or create_profile_store(models_dir)
+        
+        # Parallel workers for the n_clusters="auto" sweep (joblib semantics)
+        self.n_jobs = n_jobs
+        self.auto_cluster_range = (2, 12)
+        
+        # Background worker for deferred forest importance
+        self._importance_executor = None
+        
+        # Concurrent creates with the same user and content share one fit
+        self._inflight = SingleFlight()
+        
+        # Striped per-user locks serialize create/update of the same profile
+        # when calls run on a thread pool
+        self._user_locks = [threading.Lock() for _ in range(64)]
+        
+        # Bounded caches for user profiles and fitted models
+        self.profiles = self._cache_from_env('STYLE_PROFILE_CACHE', max_entries=1024, max_mb=64, ttl=3600)
+        self.model_cache = self._cache_from_env('STYLE_MODEL_CACHE', max_entries=256, max_mb=256, ttl=3600)
+        # Numpy scorers for read-only assignment, rebuilt whenever models change.
+        # Every save also writes a memory-mappable scorer artifact, so cold
+        # loads skip rebuilding sklearn objects
+        self.scorers_dir = os.path.join(models_dir, 'scorers')
+        os.makedirs(self.scorers_dir, exist_ok=True)
+        self.scorer_cache = self._cache_from_env('STYLE_SCORER_CACHE', max_entries=1024, max_mb=64, ttl=3600)
+        # (profile version, store generation last checked) behind each
+        # user's cached entries, so writes by other worker processes sharing
+        # the store invalidate them (see _revalidate)
+        self._cache_versions = LRUCache(max_entries=8192)
+        
+        # Stage timings always go to services.metrics; with
+        # STYLE_PROFILE_TIMINGS=1 they are also stored as profile['build_metrics']
+        self.record_timings = os.getenv('STYLE_PROFILE_TIMINGS', '0') == '1'
         
         # Feature extraction configuration
         self.feature_keys = [
@@ -41,7 +89,10 @@ class StyleProfiler:
         self,
         user_id: str,
         vlt_records: List[Dict[str, Any]],
-        n_clusters: int = 5
+        n_clusters: Union[int, str] = 5,
+        importance_mode: str = 'mutual_info',
+        feature_mode: str = 'categorical',
+        embedding_weight: float = 1.0
     ) -> Dict[str, Any]:
         """
         Create initial style profile using GMM clustering
@@ -49,67 +100,464 @@ class StyleProfiler:
         Args:
             user_id: User identifier
             vlt_records: List of VLT analysis results
-            n_clusters: Number of style clusters (modes)
+            n_clusters: Number of style clusters (modes), or "auto" to pick
+                it by a parallel BIC sweep over auto_cluster_range
+            importance_mode: Feature importance strategy, one of
+                'mutual_info', 'centroid', 'forest' or 'deferred'
+                (mutual_info now, forest ranking patched in later)
+            feature_mode: 'categorical' (one-hot fields only) or 'hybrid'
+                (one-hot fields plus record embeddings, reduced by
+                randomized PCA)
+            embedding_weight: Weight of the embedding block in hybrid mode;
+                1.0 gives both blocks the same total variance
         
         Returns:
-            Style profile with clusters and statistics
+            Style profile with clusters and statistics. If the stored
+            profile was built from the same records and parameters it is
+            returned without refitting.
         """
         logger.info(f"Creating style profile for {user_id} with {len(vlt_records)} records")
         
-        if len(vlt_records) < n_clusters:
-            logger.warning(f"Only {len(vlt_records)} records, reducing clusters to {len(vlt_records)}")
-            n_clusters = max(1, len(vlt_records))
+        if not vlt_records:
+            raise ValueError(f"No records given for user {user_id}")
+        if isinstance(n_clusters, int) and len(vlt_records) < n_clusters:
+            raise ValueError(f"{len(vlt_records)} records cannot be split into {n_clusters} style clusters")
+        
+        fingerprint = profile_fingerprint(
+            vlt_records, self._build_params(n_clusters, importance_mode, feature_mode, embedding_weight)
+        )
+        return self._create_once(
+            user_id,
+            fingerprint,
+            'create',
+            lambda: self._create_profile(
+                user_id, vlt_records, n_clusters, importance_mode, feature_mode, embedding_weight, fingerprint
+            )
+        )
+    
+    @staticmethod
+    def _build_params(
+        n_clusters: Union[int, str],
+        importance_mode: str,
+        feature_mode: str,
+        embedding_weight: float,
+        mini_batch: bool = False
+    ) -> Dict[str, Any]:
+        """Parameters that change a built profile, as hashed into its fingerprint"""
+        return {
+            'n_clusters': n_clusters,
+            'importance_mode': importance_mode,
+            'feature_mode': feature_mode,
+            'embedding_weight': float(embedding_weight) if feature_mode == 'hybrid' else None,
+            'mini_batch': bool(mini_batch)
+        }
+    
+    def _create_once(
+        self,
+        user_id: str,
+        fingerprint: Optional[str],
+        operation: str,
+        build
+    ) -> Dict[str, Any]:
+        """
+        Return the stored profile if its fingerprint matches, else run build
+        
+        Calls with the same user and fingerprint that overlap share a single
+        build. Without a fingerprint the build always runs.
+        """
+        def run():
+            with self._user_lock(user_id):
+                existing = self.get_profile(user_id) if fingerprint is not None else None
+                if existing is not None and existing.get('fingerprint') == fingerprint:
+                    PROFILE_MEMO.inc(result='hit')
+                    logger.info(f"Profile for {user_id} already built from this content, skipping refit")
+                    return existing
+                
+                PROFILE_MEMO.inc(result='miss')
+                with StageTimer(operation):
+                    return build()
+        
+        if fingerprint is None:
+            return run()
+        
+        profile, shared = self._inflight.do((user_id, fingerprint), run)
+        if shared:
+            PROFILE_MEMO.inc(result='coalesced')
+        return profile
+    
+    def _create_profile(
+        self,
+        user_id: str,
+        vlt_records: List[Dict[str, Any]],
+        n_clusters: Union[int, str],
+        importance_mode: str,
+        feature_mode: str,
+        embedding_weight: float,
+        fingerprint: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Fit and save a new profile; caller holds the user lock"""
+        n_clusters = self._clamp_clusters(n_clusters, len(vlt_records))
         
         # Extract features from VLT records
-        features, feature_names = self._extract_features(vlt_records)
+        with stage('extract_features'):
+            features, feature_names, encoder = self._extract_features(vlt_records)
+            embeddings = self._embeddings_for_mode(vlt_records, feature_mode)
+        record_counts(records=len(vlt_records), features=features.shape[1])
+        
+        fit = self._fit_models(features, n_clusters, embeddings=embeddings, embedding_weight=embedding_weight)
+        
+        # Analyze clusters
+        with stage('analyze_clusters'):
+            attribute_encoder = AttributeEncoder()
+            clusters, attribute_counts = self._analyze_clusters(
+                fit['labels'], 
+                fit['probabilities'],
+                attribute_encoder.transform(vlt_records),
+                attribute_encoder,
+                record_ids(vlt_records)
+            )
+        
+        with stage('statistics'):
+            statistics = self._compute_statistics(vlt_records, clusters)
+        
+        return self._finalize_profile(
+            user_id,
+            fit,
+            features,
+            encoder,
+            clusters,
+            attribute_counts,
+            statistics,
+            importance_mode,
+            fingerprint
+        )
+    
+    def create_profile_from_portfolio(
+        self,
+        user_id: str,
+        portfolio: EncodedPortfolio,
+        n_clusters: Union[int, str] = 5,
+        importance_mode: str = 'mutual_info',
+        mini_batch: bool = False,
+        feature_mode: str = 'categorical',
+        embedding_weight: float = 1.0
+    ) -> Dict[str, Any]:
+        """
+        Create a style profile from a portfolio encoded chunk by chunk
+        
+        Same result as create_profile, but works from the sparse matrices of
+        a StreamingPortfolioEncoder so the raw records never need to be held
+        in memory together. With mini_batch the GMM is fitted on one random
+        batch and the remaining batches are folded in by incremental EM.
+        """
+        logger.info(f"Creating style profile for {user_id} from {portfolio.n_records} streamed records")
+        
+        if portfolio.n_records == 0:
+            raise ValueError("Portfolio contains no records")
+        if feature_mode == 'hybrid' and portfolio.embeddings is None:
+            raise ValueError("Hybrid feature mode needs records with embeddings")
+        
+        fingerprint = None
+        if portfolio.record_digests is not None:
+            fingerprint = content_fingerprint(
+                portfolio.record_digests,
+                self._build_params(n_clusters, importance_mode, feature_mode, embedding_weight, mini_batch)
+            )
+        
+        return self._create_once(
+            user_id,
+            fingerprint,
+            'create_stream',
+            lambda: self._create_from_portfolio(
+                user_id, portfolio, n_clusters, importance_mode, mini_batch, feature_mode, embedding_weight, fingerprint
+            )
+        )
+    
+    def _create_from_portfolio(
+        self,
+        user_id: str,
+        portfolio: EncodedPortfolio,
+        n_clusters: Union[int, str],
+        importance_mode: str,
+        mini_batch: bool,
+        feature_mode: str,
+        embedding_weight: float,
+        fingerprint: Optional[str]
+    ) -> Dict[str, Any]:
+        """Fit and save a profile from an encoded portfolio; caller holds the user lock"""
+        n_clusters = self._clamp_clusters(n_clusters, portfolio.n_records)
+        record_counts(records=portfolio.n_records, features=portfolio.features.shape[1])
+        fit = self._fit_models(
+            portfolio.features,
+            n_clusters,
+            mini_batch=mini_batch,
+            embeddings=portfolio.embeddings if feature_mode == 'hybrid' else None,
+            embedding_weight=embedding_weight
+        )
+        
+        with stage('analyze_clusters'):
+            clusters, attribute_counts = self._analyze_clusters(
+                fit['labels'],
+                fit['probabilities'],
+                portfolio.attributes,
+                portfolio.attribute_encoder,
+                portfolio.record_ids
+            )
+        
+        with stage('statistics'):
+            statistics = self._statistics_from_counts(portfolio.distributions, clusters, portfolio.n_records)
+        
+        return self._finalize_profile(
+            user_id,
+            fit,
+            portfolio.features,
+            portfolio.encoder,
+            clusters,
+            attribute_counts,
+            statistics,
+            importance_mode,
+            fingerprint
+        )
+    
+    def _clamp_clusters(self, n_clusters: Union[int, str], n_records: int) -> Union[int, str]:
+        """Never ask for more clusters than records"""
+        if n_clusters != 'auto' and n_records < n_clusters:
+            logger.warning(f"Only {n_records} records, reducing clusters to {n_records}")
+            return max(1, n_records)
+        return n_clusters
+    
+    def _fit_models(
+        self,
+        features,
+        n_clusters: Union[int, str],
+        mini_batch: bool = False,
+        batch_size: int = 4096,
+        embeddings: Optional[np.ndarray] = None,
+        embedding_weight: float = 1.0
+    ) -> Dict[str, Any]:
+        """
+        Fit scaler, PCA and GMM on an encoded feature matrix
+        
+        With mini_batch and more than batch_size records, the GMM (or the
+        "auto" sweep) only sees one random batch; the other batches are then
+        folded into its sufficient statistics with incremental EM. With
+        embeddings the PCA input is the hybrid matrix (see _hybrid_matrix).
+        
+        Returns:
+            Dict with scaler, pca, gmm, gmm_stats, labels, probabilities,
+            n_clusters, cluster_selection (None unless n_clusters is "auto")
+            and feature_space (None for categorical features)
+        """
+        # sklearn costs over a second to import; keep it off the startup path
+        with stage('import_estimators'):
+            self._import_estimators('first profile build')
+        from sklearn.mixture import GaussianMixture as GaussianMixtureModel
+        from sklearn.preprocessing import StandardScaler
+        from sklearn.decomposition import PCA
         
         # Normalize features
-        scaler = StandardScaler()
-        features_scaled = scaler.fit_transform(features)
+        # Features are sparse, so only scale here; PCA centers implicitly
+        with stage('scaling'):
+            scaler = StandardScaler(with_mean=False)
+            features_scaled = scaler.fit_transform(features)
         
         # Apply PCA for dimensionality reduction
         # n_components must be <= min(n_samples, n_features)
-        n_pca_components = min(10, features_scaled.shape[0], features_scaled.shape[1])
-        pca = PCA(n_components=n_pca_components)
-        features_pca = pca.fit_transform(features_scaled)
+        feature_space = None
+        if embeddings is None:
+            # covariance_eigh works on sparse input in O(n_samples * n_features^2)
+            pca_input = features_scaled
+            svd_solver = 'covariance_eigh'
+        else:
+            # Scaled one-hot columns have unit variance and L2-normalized
+            # embeddings at most 1 in total, so scale the embedding block by
+            # sqrt(n one-hot columns) to balance the two at weight 1
+            feature_space = {
+                'mode': 'hybrid',
+                'embedding_dim': int(embeddings.shape[1]),
+                'embedding_scale': float(embedding_weight * np.sqrt(features.shape[1]))
+            }
+            with stage('scaling'):
+                pca_input = self._hybrid_matrix(features_scaled, embeddings, feature_space)
+            # Randomized SVD stays fast at embedding dimensionality
+            svd_solver = 'randomized'
+        
+        with stage('pca'):
+            n_pca_components = min(10, pca_input.shape[0], pca_input.shape[1])
+            pca = PCA(n_components=n_pca_components, svd_solver=svd_solver, random_state=42)
+            features_pca = pca.fit_transform(pca_input)
+        
+        n_samples = features_pca.shape[0]
+        batch_order = None
+        fit_sample = features_pca
+        if mini_batch and n_samples > batch_size:
+            batch_order = np.random.RandomState(42).permutation(n_samples)
+            fit_sample = features_pca[batch_order[:batch_size]]
         
         # Fit GMM
-        gmm = GaussianMixtureModel(
-            n_components=n_clusters,
-            covariance_type='full',
-            random_state=42,
-            max_iter=100
-        )
+        cluster_selection = None
+        if n_clusters == 'auto':
+            min_clusters, max_clusters = self.auto_cluster_range
+            with stage('cluster_selection'):
+                cluster_selection = select_n_clusters(
+                    fit_sample,
+                    min_clusters=min_clusters,
+                    max_clusters=max_clusters,
+                    n_jobs=self.n_jobs
+                )
+            gmm = cluster_selection['gmm']
+            n_clusters = cluster_selection['n_clusters']
+        else:
+            with stage('gmm'):
+                gmm = GaussianMixtureModel(
+                    n_components=n_clusters,
+                    covariance_type='full',
+                    random_state=42,
+                    max_iter=100
+                )
+                gmm.fit(fit_sample)
+        record_counts(clusters=n_clusters)
         
-        cluster_labels = gmm.fit_predict(features_pca)
-        probabilities = gmm.predict_proba(features_pca)
+        # Sufficient statistics let update_profile fold in new batches
+        # without refitting on the full history
+        with stage('gmm_statistics'):
+            if batch_order is None:
+                probabilities = gmm.predict_proba(features_pca)
+                gmm_stats = sufficient_statistics(features_pca, probabilities)
+            else:
+                gmm_stats = sufficient_statistics(fit_sample, gmm.predict_proba(fit_sample))
+                for start in range(batch_size, n_samples, batch_size):
+                    batch = features_pca[batch_order[start:start + batch_size]]
+                    _, gmm_stats = partial_fit(gmm, batch, gmm_stats)
+                probabilities = gmm.predict_proba(features_pca)
         
-        # Analyze clusters
-        clusters = self._analyze_clusters(
-            vlt_records, 
-            cluster_labels, 
-            probabilities,
-            features,
-            feature_names
-        )
+        return {
+            'scaler': scaler,
+            'pca': pca,
+            'gmm': gmm,
+            'gmm_stats': gmm_stats,
+            'labels': probabilities.argmax(axis=1),
+            'probabilities': probabilities,
+            'n_clusters': n_clusters,
+            'cluster_selection': cluster_selection,
+            'feature_space': feature_space
+        }
+    
+    def _embeddings_for_mode(self, vlt_records: List[Dict[str, Any]], feature_mode: str) -> Optional[np.ndarray]:
+        """Record embeddings for hybrid mode, None for categorical mode"""
+        if feature_mode == 'categorical':
+            return None
+        if feature_mode != 'hybrid':
+            raise ValueError(f"Unknown feature mode: {feature_mode}")
+        
+        embeddings = embedding_matrix(vlt_records)
+        if embeddings is None:
+            raise ValueError("Hybrid feature mode needs records with embeddings")
+        return embeddings
+    
+    @staticmethod
+    def _hybrid_matrix(
+        features_scaled,
+        embeddings: np.ndarray,
+        feature_space: Dict[str, Any]
+    ) -> np.ndarray:
+        """Dense float32 [scaled one-hot | scaled embeddings] matrix"""
+        return np.hstack([
+            features_scaled.toarray().astype(np.float32),
+            embeddings * np.float32(feature_space['embedding_scale'])
+        ])
+    
+    def _project(
+        self,
+        models: Dict[str, Any],
+        features,
+        vlt_records: List[Dict[str, Any]]
+    ) -> np.ndarray:
+        """Map encoded records into the GMM input space of fitted models"""
+        # Values first seen after fitting are outside the block the scaler and PCA know
+        features_scaled = models['scaler'].transform(features[:, :models['scaler'].n_features_in_])
+        
+        feature_space = models.get('feature_space')
+        if feature_space is not None:
+            embeddings = embedding_matrix(vlt_records, feature_space['embedding_dim'])
+            features_scaled = self._hybrid_matrix(features_scaled, embeddings, feature_space)
+        
+        return models['pca'].transform(features_scaled)
+    
+    def _finalize_profile(
+        self,
+        user_id: str,
+        fit: Dict[str, Any],
+        features,
+        encoder: CategoricalEncoder,
+        clusters: List[Dict[str, Any]],
+        attribute_counts: Dict[int, Dict[str, Dict[Any, int]]],
+        statistics: Dict[str, Any],
+        importance_mode: str,
+        fingerprint: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Assemble, save and cache a newly fitted profile and its models"""
+        feature_names = encoder.feature_names
+        cluster_labels = fit['labels']
+        n_clusters = fit['n_clusters']
+        
+        deferred_importance = importance_mode == 'deferred'
+        immediate_mode = 'mutual_info' if deferred_importance else importance_mode
+        
+        with stage('feature_importance'):
+            feature_importance = self._compute_feature_importance(
+                features, feature_names, cluster_labels, immediate_mode
+            )
         
         # Create profile
         profile = {
             'user_id': user_id,
-            'n_records': len(vlt_records),
+            'n_records': int(features.shape[0]),
             'n_clusters': n_clusters,
             'clusters': clusters,
-            'statistics': self._compute_statistics(vlt_records, clusters),
-            'feature_importance': self._compute_feature_importance(features, feature_names, cluster_labels),
+            'statistics': statistics,
+            'feature_importance': feature_importance,
+            'feature_importance_method': immediate_mode,
+            'feature_importance_pending': deferred_importance,
+            'feature_mode': 'categorical' if fit['feature_space'] is None else fit['feature_space']['mode'],
+            # Content the profile was built from; cleared once updates add records
+            'fingerprint': fingerprint,
             'created_at': np.datetime64('now').astype(str),
             'updated_at': np.datetime64('now').astype(str)
         }
         
+        if fit['cluster_selection'] is not None:
+            profile['cluster_selection'] = {
+                'mode': 'auto',
+                'n_clusters': n_clusters,
+                'bic': {str(k): bic for k, bic in fit['cluster_selection']['bic'].items()}
+            }
+        
+        models = {
+            'gmm': fit['gmm'],
+            'scaler': fit['scaler'],
+            'pca': fit['pca'],
+            'encoder': encoder,
+            'gmm_stats': fit['gmm_stats'],
+            'attribute_counts': attribute_counts,
+            'feature_space': fit['feature_space']
+        }
+        
+        self._attach_build_metrics(profile)
+        
         # Save model and profile
-        self._save_profile(user_id, profile, gmm, scaler, pca)
+        with stage('persistence'):
+            self._save_profile(user_id, profile, models)
+        with stage('scorer_export'):
+            self._export_scorer(user_id, profile, models)
         
         # Cache
-        self.profiles[user_id] = profile
+        self.profiles.put(user_id, profile)
+        self.model_cache.put(user_id, models)
+        self.scorer_cache.pop(user_id)
+        
+        if deferred_importance:
+            self._schedule_forest_importance(user_id, profile, features, feature_names, cluster_labels)
         
         logger.info(f"Style profile created with {n_clusters} clusters")
         
@@ -122,196 +570,420 @@ class StyleProfiler:
     ) -> Dict[str, Any]:
         """
         Update existing profile with new VLT data
-        Uses online learning to adapt clusters
+        Uses incremental EM: the new batch is assigned under the current
+        mixture, its sufficient statistics are added to the stored
+        accumulators and weights, means and covariances are re-estimated.
+        Cost is proportional to the batch size.
         """
         logger.info(f"Updating style profile for {user_id} with {len(new_vlt_records)} new records")
         
-        # Load existing profile
-        profile = self.get_profile(user_id)
-        if not profile:
-            raise ValueError(f"No existing profile found for user {user_id}")
+        with self._user_lock(user_id), StageTimer('update'):
+            with stage('load'):
+                # Load existing profile
+                profile = self.get_profile(user_id)
+                if not profile:
+                    raise ValueError(f"No existing profile found for user {user_id}")
+                
+                # Load models
+                models = self._load_models(user_id)
+            
+            try:
+                return self._apply_update(user_id, profile, models, new_vlt_records)
+            except Exception:
+                # Cached profile and models are updated in place and may be half-applied
+                self.invalidate(user_id)
+                raise
+    
+    def _apply_update(
+        self,
+        user_id: str,
+        profile: Dict[str, Any],
+        models: Dict[str, Any],
+        new_vlt_records: List[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """Fold new records into a loaded profile and its models, then save both"""
+        gmm, encoder = models['gmm'], models['encoder']
+        if encoder is None:
+            raise ValueError(
+                f"Profile for user {user_id} was saved without a feature vocabulary, "
+                "recreate it before updating"
+            )
         
-        # Load models
-        gmm, scaler, pca = self._load_models(user_id)
+        # Extract features from new records in the fitted feature space
+        # Values first seen here extend the vocabulary but stay outside the
+        # block the scaler and PCA were fitted on until the next create
+        with stage('extract_features'):
+            new_features, feature_names, encoder = self._extract_features(new_vlt_records, encoder)
+        record_counts(records=len(new_vlt_records), features=new_features.shape[1], clusters=gmm.n_components)
+        with stage('project'):
+            new_features_pca = self._project(models, new_features, new_vlt_records)
         
-        # Extract features from new records
-        new_features, feature_names = self._extract_features(new_vlt_records)
-        new_features_scaled = scaler.transform(new_features)
-        new_features_pca = pca.transform(new_features_scaled)
+        # Artifacts saved before accumulators were persisted: recover them
+        # from the fitted parameters
+        if models.get('gmm_stats') is None:
+            models['gmm_stats'] = statistics_from_model(gmm, profile['n_records'])
+        if models.get('attribute_counts') is None:
+            models['attribute_counts'] = {
+                cluster['id']: {
+                    attr: {value: count}
+                    for attr, (value, count) in cluster['dominant_attributes'].items()
+                }
+                for cluster in profile['clusters']
+            }
         
-        # Predict clusters for new data
-        new_labels = gmm.predict(new_features_pca)
-        new_probabilities = gmm.predict_proba(new_features_pca)
+        # Incremental EM step: responsibilities under the current mixture,
+        # then re-estimate parameters from the merged statistics
+        with stage('partial_fit'):
+            new_probabilities, models['gmm_stats'] = partial_fit(gmm, new_features_pca, models['gmm_stats'])
+        new_labels = new_probabilities.argmax(axis=1)
+        
+        profile['n_records'] += len(new_vlt_records)
+        profile['fingerprint'] = None
         
         # Update cluster statistics (online update)
-        updated_clusters = self._update_cluster_stats(
-            profile['clusters'],
-            new_vlt_records,
-            new_labels,
-            new_probabilities,
-            new_features,
-            feature_names
-        )
+        with stage('update_clusters'):
+            updated_clusters = self._update_cluster_stats(
+                profile['clusters'],
+                new_vlt_records,
+                new_labels,
+                new_probabilities,
+                models['attribute_counts'],
+                profile['n_records']
+            )
         
         # Update profile
         profile['clusters'] = updated_clusters
-        profile['n_records'] += len(new_vlt_records)
         profile['updated_at'] = np.datetime64('now').astype(str)
+        # A pending deferred importance job drops its result once the profile is updated
+        if profile.get('feature_importance_pending'):
+            profile['feature_importance_pending'] = False
         
         # Recompute statistics
-        all_vlt_records = self._get_all_vlt_records(user_id)  # Would need to fetch from DB
-        profile['statistics'] = self._compute_statistics(all_vlt_records, updated_clusters)
+        # Fold the batch into the stored distribution counts; no portfolio refetch
+        with stage('statistics'):
+            profile['statistics'] = self._compute_statistics(
+                new_vlt_records, updated_clusters, previous=profile.get('statistics'), n_records=profile['n_records']
+            )
+        
+        self._attach_build_metrics(profile)
         
         # Save updated profile
-        self._save_profile(user_id, profile, gmm, scaler, pca)
-        self.profiles[user_id] = profile
+        with stage('persistence'):
+            self._save_profile(user_id, profile, models)
+        with stage('scorer_export'):
+            self._export_scorer(user_id, profile, models)
+        self.profiles.put(user_id, profile)
+        self.model_cache.put(user_id, models)
+        self.scorer_cache.pop(user_id)
         
         logger.info(f"Profile updated, now with {profile['n_records']} total records")
         
         return profile
     
     def get_profile(self, user_id: str) -> Optional[Dict[str, Any]]:
-        """Get cached or load profile from disk"""
-        if user_id in self.profiles:
-            return self.profiles[user_id]
-        
-        profile_path = os.path.join(self.models_dir, f"{user_id}_profile.joblib")
-        if os.path.exists(profile_path):
-            profile = joblib.load(profile_path)
-            self.profiles[user_id] = profile
+        """Get cached or load profile from the store"""
+        self._revalidate(user_id)
+        profile = self.profiles.get(user_id)
+        if profile is not None:
+            return profile
+        
+        generation = self.store.generation()
+        profile = self.store.load_profile(user_id)
+        if profile is not None:
+            self.profiles.put(user_id, profile)
+            self._cache_versions.put(user_id, (profile.get('version'), generation))
             return profile
         
         return None
     
-    def _extract_features(self, vlt_records: List[Dict[str, Any]]) -> tuple:
+    def invalidate(self, user_id: str):
+        """Drop cached profile and models for a user, e.g. after another process wrote them"""
+        self.profiles.pop(user_id)
+        self.model_cache.pop(user_id)
+        self.scorer_cache.pop(user_id)
+        self._cache_versions.pop(user_id)
+    
+    def _revalidate(self, user_id: str):
         """
-        Extract numerical features from VLT records
-        Uses one-hot encoding for categorical variables
+        Invalidate a user's cached entries if another process saved the profile
+        
+        Costs one store generation check per call. The user's stored version
+        is only read after some other process has written to the store, and
+        the caches are dropped only if that version differs from the cached one.
         """
-        feature_vectors = []
-        feature_names = []
+        generation = self.store.generation()
+        if generation is None:
+            return
         
-        # Collect all unique values for categorical variables
-        categorical_values = defaultdict(set)
-        for record in vlt_records:
-            attrs = record.get('attributes', {})
-            colors = record.get('colors', {})
-            style = record.get('style', {})
-            
-            for key in ['silhouette', 'neckline', 'sleeveLength', 'length', 'waistline', 'fabrication']:
-                if key in attrs:
-                    categorical_values[key].add(attrs[key])
-            
-            if 'primary' in colors:
-                categorical_values['primary_color'].add(colors['primary'])
-            if 'finish' in colors:
-                categorical_values['finish'].add(colors['finish'])
-            
-            for key in ['overall', 'formality', 'aesthetic', 'mood']:
-                if key in style:
-                    categorical_values[key].add(style[key])
+        cached = self._cache_versions.get(user_id)
+        if cached is not None and cached[1] == generation:
+            return
         
-        # Create one-hot encoding
-        for record in vlt_records:
-            feature_vector = []
-            
-            attrs = record.get('attributes', {})
-            colors = record.get('colors', {})
-            style = record.get('style', {})
-            
-            # One-hot encode each categorical variable
-            for key, values in categorical_values.items():
-                for value in sorted(values):
-                    if key in ['silhouette', 'neckline', 'sleeveLength', 'length', 'waistline', 'fabrication']:
-                        feature_vector.append(1.0 if attrs.get(key) == value else 0.0)
-                    elif key == 'primary_color':
-                        feature_vector.append(1.0 if colors.get('primary') == value else 0.0)
-                    elif key == 'finish':
-                        feature_vector.append(1.0 if colors.get('finish') == value else 0.0)
-                    else:
-                        feature_vector.append(1.0 if style.get(key.split('_')[0] if '_' in key else key) == value else 0.0)
-                    
-                    if len(feature_vectors) == 0:
-                        feature_names.append(f"{key}_{value}")
-            
-            feature_vectors.append(feature_vector)
+        version = self.store.version(user_id)
+        if cached is not None and cached[0] == version:
+            self._cache_versions.put(user_id, (version, generation))
+            return
         
-        return np.array(feature_vectors), feature_names
+        if cached is not None:
+            logger.info(f"Profile for {user_id} changed in another process (version {cached[0]} -> {version})")
+        # Without a recorded version the cached entries cannot be trusted either
+        self.invalidate(user_id)
     
-    def _analyze_clusters(
+    def _user_lock(self, user_id: str) -> threading.Lock:
+        return self._user_locks[hash(user_id) % len(self._user_locks)]
+    
+    def list_profiles(self, limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
+        """Profile summaries, most recently updated first"""
+        return self.store.list_profiles(limit=limit, offset=offset)
+    
+    def assign_records(
+        self,
+        user_id: str,
+        vlt_records: List[Dict[str, Any]],
+        return_probabilities: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Assign records to the style clusters of an existing profile
+        
+        Read-only: scores with a cached numpy StyleScorer (memory-mapped from
+        the user's scorer artifact, or built from the fitted scaler, PCA and
+        GMM), ignores values outside its vocabulary and never writes to the
+        store. The user lock is only taken to build a scorer without artifact.
+        
+        Returns:
+            Dict with user_id and one assignment per record (record_id,
+            cluster_id, style_summary, confidence and optionally the
+            probabilities over all clusters)
+        """
+        if not vlt_records:
+            return {'user_id': user_id, 'assignments': []}
+        
+        # Loaded first so the scorer is cached under the profile's recorded version
+        profile = self.get_profile(user_id)
+        summaries = {cluster['id']: cluster.get('style_summary') for cluster in profile['clusters']} if profile else {}
+        
+        with StageTimer('assign'):
+            record_counts(records=len(vlt_records))
+            with stage('load_scorer'):
+                scorer, encoder = self._scorer(user_id)
+            with stage('score'):
+                features = encoder.transform(vlt_records)
+                embeddings = None
+                if scorer.embedding_dim is not None:
+                    embeddings = embedding_matrix(vlt_records, scorer.embedding_dim)
+                probabilities = scorer.predict_proba(scorer.project(features, embeddings))
+        labels = probabilities.argmax(axis=1)
+        confidences = probabilities[np.arange(len(labels)), labels]
+        
+        assignments = []
+        for i, record_id in enumerate(record_ids(vlt_records)):
+            assignment = {
+                'record_id': record_id,
+                'cluster_id': int(labels[i]),
+                'style_summary': summaries.get(int(labels[i])),
+                'confidence': float(confidences[i])
+            }
+            if return_probabilities:
+                assignment['probabilities'] = probabilities[i].tolist()
+            assignments.append(assignment)
+        
+        return {'user_id': user_id, 'assignments': assignments}
+    
+    def _scorer(self, user_id: str) -> tuple:
+        """
+        Cached (scorer, encoder) for a user
+        
+        Loaded from the scorer artifact when it was written for the stored
+        profile version. Otherwise built from the models under the user lock,
+        so it never sees a half-applied update.
+        """
+        self._revalidate(user_id)
+        cached = self.scorer_cache.get(user_id)
+        if cached is not None:
+            return cached
+        
+        cached = self._current_artifact(user_id)
+        if cached is None:
+            with self._user_lock(user_id):
+                models = self._load_models(user_id)
+                if models['encoder'] is None:
+                    raise ValueError(
+                        f"Profile for user {user_id} was saved without a feature vocabulary, "
+                        "recreate it before assigning records"
+                    )
+                cached = (StyleScorer.from_models(models), models['encoder'])
+        
+        self.scorer_cache.put(user_id, cached)
+        return cached
+    
+    def _scorer_path(self, user_id: str) -> str:
+        return os.path.join(self.scorers_dir, f"{user_id}.scorer")
+    
+    def _current_artifact(self, user_id: str) -> Optional[tuple]:
+        """
+        (scorer, encoder) from the user's artifact, None if it is missing or
+        was written for another profile version
+        
+        The artifact is rewritten after the profile is saved, so another
+        process can briefly see a new version next to the old artifact.
+        """
+        try:
+            scorer, encoder, metadata = load_artifact(self._scorer_path(user_id))
+        except FileNotFoundError:
+            return None
+        if metadata.get('version') is None or metadata['version'] != self.store.version(user_id):
+            return None
+        return scorer, encoder
+    
+    def _export_scorer(self, user_id: str, profile: Dict[str, Any], models: Dict[str, Any]):
+        """
+        Write the user's scorer artifact, stamped with the saved profile version
+        
+        On failure the previous artifact is removed, so assignment falls back
+        to the models instead of scoring with an outdated scorer.
+        """
+        path = self._scorer_path(user_id)
+        try:
+            save_artifact(
+                path,
+                StyleScorer.from_models(models),
+                models['encoder'],
+                metadata={
+                    'user_id': user_id,
+                    'version': profile.get('version'),
+                    'updated_at': profile['updated_at'],
+                    'style_summaries': {str(c['id']): c.get('style_summary') for c in profile['clusters']}
+                }
+            )
+        except Exception as e:
+            logger.warning(f"Could not export scorer for {user_id}: {str(e)}")
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+    
+    def _restamp_scorer(self, user_id: str, previous_version: Optional[int], version: Optional[int]):
+        """Carry the artifact over to a profile save that left the models unchanged"""
+        path = self._scorer_path(user_id)
+        try:
+            scorer, encoder, metadata = load_artifact(path, mmap=False)
+        except FileNotFoundError:
+            return
+        if metadata.get('version') == previous_version:
+            save_artifact(path, scorer, encoder, {**metadata, 'version': version})
+    
+    def export_scorer(self, user_id: str) -> str:
+        """Path of the user's scorer artifact, writing it first if missing or outdated (e.g. legacy profiles)"""
+        path = self._scorer_path(user_id)
+        if self._current_artifact(user_id) is None:
+            with self._user_lock(user_id):
+                profile = self.get_profile(user_id)
+                if not profile:
+                    raise ValueError(f"No existing profile found for user {user_id}")
+                models = self._load_models(user_id)
+                if models['encoder'] is None:
+                    raise ValueError(
+                        f"Profile for user {user_id} was saved without a feature vocabulary, "
+                        "recreate it before exporting"
+                    )
+                self._export_scorer(user_id, profile, models)
+            if self._current_artifact(user_id) is None:
+                raise RuntimeError(f"Could not export scorer for {user_id}")
+        return path
+    
+    def _extract_features(
         self,
         vlt_records: List[Dict[str, Any]],
+        encoder: Optional[CategoricalEncoder] = None
+    ) -> tuple:
+        """
+        Extract numerical features from VLT records
+        Uses sparse one-hot encoding for categorical variables
+        
+        Without an encoder a new vocabulary is fitted on the records. With a
+        persisted encoder the records are encoded in its feature space and
+        unseen values are appended as new columns.
+        
+        Returns:
+            (CSR feature matrix, feature names, encoder)
+        """
+        if encoder is None:
+            encoder = CategoricalEncoder()
+            features = encoder.fit_transform(vlt_records)
+        else:
+            features = encoder.transform(vlt_records, extend=True)
+        
+        return features, encoder.feature_names, encoder
+    
+    def _analyze_clusters(
+        self,
         labels: np.ndarray,
         probabilities: np.ndarray,
-        features: np.ndarray,
-        feature_names: List[str]
-    ) -> List[Dict[str, Any]]:
-        """Analyze and characterize each cluster"""
+        attributes,
+        attribute_encoder: AttributeEncoder,
+        record_ids: List[Any],
+        n_representatives: int = 3
+    ) -> tuple:
+        """
+        Analyze and characterize each cluster
+        
+        Attribute counts for every cluster come from one sparse product of
+        the label indicator and the attribute matrix; sizes, confidences and
+        representatives are grouped with bincount and a single sort.
+        
+        Returns:
+            (clusters sorted by size, attribute value counts per cluster id)
+        """
+        n_clusters = int(labels.max()) + 1
+        n_records = len(labels)
+        
+        counts = cluster_value_counts(labels, attributes, n_clusters)
+        sizes = np.bincount(labels, minlength=n_clusters)
+        member_probs = probabilities[np.arange(n_records), labels]
+        confidence_sums = np.bincount(labels, weights=member_probs, minlength=n_clusters)
+        
+        # Members grouped by cluster, most confident first
+        by_cluster = np.lexsort((-member_probs, labels))
+        starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+        
         clusters = []
-        n_clusters = labels.max() + 1
+        attribute_counts = {}
         
         for cluster_id in range(n_clusters):
-            cluster_mask = labels == cluster_id
-            cluster_records = [r for i, r in enumerate(vlt_records) if cluster_mask[i]]
-            cluster_features = features[cluster_mask]
-            cluster_probs = probabilities[cluster_mask, cluster_id]
-            
-            # Find dominant attributes
-            dominant_attrs = self._find_dominant_attributes(cluster_records)
+            size = int(sizes[cluster_id])
+            attribute_counts[cluster_id] = attribute_encoder.counts_by_attribute(counts[cluster_id])
+            dominant_attrs = attribute_encoder.dominant(counts[cluster_id])
+            top = by_cluster[starts[cluster_id]:starts[cluster_id] + min(size, n_representatives)]
             
-            # Compute cluster statistics
-            cluster_info = {
+            clusters.append({
                 'id': cluster_id,
-                'size': int(cluster_mask.sum()),
-                'percentage': float(cluster_mask.sum() / len(vlt_records) * 100),
+                'size': size,
+                'percentage': float(size / n_records * 100),
                 'dominant_attributes': dominant_attrs,
-                'centroid_confidence': float(cluster_probs.mean()),
-                'representative_records': self._find_representative_records(cluster_records, cluster_probs),
+                'centroid_confidence': float(confidence_sums[cluster_id] / size) if size else 0.0,
+                'representative_records': [record_ids[i] for i in top],
                 'style_summary': self._summarize_cluster_style(dominant_attrs)
-            }
-            
-            clusters.append(cluster_info)
+            })
         
         # Sort by size
         clusters.sort(key=lambda x: x['size'], reverse=True)
         
-        return clusters
+        return clusters, attribute_counts
     
     def _find_dominant_attributes(self, records: List[Dict[str, Any]]) -> Dict[str, Any]:
         """Find most common attributes in a cluster"""
-        attr_counts = defaultdict(lambda: defaultdict(int))
-        
-        for record in records:
-            attrs = record.get('attributes', {})
-            colors = record.get('colors', {})
-            style = record.get('style', {})
-            
-            for key, value in attrs.items():
-                attr_counts[key][value] += 1
-            
-            if 'primary' in colors:
-                attr_counts['color'][colors['primary']] += 1
-            
-            for key, value in style.items():
-                attr_counts[f'style_{key}'][value] += 1
-        
-        # Find most common value for each attribute
+        attribute_encoder = AttributeEncoder()
+        counts = np.asarray(attribute_encoder.transform(records).sum(axis=0)).ravel()
+        return attribute_encoder.dominant(counts)
+    
+    def _dominant_from_counts(self, attr_counts: Dict[str, Dict[Any, int]]) -> Dict[str, Any]:
+        """Find most common value for each attribute"""
         dominant = {}
         for attr_name, values in attr_counts.items():
             dominant[attr_name] = max(values.items(), key=lambda x: x[1])
         
         return dominant
     
-    def _find_representative_records(
-        self,
-        records: List[Dict[str, Any]],
-        probabilities: np.ndarray,
-        n_representatives: int = 3
-    ) -> List[str]:
-        """Find most representative records in cluster"""
-        top_indices = np.argsort(probabilities)[-n_representatives:][::-1]
-        return [records[i].get('imageId', records[i].get('id', f'record_{i}')) for i in top_indices if i < len(records)]
-    
     def _summarize_cluster_style(self, dominant_attrs: Dict[str, Any]) -> str:
         """
         Generate Stage 2 style profile names based on dominant attributes
@@ -401,28 +1073,45 @@ class StyleProfiler:
     def _compute_statistics(
         self,
         vlt_records: List[Dict[str, Any]],
-        clusters: List[Dict[str, Any]]
+        clusters: List[Dict[str, Any]],
+        previous: Optional[Dict[str, Any]] = None,
+        n_records: Optional[int] = None
     ) -> Dict[str, Any]:
-        """Compute overall portfolio statistics"""
-        # Aggregate statistics
-        garment_types = defaultdict(int)
-        all_colors = defaultdict(int)
-        all_styles = defaultdict(int)
-        
-        for record in vlt_records:
-            garment_types[record.get('garment_type', 'unknown')] += 1
-            
-            if 'colors' in record and 'primary' in record['colors']:
-                all_colors[record['colors']['primary']] += 1
-            
-            if 'style' in record and 'overall' in record['style']:
-                all_styles[record['style']['overall']] += 1
+        """
+        Compute overall portfolio statistics
         
+        With previous statistics the records are a new batch: their value
+        counts are added to the stored distributions, so the cost is
+        O(batch) and n_records is the portfolio total including the batch.
+        """
+        distributions = count_distributions(vlt_records)
+        if previous is not None:
+            distributions = merge_distributions(
+                {name: dict(previous.get(name) or {}) for name in DISTRIBUTION_NAMES},
+                distributions
+            )
+            # Every record counts once towards the garment distribution
+            counted = sum(distributions['garment_distribution'].values())
+            if counted != n_records:
+                logger.warning(
+                    f"Distributions cover {counted} of {n_records} records; "
+                    "recreate the profile to rebuild them"
+                )
+        
+        return self._statistics_from_counts(
+            distributions, clusters, len(vlt_records) if n_records is None else n_records
+        )
+    
+    def _statistics_from_counts(
+        self,
+        distributions: Dict[str, Dict[Any, int]],
+        clusters: List[Dict[str, Any]],
+        n_records: int
+    ) -> Dict[str, Any]:
+        """Portfolio statistics from garment, color and style value counts"""
         return {
-            'garment_distribution': dict(garment_types),
-            'color_distribution': dict(all_colors),
-            'style_distribution': dict(all_styles),
-            'diversity_score': len(clusters) / len(vlt_records) if vlt_records else 0,
+            **distributions,
+            'diversity_score': len(clusters) / n_records if n_records else 0,
             'largest_cluster_percentage': max(c['percentage'] for c in clusters) if clusters else 0
         }
     
@@ -430,45 +1119,176 @@ class StyleProfiler:
         self,
         features: np.ndarray,
         feature_names: List[str],
-        labels: np.ndarray
+        labels: np.ndarray,
+        mode: str = 'mutual_info'
     ) -> Dict[str, float]:
-        """Compute which features are most important for clustering"""
-        from sklearn.ensemble import RandomForestClassifier
+        """
+        Compute which features are most important for clustering
         
+        'mutual_info' and 'centroid' are closed-form scores over the
+        cluster x feature count matrix; 'forest' trains a RandomForest on the
+        cluster labels. Scores are normalized to sum to 1.
+        """
         if len(np.unique(labels)) < 2:
             return {}
         
-        clf = RandomForestClassifier(n_estimators=50, random_state=42)
-        clf.fit(features, labels)
+        if mode == 'forest':
+            from sklearn.ensemble import RandomForestClassifier
+            
+            clf = RandomForestClassifier(n_estimators=50, random_state=42)
+            clf.fit(features, labels)
+            scores = clf.feature_importances_
+        elif mode in ('mutual_info', 'centroid'):
+            counts = cluster_value_counts(labels, features, int(labels.max()) + 1)
+            cluster_sizes = np.bincount(labels, minlength=counts.shape[0]).astype(np.float64)
+            scorer = mutual_information if mode == 'mutual_info' else centroid_contrast
+            scores = scorer(counts, cluster_sizes)
+            total = scores.sum()
+            scores = scores / total if total > 0 else scores
+        else:
+            raise ValueError(f"Unknown feature importance mode: {mode}")
         
-        importance = dict(zip(feature_names, clf.feature_importances_))
+        importance = dict(zip(feature_names, (float(score) for score in scores)))
         # Return top 10
         sorted_importance = sorted(importance.items(), key=lambda x: x[1], reverse=True)[:10]
         
         return dict(sorted_importance)
     
+    def _schedule_forest_importance(
+        self,
+        user_id: str,
+        profile: Dict[str, Any],
+        features: np.ndarray,
+        feature_names: List[str],
+        labels: np.ndarray
+    ):
+        """Compute forest importance in the background and patch the stored profile"""
+        if self._importance_executor is None:
+            self._importance_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='importance')
+        
+        # The patch only applies to the profile as saved now
+        stamp = (profile['created_at'], profile['updated_at'], profile.get('version'))
+        self._importance_executor.submit(
+            self._patch_forest_importance, user_id, stamp, features, feature_names, labels
+        )
+    
+    def _patch_forest_importance(
+        self,
+        user_id: str,
+        stamp: tuple,
+        features: np.ndarray,
+        feature_names: List[str],
+        labels: np.ndarray
+    ):
+        """
+        Background job: replace the provisional importance if the profile
+        was not recreated or updated meanwhile
+        
+        The forest is fitted without the user lock; the current profile is
+        re-read, copied, patched and saved under it, so a concurrent update
+        is never saved half-applied.
+        """
+        try:
+            with StageTimer('deferred_importance'):
+                with stage('feature_importance'):
+                    importance = self._compute_feature_importance(features, feature_names, labels, 'forest')
+                
+                with self._user_lock(user_id):
+                    profile = self.get_profile(user_id)
+                    if not profile or (profile.get('created_at'), profile.get('updated_at'), profile.get('version')) != stamp:
+                        logger.info(f"Profile for {user_id} changed, dropping deferred feature importance")
+                        return
+                    
+                    profile = {
+                        **profile,
+                        'feature_importance': importance,
+                        'feature_importance_method': 'forest',
+                        'feature_importance_pending': False
+                    }
+                    with stage('persistence'):
+                        self._save_profile(user_id, profile)
+                    self._restamp_scorer(user_id, stamp[2], profile['version'])
+                    self.profiles.put(user_id, profile)
+            
+            logger.info(f"Deferred feature importance patched for {user_id}")
+        
+        except Exception as e:
+            logger.error(f"Deferred feature importance failed for {user_id}: {str(e)}")
+    
+    def _attach_build_metrics(self, profile: Dict[str, Any]):
+        """
+        With record_timings, store the running operation's stage timings as
+        profile['build_metrics']; persistence happens after this snapshot and
+        is only reported through services.metrics
+        """
+        timer = current_timer()
+        if self.record_timings and timer is not None:
+            profile['build_metrics'] = timer.summary()
+    
     def _save_profile(
         self,
         user_id: str,
         profile: Dict[str, Any],
-        gmm: GaussianMixtureModel,
-        scaler: StandardScaler,
-        pca: PCA
+        models: Optional[Dict[str, Any]] = None
     ):
-        """Save profile and models to disk"""
-        profile_path = os.path.join(self.models_dir, f"{user_id}_profile.joblib")
-        models_path = os.path.join(self.models_dir, f"{user_id}_models.joblib")
+        """
+        Save profile and models to the store
+        The encoder is persisted as its vocabulary; without models only the profile is written
+        """
+        artifact = None
+        if models is not None:
+            artifact = {key: value for key, value in models.items() if key != 'encoder'}
+            artifact['vocabulary'] = models['encoder'].to_dict()
         
-        joblib.dump(profile, profile_path)
-        joblib.dump({'gmm': gmm, 'scaler': scaler, 'pca': pca}, models_path)
+        # Read before writing: this process's own save does not change it
+        generation = self.store.generation()
+        profile['version'] = self.store.save(user_id, profile, artifact)
+        self._cache_versions.put(user_id, (profile['version'], generation))
         
         logger.info(f"Profile and models saved for {user_id}")
     
-    def _load_models(self, user_id: str) -> tuple:
-        """Load GMM, scaler, and PCA models"""
-        models_path = os.path.join(self.models_dir, f"{user_id}_models.joblib")
-        models = joblib.load(models_path)
-        return models['gmm'], models['scaler'], models['pca']
+    def _load_models(self, user_id: str) -> Dict[str, Any]:
+        """
+        Load GMM, scaler, PCA models, the feature encoder and online statistics
+        
+        Artifacts saved before vocabularies or online statistics were persisted
+        load with None for 'encoder', 'gmm_stats' and 'attribute_counts';
+        'feature_space' is None for categorical-only models
+        """
+        self._revalidate(user_id)
+        models = self.model_cache.get(user_id)
+        if models is not None:
+            return models
+        
+        models = self.store.load_models(user_id)
+        if models is None:
+            raise ValueError(f"No saved models found for user {user_id}")
+        
+        vocabulary = models.pop('vocabulary', None)
+        models['encoder'] = CategoricalEncoder.from_dict(vocabulary) if vocabulary else None
+        models.setdefault('gmm_stats', None)
+        models.setdefault('attribute_counts', None)
+        models.setdefault('feature_space', None)
+        
+        self.model_cache.put(user_id, models)
+        return models
+    
+    def cache_stats(self) -> Dict[str, Any]:
+        """Hit/miss/eviction counters and memory use of the profile, model and scorer caches"""
+        return {
+            'profiles': self.profiles.stats(),
+            'models': self.model_cache.stats(),
+            'scorers': self.scorer_cache.stats()
+        }
+    
+    @staticmethod
+    def _cache_from_env(prefix: str, max_entries: int, max_mb: float, ttl: float) -> LRUCache:
+        """Build a cache, letting {prefix}_ENTRIES / _MB / _TTL override the defaults"""
+        return LRUCache(
+            max_entries=int(os.getenv(f'{prefix}_ENTRIES', max_entries)),
+            max_bytes=int(float(os.getenv(f'{prefix}_MB', max_mb)) * 1024 * 1024),
+            ttl=float(os.getenv(f'{prefix}_TTL', ttl))
+        )
     
     def _update_cluster_stats(
         self,
@@ -476,26 +1296,77 @@ class StyleProfiler:
         new_records: List[Dict[str, Any]],
         new_labels: np.ndarray,
         new_probabilities: np.ndarray,
-        new_features: np.ndarray,
-        feature_names: List[str]
+        attribute_counts: Dict[int, Dict[str, Dict[Any, int]]],
+        n_records: int,
+        n_representatives: int = 3
     ) -> List[Dict[str, Any]]:
-        """Update cluster statistics with new data (online learning)"""
-        # This is a simplified update - in production you'd want more sophisticated online learning
-        for cluster_id, cluster in enumerate(existing_clusters):
-            new_cluster_mask = new_labels == cluster_id
-            if new_cluster_mask.any():
-                new_cluster_records = [r for i, r in enumerate(new_records) if new_cluster_mask[i]]
-                cluster['size'] += len(new_cluster_records)
-                # Recompute dominant attributes (simplified - should weight by existing data)
-                cluster['dominant_attributes'] = self._find_dominant_attributes(new_cluster_records)
-        
-        return existing_clusters
-    
-    def _get_all_vlt_records(self, user_id: str) -> List[Dict[str, Any]]:
-        """Fetch all VLT records for user from database"""
-        # TODO: Implement database fetch
-        # For now, return empty list - this should query the Node.js backend
-        return []
+        """
+        Update cluster statistics with new data (online learning)
+        
+        Attribute counts are merged into the per-cluster history, so dominant
+        attributes reflect every record seen so far. Clusters are matched by
+        their GMM component id, not their position in the size-sorted list.
+        The batch is counted per cluster with one sparse product.
+        """
+        clusters_by_id = {cluster['id']: cluster for cluster in existing_clusters}
+        
+        n_clusters = new_probabilities.shape[1]
+        attribute_encoder = AttributeEncoder()
+        batch_counts = cluster_value_counts(new_labels, attribute_encoder.transform(new_records), n_clusters)
+        batch_sizes = np.bincount(new_labels, minlength=n_clusters)
+        member_probs = new_probabilities[np.arange(len(new_labels)), new_labels]
+        confidence_sums = np.bincount(new_labels, weights=member_probs, minlength=n_clusters)
+        ids = record_ids(new_records)
+        
+        for cluster_id in np.flatnonzero(batch_sizes):
+            cluster_id = int(cluster_id)
+            
+            counts = attribute_counts.setdefault(cluster_id, {})
+            for attr_name, values in attribute_encoder.counts_by_attribute(batch_counts[cluster_id]).items():
+                merged = counts.setdefault(attr_name, {})
+                for value, count in values.items():
+                    merged[value] = merged.get(value, 0) + count
+            dominant_attrs = self._dominant_from_counts(counts)
+            
+            cluster = clusters_by_id.get(cluster_id)
+            if cluster is None:
+                # Component had no members when the profile was created
+                members = np.flatnonzero(new_labels == cluster_id)
+                top = members[np.argsort(-member_probs[members], kind='stable')[:n_representatives]]
+                cluster = {
+                    'id': cluster_id,
+                    'size': 0,
+                    'centroid_confidence': 0.0,
+                    'representative_records': [ids[i] for i in top]
+                }
+                clusters_by_id[cluster_id] = cluster
+            
+            # Running mean of membership confidence
+            old_size = cluster['size']
+            cluster['size'] = old_size + int(batch_sizes[cluster_id])
+            cluster['centroid_confidence'] = float(
+                (cluster['centroid_confidence'] * old_size + confidence_sums[cluster_id]) / cluster['size']
+            )
+            cluster['dominant_attributes'] = dominant_attrs
+            cluster['style_summary'] = self._summarize_cluster_style(dominant_attrs)
+        
+        clusters = list(clusters_by_id.values())
+        for cluster in clusters:
+            cluster['percentage'] = float(cluster['size'] / n_records * 100) if n_records else 0.0
+        
+        clusters.sort(key=lambda x: x['size'], reverse=True)
+        
+        return clusters
+    
+    def warmup(self):
+        """Import the sklearn estimators used by profile builds ahead of the first request"""
+        self._import_estimators('StyleProfiler warmup')
+    
+    @staticmethod
+    def _import_estimators(reason: str):
+        """Timed first import of sklearn, reported by services.startup"""
+        for module_name in ('sklearn.preprocessing', 'sklearn.decomposition', 'sklearn.mixture'):
+            timed_import(module_name, reason=reason)
     
     def is_ready(self) -> bool:
         """Check if service is ready"""
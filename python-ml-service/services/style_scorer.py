@@ -0,0 +1,182 @@
+"""
+Pure-numpy scoring for fitted style profiles
+Folds scaler and PCA into one affine map and evaluates the full-covariance
+GMM posterior directly, without sklearn's per-call input validation.
+Scorers can be saved as a flat float32 artifact that loads by memory-mapping,
+without importing sklearn.
+"""
+import numpy as np
+import json
+import os
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+from services.feature_encoder import CategoricalEncoder
+from services.model_params import ALIGNMENT, pack_arrays, unpack_arrays
+
+logger = logging.getLogger(__name__)
+
+
+class StyleScorer:
+    """
+    Cluster posteriors for encoded records under one fitted profile
+
+    Projection: z = x @ projection + offset, where projection already
+    contains 1/scale and the PCA components and offset the centered PCA
+    mean. In hybrid mode embeddings add e @ embedding_projection.
+    Scoring: log N(z | mu_k, Sigma_k) from the precision Cholesky factors.
+    """
+
+    # Array names of the artifact format, in file order
+    ARRAYS = ('projection', 'offset', 'log_norm', 'shifted_means', 'precisions_cholesky', 'embedding_projection')
+
+    def __init__(
+        self,
+        projection: np.ndarray,
+        offset: np.ndarray,
+        log_norm: np.ndarray,
+        shifted_means: np.ndarray,
+        precisions_cholesky: np.ndarray,
+        embedding_projection: Optional[np.ndarray] = None
+    ):
+        self.projection = projection
+        self.offset = offset
+        # Per component: log w_k + log det(P_k) - d/2 log(2 pi), and mu_k @ P_k
+        self.log_norm = log_norm
+        self.shifted_means = shifted_means
+        self.precisions_cholesky = precisions_cholesky
+        self.embedding_projection = embedding_projection
+
+    @property
+    def n_features(self) -> int:
+        """One-hot columns the projection consumes"""
+        return self.projection.shape[0]
+
+    @property
+    def embedding_dim(self) -> Optional[int]:
+        return None if self.embedding_projection is None else self.embedding_projection.shape[0]
+
+    @classmethod
+    def from_models(cls, models: Dict[str, Any]) -> 'StyleScorer':
+        """Build from a fitted models artifact (gmm, scaler, pca, feature_space)"""
+        gmm, scaler, pca = models['gmm'], models['scaler'], models['pca']
+        if gmm.covariance_type != 'full':
+            raise ValueError(f"Unsupported covariance type: {gmm.covariance_type}")
+
+        n_features = scaler.n_features_in_
+        components = pca.components_
+
+        embedding_projection = None
+        feature_space = models.get('feature_space')
+        if feature_space is not None:
+            embedding_projection = components[:, n_features:].T * feature_space['embedding_scale']
+
+        precisions_cholesky = gmm.precisions_cholesky_
+        log_det = np.log(np.diagonal(precisions_cholesky, axis1=1, axis2=2)).sum(axis=1)
+
+        return cls(
+            projection=components[:, :n_features].T / scaler.scale_[:, np.newaxis],
+            offset=-(pca.mean_ @ components.T),
+            log_norm=np.log(gmm.weights_) + log_det - 0.5 * gmm.means_.shape[1] * np.log(2 * np.pi),
+            shifted_means=np.einsum('kp,kpq->kq', gmm.means_, precisions_cholesky),
+            precisions_cholesky=precisions_cholesky,
+            embedding_projection=embedding_projection
+        )
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """Scorer parameters as named float32 arrays"""
+        return {
+            name: np.ascontiguousarray(getattr(self, name), dtype=np.float32)
+            for name in self.ARRAYS
+            if getattr(self, name) is not None
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> 'StyleScorer':
+        """Wrap arrays from to_arrays without copying them"""
+        return cls(**{name: arrays.get(name) for name in cls.ARRAYS})
+
+    def project(self, features, embeddings: Optional[np.ndarray] = None) -> np.ndarray:
+        """GMM input coordinates of encoded records; extra one-hot columns are ignored"""
+        projected = features[:, :self.n_features] @ self.projection + self.offset
+        if self.embedding_projection is not None:
+            projected += embeddings @ self.embedding_projection
+        return np.asarray(projected)
+
+    def predict_proba(self, projected: np.ndarray) -> np.ndarray:
+        """(n_records, n_clusters) posterior probabilities"""
+        shifted = np.einsum('np,kpq->nkq', projected, self.precisions_cholesky) - self.shifted_means
+        log_prob = self.log_norm - 0.5 * np.einsum('nkq,nkq->nk', shifted, shifted)
+        probabilities = np.exp(log_prob - log_prob.max(axis=1, keepdims=True))
+        return probabilities / probabilities.sum(axis=1, keepdims=True)
+
+
+# File layout: magic, little-endian uint64 header length, JSON header, zero
+# padding to ALIGNMENT, then the pack_arrays buffer
+ARTIFACT_MAGIC = b'STYLSCR1'
+_PREAMBLE_SIZE = len(ARTIFACT_MAGIC) + 8
+
+
+def save_artifact(
+    path: str,
+    scorer: StyleScorer,
+    encoder: CategoricalEncoder,
+    metadata: Optional[Dict[str, Any]] = None
+):
+    """
+    Write a scorer and its vocabulary as one flat file
+
+    Written to a temporary file and renamed, so processes that have the
+    previous version memory-mapped keep reading it undisturbed.
+    """
+    layout, buffer = pack_arrays(scorer.to_arrays())
+    header = json.dumps({
+        'version': 1,
+        'layout': layout,
+        'vocabulary': encoder.to_dict(),
+        'metadata': metadata or {}
+    }, separators=(',', ':')).encode('utf-8')
+
+    padding = -(_PREAMBLE_SIZE + len(header)) % ALIGNMENT
+    tmp_path = f"{path}.tmp{os.getpid()}"
+
+    with open(tmp_path, 'wb') as f:
+        f.write(ARTIFACT_MAGIC)
+        f.write(len(header).to_bytes(8, 'little'))
+        f.write(header)
+        f.write(b'\0' * padding)
+        f.write(buffer)
+
+    os.replace(tmp_path, path)
+
+
+def load_artifact(path: str, mmap: bool = True) -> Tuple[StyleScorer, CategoricalEncoder, Dict[str, Any]]:
+    """
+    Load a scorer artifact
+
+    With mmap the arrays are read-only views of a shared memory map, so
+    worker processes scoring the same profile share one copy.
+
+    Returns:
+        (scorer, encoder, metadata)
+
+    Raises:
+        ValueError: The file is not a scorer artifact
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(ARTIFACT_MAGIC)) != ARTIFACT_MAGIC:
+            raise ValueError(f"{path} is not a style scorer artifact")
+        header_length = int.from_bytes(f.read(8), 'little')
+        header = json.loads(f.read(header_length))
+
+        data_offset = _PREAMBLE_SIZE + header_length
+        data_offset += -data_offset % ALIGNMENT
+
+        if mmap:
+            buffer = np.memmap(path, dtype=np.uint8, mode='r', offset=data_offset)
+        else:
+            f.seek(data_offset)
+            buffer = f.read()
+
+    scorer = StyleScorer.from_arrays(unpack_arrays(header['layout'], buffer))
+    return scorer, CategoricalEncoder.from_dict(header['vocabulary']), header['metadata']
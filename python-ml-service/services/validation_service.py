@@ -0,0 +1,393 @@
+"""
+Stage 8: Validation of generated images against the target VLT spec
+All images of a batch are encoded into one value matrix, attribute
+agreement is scored with array lookups, and an Isolation Forest flags
+images that don't fit the batch. Fitted forests are cached by target spec
+together with the value vocabulary they were fitted on, so later batches
+for the same spec skip the fit.
+"""
+import os
+import json
+import hashlib
+import numpy as np
+import logging
+from scipy import sparse
+from typing import List, Dict, Any, Optional, Tuple
+
+from services.lru_cache import LRUCache
+from services.memoization import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# (field, weight, paths into a VLT record); the first path that has a value wins.
+# Paths cover both the ML service record shape and the Node VLT shape.
+VALIDATION_FIELDS = [
+    ('garmentType', 2.0, [('garment_type',), ('garmentType',)]),
+    ('silhouette', 1.5, [('attributes', 'silhouette'), ('silhouette',)]),
+    ('fabrication', 1.5, [('attributes', 'fabrication'), ('fabric', 'type'), ('fabrication',)]),
+    ('neckline', 1.0, [('attributes', 'neckline'), ('neckline',)]),
+    ('sleeveLength', 1.0, [('attributes', 'sleeveLength'), ('sleeves',)]),
+    ('length', 1.0, [('attributes', 'length'), ('length',)]),
+    ('primaryColor', 1.5, [('colors', 'primary'), ('color',)]),
+    ('aesthetic', 1.0, [('style', 'aesthetic')]),
+    ('formality', 1.0, [('style', 'formality')]),
+]
+
+# Same gates as the Node validation service
+THRESHOLDS = {
+    'reject': 0.60,
+    'flag': 0.80,
+    'excellent': 0.90
+}
+
+# Attribute similarity at or above this counts as a match
+MATCH_THRESHOLD = 0.7
+
+# Colors in one family score at least COLOR_FAMILY_SCORE against each other
+COLOR_FAMILIES = {
+    'red': ['red', 'burgundy', 'crimson', 'scarlet', 'maroon', 'wine', 'cherry'],
+    'blue': ['blue', 'navy', 'azure', 'cobalt', 'sapphire', 'indigo', 'teal'],
+    'green': ['green', 'emerald', 'olive', 'forest', 'jade', 'sage', 'khaki'],
+    'neutral': ['beige', 'cream', 'ivory', 'ecru', 'camel', 'tan', 'taupe', 'sand'],
+    'grey': ['grey', 'gray', 'charcoal', 'slate', 'silver'],
+    'pink': ['pink', 'blush', 'rose', 'fuchsia', 'magenta'],
+    'yellow': ['yellow', 'mustard', 'gold', 'lemon', 'ochre'],
+    'brown': ['brown', 'chocolate', 'rust', 'cognac', 'mocha'],
+}
+COLOR_FAMILY_SCORE = 0.8
+
+# Isolation Forest needs enough samples to isolate anything meaningfully
+MIN_OUTLIER_SAMPLES = 8
+
+_encoder = json.JSONEncoder(sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+
+
+class ValidationService:
+    """
+    Batched validation of generated images
+
+    Each image's VLT values are compared with the target's: exact matches
+    score 1, other values their edit-distance similarity (color families
+    at least 0.8). The weighted mean over the fields the target specifies
+    decides the quality gate. Outlier scores come from an Isolation Forest
+    over agreement scores and one-hot attribute values.
+    """
+
+    def __init__(self, n_estimators: int = 100, random_state: int = 42):
+        self.n_estimators = n_estimators
+        self.random_state = random_state
+
+        # target spec key -> (fitted IsolationForest, value vocabulary it was fitted on)
+        self._models = LRUCache(max_entries=int(os.getenv('VALIDATION_MODEL_CACHE_ENTRIES', 128)))
+        self._inflight = SingleFlight()
+
+        logger.info("ValidationService initialized")
+
+    def validate_images(self, images: List[Dict[str, Any]], target_vlt: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Validate a batch of generated images against a target VLT spec
+
+        Args:
+            images: Generated images, each with an id ('id', 'image_id' or
+                'assetId') and its VLT record, either nested ('vlt_spec',
+                'vltSpecs', 'generatedSpec', 'vlt') or as the image itself
+            target_vlt: Target VLT record, or a VLT result with 'records'
+
+        Returns:
+            Dict with 'validations' (one per image, in order), 'summary'
+            and 'outliers' (flagged images, most anomalous first)
+        """
+        target_values = [value[0] if value else None for value in self._read_values([self._record(target_vlt)])]
+        if all(value is None for value in target_values):
+            raise ValueError("target_vlt specifies none of the validated attributes")
+
+        if not images:
+            summary = self._summary(np.zeros(0), np.zeros((0, 0)), [], [], np.zeros(0, dtype=bool), False)
+            return {'validations': [], 'summary': summary, 'outliers': []}
+
+        columns = self._read_values([self._record(image) for image in images])
+        codes, vocabulary = self._factorize(columns)
+        scores = self._agreement(codes, vocabulary, target_values)
+
+        specified = np.array([value is not None for value in target_values])
+        weights = np.array([weight for _, weight, _ in VALIDATION_FIELDS]) * specified
+        overall = scores @ weights / weights.sum()
+        statuses = self._gate(overall)
+
+        anomaly, is_outlier, cached = self._detect_outliers(scores[:, specified], codes, vocabulary, target_values)
+
+        fields = [field for (field, _, _), used in zip(VALIDATION_FIELDS, specified) if used]
+        scores = scores[:, specified]
+        validations = []
+        for i, image in enumerate(images):
+            attribute_scores = {field: round(float(score), 3) for field, score in zip(fields, scores[i])}
+            status, action = statuses[i]
+            validations.append({
+                'image_id': self._image_id(image, i),
+                'status': status,
+                'action': action,
+                'overall_score': round(float(overall[i]), 3),
+                'attribute_scores': attribute_scores,
+                'mismatches': [field for field, score in attribute_scores.items() if score < MATCH_THRESHOLD],
+                'anomaly_score': None if anomaly is None else round(float(anomaly[i]), 4),
+                'is_outlier': bool(is_outlier[i])
+            })
+
+        outliers = sorted(
+            (
+                {'image_id': validation['image_id'], 'index': i, 'anomaly_score': validation['anomaly_score']}
+                for i, validation in enumerate(validations) if validation['is_outlier']
+            ),
+            key=lambda outlier: outlier['anomaly_score'],
+            reverse=True
+        )
+
+        return {
+            'validations': validations,
+            'summary': self._summary(overall, scores, fields, [status for status, _ in statuses], is_outlier, cached),
+            'outliers': outliers
+        }
+
+    @staticmethod
+    def _record(spec: Dict[str, Any]) -> Dict[str, Any]:
+        """The VLT record inside an image or target payload"""
+        for key in ('vlt_spec', 'vltSpecs', 'generatedSpec', 'vlt'):
+            if isinstance(spec.get(key), dict):
+                spec = spec[key]
+                break
+        records = spec.get('records')
+        if isinstance(records, list) and records:
+            spec = records[0]
+        return spec
+
+    @staticmethod
+    def _image_id(image: Dict[str, Any], index: int) -> Any:
+        for key in ('id', 'image_id', 'imageId', 'assetId'):
+            if image.get(key) is not None:
+                return image[key]
+        return index
+
+    @staticmethod
+    def _read_values(records: List[Dict[str, Any]]) -> List[List[Optional[str]]]:
+        """Per-field columns of normalized (lowercased) values, None where missing"""
+        columns = []
+        for _, _, paths in VALIDATION_FIELDS:
+            column = []
+            for record in records:
+                value = None
+                for path in paths:
+                    value = record
+                    for key in path:
+                        value = value.get(key) if isinstance(value, dict) else None
+                    if value is not None:
+                        break
+                if value is not None:
+                    value = str(value).strip().lower() or None
+                column.append(value)
+            columns.append(column)
+        return columns
+
+    @staticmethod
+    def _factorize(columns: List[List[Optional[str]]]) -> Tuple[np.ndarray, List[List[str]]]:
+        """
+        (n_images, n_fields) int32 codes into per-field sorted vocabularies
+
+        Missing values get code -1.
+        """
+        n_images = len(columns[0])
+        codes = np.full((n_images, len(columns)), -1, dtype=np.int32)
+        vocabulary = []
+
+        for f, column in enumerate(columns):
+            present = np.array([value is not None for value in column])
+            values = np.array([value for value in column if value is not None], dtype=str)
+            if len(values):
+                uniques, inverse = np.unique(values, return_inverse=True)
+                codes[present, f] = inverse
+                vocabulary.append(uniques.tolist())
+            else:
+                vocabulary.append([])
+
+        return codes, vocabulary
+
+    def _agreement(self, codes: np.ndarray, vocabulary: List[List[str]], target_values: List[Optional[str]]) -> np.ndarray:
+        """
+        (n_images, n_fields) similarity to the target
+
+        Each distinct value is compared with the target once; images pick
+        their score from that table. Missing values score 0.
+        """
+        scores = np.zeros(codes.shape)
+        for f, (field, _, _) in enumerate(VALIDATION_FIELDS):
+            target = target_values[f]
+            if target is None or not vocabulary[f]:
+                continue
+            # Last entry scores missing values (code -1)
+            table = np.array([self._similarity(field, value, target) for value in vocabulary[f]] + [0.0])
+            scores[:, f] = table[codes[:, f]]
+        return scores
+
+    @staticmethod
+    def _similarity(field: str, value: str, target: str) -> float:
+        if value == target:
+            return 1.0
+        score = _string_similarity(value, target)
+        if field == 'primaryColor':
+            for family in COLOR_FAMILIES.values():
+                if any(color in value for color in family) and any(color in target for color in family):
+                    return max(score, COLOR_FAMILY_SCORE)
+        return score
+
+    @staticmethod
+    def _gate(overall: np.ndarray) -> List[Tuple[str, str]]:
+        """(status, action) per image from the overall score"""
+        statuses = np.select(
+            [overall < THRESHOLDS['reject'], overall < THRESHOLDS['flag'], overall >= THRESHOLDS['excellent']],
+            ['rejected', 'flagged', 'excellent'],
+            default='approved'
+        )
+        actions = {'rejected': 'reject', 'flagged': 'flag_for_review', 'excellent': 'approve', 'approved': 'approve'}
+        return [(str(status), actions[str(status)]) for status in statuses]
+
+    def _detect_outliers(
+        self,
+        scores: np.ndarray,
+        codes: np.ndarray,
+        vocabulary: List[List[str]],
+        target_values: List[Optional[str]]
+    ) -> Tuple[Optional[np.ndarray], np.ndarray, bool]:
+        """
+        Isolation Forest anomaly scores for the batch
+
+        Features are the agreement scores plus one-hot values. The forest
+        is looked up by target spec and only fitted on a miss, on the
+        values of that batch; later batches are one-hot encoded in the
+        fitted vocabulary, with values outside it in a per-field unknown
+        column. Batches too small to fit on are scored only when a cached
+        forest exists.
+
+        Returns:
+            (anomaly scores in (0, 1] or None, outlier mask, whether the forest was cached)
+        """
+        n_images = len(codes)
+        key = self._model_key(target_values)
+
+        entry = self._models.get(key)
+        cached = entry is not None
+        if entry is None:
+            if n_images < MIN_OUTLIER_SAMPLES:
+                return None, np.zeros(n_images, dtype=bool), False
+            entry, _ = self._inflight.do(key, lambda: self._fit_forest(key, scores, codes, vocabulary))
+
+        model, model_vocabulary = entry
+        features = self._outlier_features(scores, codes, vocabulary, model_vocabulary)
+        # score_samples is the negated anomaly score of the original paper; predict() would
+        # score again, so apply its threshold (offset_, 0.5 with contamination='auto') here
+        anomaly = -model.score_samples(features)
+        return anomaly, anomaly > -model.offset_, cached
+
+    @staticmethod
+    def _outlier_features(
+        scores: np.ndarray,
+        codes: np.ndarray,
+        vocabulary: List[List[str]],
+        model_vocabulary: List[List[str]]
+    ) -> sparse.csr_matrix:
+        """
+        [agreement scores | one-hot values] in model vocabulary column order
+
+        Each field has its model vocabulary's columns plus a last column for
+        values the model was not fitted on.
+        """
+        offsets = np.cumsum([0] + [len(values) + 1 for values in model_vocabulary])
+        columns = np.zeros(codes.shape, dtype=np.int64)
+        for f, (values, model_values) in enumerate(zip(vocabulary, model_vocabulary)):
+            if not values:
+                continue
+            position = {value: c for c, value in enumerate(model_values)}
+            # Batch code -> model column, unknown values to the field's last column
+            lookup = np.array([position.get(value, len(model_values)) for value in values])
+            present = codes[:, f] >= 0
+            columns[present, f] = offsets[f] + lookup[codes[present, f]]
+
+        rows, cols = np.nonzero(codes >= 0)
+        one_hot = sparse.csr_matrix(
+            (np.ones(len(rows)), (rows, columns[rows, cols])),
+            shape=(len(codes), offsets[-1])
+        )
+        return sparse.hstack([sparse.csr_matrix(scores), one_hot], format='csr')
+
+    def _fit_forest(
+        self,
+        key: str,
+        scores: np.ndarray,
+        codes: np.ndarray,
+        vocabulary: List[List[str]]
+    ) -> Tuple[Any, List[List[str]]]:
+        entry = self._models.get(key)
+        if entry is not None:
+            return entry
+
+        from sklearn.ensemble import IsolationForest
+
+        features = self._outlier_features(scores, codes, vocabulary, vocabulary)
+        model = IsolationForest(n_estimators=self.n_estimators, random_state=self.random_state, n_jobs=1)
+        model.fit(features)
+        entry = (model, vocabulary)
+        self._models.put(key, entry)
+        logger.info(f"Fitted outlier model on {features.shape[0]} images x {features.shape[1]} features")
+        return entry
+
+    @staticmethod
+    def _model_key(target_values: List[Optional[str]]) -> str:
+        """Hash of the target spec; the forest's vocabulary is stored with it"""
+        fields = [field for field, _, _ in VALIDATION_FIELDS]
+        payload = {'target': dict(zip(fields, target_values))}
+        return hashlib.sha256(_encoder.encode(payload).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _summary(
+        overall: np.ndarray,
+        scores: np.ndarray,
+        fields: List[str],
+        statuses: List[str],
+        is_outlier: np.ndarray,
+        cached: bool
+    ) -> Dict[str, Any]:
+        """Gate counts, mean scores and outlier count for the batch"""
+        counts = {status: statuses.count(status) for status in ('excellent', 'approved', 'flagged', 'rejected')}
+        return {
+            'total': len(statuses),
+            **counts,
+            'pass_rate': round((counts['excellent'] + counts['approved']) / len(statuses), 3) if statuses else 0.0,
+            'mean_score': round(float(overall.mean()), 3) if len(overall) else 0.0,
+            'attribute_agreement': {
+                field: round(float(scores[:, f].mean()), 3) for f, field in enumerate(fields)
+            } if len(scores) else {},
+            'outliers': int(is_outlier.sum()),
+            'outlier_model_cached': cached,
+            'thresholds': dict(THRESHOLDS)
+        }
+
+    def is_ready(self) -> bool:
+        """Check if service is ready"""
+        return True
+
+
+def _string_similarity(a: str, b: str) -> float:
+    """1 - Levenshtein distance / longer length"""
+    if len(a) < len(b):
+        a, b = b, a
+    if not a:
+        return 1.0
+
+    previous = np.arange(len(b) + 1)
+    for i, char in enumerate(a, 1):
+        current = np.empty_like(previous)
+        current[0] = i
+        substitution = previous[:-1] + (np.frombuffer(b.encode('utf-32-le'), dtype=np.uint32) != ord(char))
+        current[1:] = np.minimum(substitution, previous[1:] + 1)
+        # Insertions depend on the cell to the left, so they are resolved with a running minimum
+        current = np.minimum.accumulate(current - np.arange(len(current))) + np.arange(len(current))
+        previous = current
+    return (len(a) - int(previous[-1])) / len(a)